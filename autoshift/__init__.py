@@ -1,6 +1,30 @@
 """AutoSHiFt: Automatically redeem Gearbox SHiFT Codes"""
 
-from .auto import run as run_cli
-from .tui import run_tui
+from typing import TYPE_CHECKING
 
-__all__ = ["run_cli", "run_tui"]
\ No newline at end of file
+if TYPE_CHECKING:
+    from .auto import run as run_cli
+    from .tui import run_tui
+
+__all__ = ["run_cli", "run_tui"]
+
+
+# submodules the entry points are resolved through (`autoshift:auto.run`)
+_SUBMODULES = {"auto", "tui"}
+
+
+def __getattr__(name: str):
+    # the CLI shouldn't pay for importing textual (and vice versa)
+    if name in _SUBMODULES:
+        import importlib
+
+        return importlib.import_module(f".{name}", __name__)
+    if name == "run_cli":
+        from .auto import run
+
+        return run
+    if name == "run_tui":
+        from .tui import run_tui
+
+        return run_tui
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
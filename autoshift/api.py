@@ -0,0 +1,192 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Local HTTP control API of the daemon
+
+Runs on the daemon's event loop, so pushed codes are redeemed from the same
+queue with the already logged-in session. There is no authentication: only
+bind it to addresses you trust (default: localhost).
+
+    POST /codes       [{"code": "...", "platform": "steam", "game": "bl4"}, ...]
+                      queue codes for redemption ("platform" may be "universal")
+    POST /ingest      query `SHIFT_SOURCE` for new keys right away
+    GET  /status      queue and quota state
+    GET  /metrics     Prometheus metrics (if enabled)
+    GET  /keys/CODE   state of all keys with the given code
+"""
+
+import asyncio
+import json
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Annotated, Any
+from urllib.parse import unquote, urlsplit
+
+from pydantic import BaseModel, StringConstraints, TypeAdapter, ValidationError
+
+from autoshift import metrics, storage
+from autoshift.common import _L, Game, Platform, settings
+from autoshift.quota import get_tracker
+
+if TYPE_CHECKING:
+    from autoshift.daemon import Daemon
+
+# largest accepted request body (bytes)
+MAX_BODY = 1024 * 1024
+
+Response = tuple[HTTPStatus, Any]
+
+
+class CodeIn(BaseModel):
+    # stored in upper case, like codes read by the CLI
+    code: Annotated[str, StringConstraints(strip_whitespace=True, to_upper=True)]
+    # a `Platform` or "universal"
+    platform: str
+    game: Game = Game.UNKNOWN
+    reward: str = ""
+
+
+class ControlAPI:
+    def __init__(self, daemon: "Daemon"):
+        self.daemon = daemon
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle, host, port)
+        _L.info(f"Control API listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, body = await self.dispatch(reader)
+        except Exception as e:
+            _L.error(f"Control API request failed: {e}")
+            status, body = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+        if isinstance(body, str):
+            content_type, payload = metrics.CONTENT_TYPE, body.encode()
+        else:
+            content_type = "application/json"
+            payload = json.dumps(body, default=str).encode()
+        writer.write(
+            (
+                f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode()
+            + payload
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def dispatch(self, reader: asyncio.StreamReader) -> Response:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            return HTTPStatus.BAD_REQUEST, {"error": "malformed request"}
+        method, target, _ = request_line
+
+        headers: dict[str, str] = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "body too large"}
+        body = await reader.readexactly(length)
+
+        path = urlsplit(target).path.rstrip("/")
+        match method, path.split("/")[1:]:
+            case "GET", ["status"]:
+                return await self.status()
+            case "GET", ["metrics"]:
+                if not metrics.enabled():
+                    return HTTPStatus.NOT_FOUND, {"error": "metrics are disabled"}
+                return HTTPStatus.OK, metrics.render()
+            case "GET", ["keys", code]:
+                return await self.keys(unquote(code).strip().upper())
+            case "POST", ["codes"]:
+                return await self.push_codes(body)
+            case "POST", ["ingest"]:
+                return HTTPStatus.OK, {"queued": await self.daemon.ingest()}
+            case (_, ["status" | "metrics" | "codes" | "ingest"]) | (_, ["keys", _]):
+                return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"{method} not allowed"}
+        return HTTPStatus.NOT_FOUND, {"error": f"no such endpoint: {path}"}
+
+    async def status(self) -> Response:
+        return HTTPStatus.OK, {
+            "account": settings.ACCOUNT,
+            "worker": storage.WORKER_ID,
+            "queued": len(self.daemon.queued),
+            "quota_blocked_until": get_tracker().blocked_until(),
+        }
+
+    async def keys(self, code: str) -> Response:
+        def query():
+            from autoshift.models import Key
+
+            return [
+                {
+                    "id": key.id,
+                    "code": key.code,
+                    "game": key.game,
+                    "platform": key.platform,
+                    "reward": key.reward,
+                    "expired": key.expired,
+                    "redeemed": storage.is_redeemed(key),
+                    "queued": key.id in self.daemon.queued,
+                }
+                for key in Key.select().where(Key.code == code)
+            ]
+
+        if not (keys := await self.daemon.call(query)):
+            return HTTPStatus.NOT_FOUND, {"error": f"unknown code: {code}"}
+        return HTTPStatus.OK, keys
+
+    async def push_codes(self, body: bytes) -> Response:
+        try:
+            codes = TypeAdapter(list[CodeIn]).validate_json(body)
+        except ValidationError as e:
+            return HTTPStatus.UNPROCESSABLE_ENTITY, json.loads(e.json(include_url=False))
+
+        rows: list[dict[str, Any]] = []
+        for code in codes:
+            if code.platform == "universal":
+                platforms = list(Platform)
+            else:
+                try:
+                    platforms = [Platform(code.platform)]
+                except ValueError:
+                    return HTTPStatus.UNPROCESSABLE_ENTITY, {
+                        "error": f"unknown platform: {code.platform}"
+                    }
+            rows.extend(
+                dict(code=code.code, game=code.game, platform=p, reward=code.reward)
+                for p in platforms
+            )
+
+        num_new = await self.daemon.call(storage.insert_keys, rows)
+        keys = await self.daemon.call(storage.find_keys, rows)
+        num_queued = await self.daemon.enqueue(keys)
+        _L.info(f"Received {len(codes)} codes via the control API")
+        return HTTPStatus.ACCEPTED, {"new": num_new, "queued": num_queued}
@@ -25,8 +25,12 @@ import logging
 import os
 import re
 import sys
-from collections.abc import Callable, Sequence
+import threading
+from collections import Counter, defaultdict
+from collections.abc import Callable, Collection, Iterable, Sequence
+from datetime import datetime
 from enum import Enum
+from pathlib import Path
 from typing import (
     TYPE_CHECKING,
     Annotated,
@@ -34,15 +38,14 @@ from typing import (
 )
 
 import click
-import httpx
 import typer
-from pydantic import SecretStr
 from typer import Typer
 
-from autoshift import storage
+from autoshift import jobs, metrics, storage
 from autoshift.common import _L, Game, Platform, settings
 from autoshift.migrations import run_migrations
 from autoshift.models import Key
+from autoshift.quota import get_tracker
 from autoshift.shift import ShiftClient, Status
 
 LICENSE_TEXT = """\
@@ -57,17 +60,86 @@ under certain conditions; see LICENSE for details.
 
 app = Typer(help="AutoSHiFT: Automatically redeem Gearbox SHiFT Codes")
 
-client: ShiftClient = ShiftClient()
+# created on first use, so commands that don't talk to SHiFT start fast
+client: ShiftClient | None = None
+# the session may be shared between threads (e.g. the jobs of the TUI),
+# only one of them uses it at a time
+session_lock = threading.RLock()
+
+# commands that don't use the logged-in session of this process
+NO_LOGIN_COMMANDS = {
+    # only talk to the key source or the database
+    "query",
+    "extract",
+    "maintenance",
+    "plan",
+    # every account logs in inside its own worker process
+    "supervise",
+    "traces",
+    # runs against a fake SHiFT website
+    "profile",
+}
+
+# keys redeemed in a row before pausing to prevent a 'too many requests'-block
+BURST = 15
+BURST_PAUSE = 60
 
 r_golden_keys = re.compile(r"(\d+) (?:gold|skelet).*key", re.IGNORECASE)
+r_code = re.compile(r"\b[A-Z0-9]{5}(?:-[A-Z0-9]{5}){4}\b")
+r_word = re.compile(r"[a-z0-9]+")
+
+
+def get_client() -> ShiftClient:
+    """The SHiFT session of this process"""
+    global client
+    if client is None:
+        client = ShiftClient()
+    return client
+
+
+def login():
+    """Log in the session of this process. Does nothing if already logged in
+
+    Logging in is deferred until the first key gets redeemed, so cycles without
+    anything to redeem don't talk to SHiFT at all"""
+    with session_lock:
+        client = get_client()
+        if client.logged_in:
+            return
+        client.login(
+            settings.USER, settings.PASS.get_secret_value() if settings.PASS else None
+        )
+        # finish what a crashed run left behind before redeeming anything
+        client.verify_submitted()
+
+
+def verify_submitted():
+    """Resolve the submissions whose outcome is unknown
+
+    Unlike `login`, this also checks them if the session is logged in already:
+    a long-lived process may have failed to store an outcome itself, and those
+    keys aren't claimed again until they are resolved"""
+    if not storage.get_unresolved():
+        return
+    with session_lock:
+        client = get_client()
+        if not client.logged_in:
+            # verifies them right after logging in
+            login()
+            return
+        client.verify_submitted()
 
 
 def redeem(key: Key):
     """Redeem key and set as redeemed if successfull"""
 
     _L.info(f"Trying to redeem {key.reward} ({key.code})")
-    status = client.redeem(key)
+    with session_lock:
+        login()
+        status = get_client().redeem(key)
     _L.debug(f"Status: {status}")
+    metrics.redemptions.inc(status=status.name, game=key.game, platform=key.platform)
+    get_tracker().record(status)
 
     # notify user
     try:
@@ -79,6 +151,17 @@ def redeem(key: Key):
     return status
 
 
+def stored_key(code: str, platform: Platform | str) -> Key:
+    """The stored key of `code` for `platform`, stored for an unknown game if new
+
+    Redemptions are journaled per key, so only stored keys can be redeemed"""
+    platform = Platform(platform)
+    key = Key.get_or_none((Key.code == code) & (Key.platform == platform))
+    if key is None:
+        key = Key.create(code=code, platform=platform, game=Game.UNKNOWN)
+    return key
+
+
 def clean_key_data(key_data: Sequence[dict]):
     for key in key_data:
         data = {
@@ -105,14 +188,26 @@ def clean_key_data(key_data: Sequence[dict]):
             yield data
 
 
-def query_keys(game_map: dict[Game, set[Platform]]) -> list[Key]:
-    """Query new keys for given games and platforms
+def ingest_keys():
+    """Insert new keys from `SHIFT_SOURCE` (and the collectors if `SHIFT_COLLECT`
+    is set) into the shared key catalog.
 
-    Returns dict of dicts of lists with [game][platform] as keys"""
+    Keys are stored independently of any account, so one ingestion run
+    feeds every account using the same database."""
+    if settings.COLLECT:
+        from autoshift import collector
 
-    # parse all keys
-    if settings.SHIFT_SOURCE:
+        num_new_keys = collector.ingest(settings._GAMES_PLATFORM_MAP)
+        metrics.ingested_keys.inc(num_new_keys)
+        _L.info(f"{num_new_keys or 'no'} new Keys from collectors")
+
+    if not settings.SHIFT_SOURCE:
+        return
+
+    with metrics.ingest_seconds.time():
         if settings.SHIFT_SOURCE.startswith("http"):
+            import httpx
+
             key_data = httpx.get(settings.SHIFT_SOURCE).json()
         else:
             with open(settings.SHIFT_SOURCE) as f:
@@ -120,10 +215,22 @@ def query_keys(game_map: dict[Game, set[Platform]]) -> list[Key]:
 
         keys = clean_key_data(key_data[0]["codes"])
 
-        num_new_keys = Key.insert_many(keys).on_conflict_ignore().execute()
-        _L.info(f"{num_new_keys or 'no'} new Keys")
+        num_new_keys = storage.insert_keys(keys)
+    metrics.ingested_keys.inc(num_new_keys)
+    _L.info(f"{num_new_keys or 'no'} new Keys")
+
+
+def query_keys(
+    game_map: dict[Game, set[Platform]], account: str | None = None
+) -> list[Key]:
+    """Query new keys for given games and platforms
+
+    Returns all keys the account hasn't redeemed yet"""
 
-    new_keys = storage.get_keys(game_map)
+    # parse all keys
+    ingest_keys()
+
+    new_keys = storage.get_keys(game_map, account)
 
     return new_keys
 
@@ -189,6 +296,15 @@ def callback(
             rich_help_panel="Global Options",
         ),
     ] = None,
+    account: Annotated[
+        str | None,
+        typer.Option(
+            "--account",
+            "-a",
+            help="Name of the SHiFT account to track redemptions for",
+            rich_help_panel="Global Options",
+        ),
+    ] = None,
     verbose: Annotated[
         bool,
         typer.Option(
@@ -210,8 +326,13 @@ def callback(
         settings.USER = user
 
     if password:
+        from pydantic import SecretStr
+
         settings.PASS = SecretStr(password)
 
+    if account:
+        settings.ACCOUNT = account
+
     if platforms:
         settings.PLATFORMS = platforms
 
@@ -236,6 +357,8 @@ def callback(
     if not hasattr(ctx, "__run_command"):
         return
 
+    ctx.call_on_close(metrics.write_textfile)
+
     # Check for first-time usage
     if not settings.COOKIE_FILE.exists():
         typer.echo(LICENSE_TEXT)
@@ -246,26 +369,120 @@ def callback(
         database.connect()
         run_migrations(database)
 
-    # try logging in first. Does nothing if already logged in
-    client.login(
-        settings.USER, settings.PASS.get_secret_value() if settings.PASS else None
+    if ctx.info_name in NO_LOGIN_COMMANDS:
+        return
+
+    # without a saved session, ask for the credentials right away instead of
+    # when the first key gets redeemed (which may be hours later)
+    if not get_client().cookies:
+        login()
+
+
+def read_codes(
+    lines: Iterable[str], platform: Platform | None
+) -> tuple[dict[tuple[str, Platform], Game | None], int]:
+    """Parse SHiFT codes, one or more per line
+
+    A line may name the platform(s) of its codes (e.g. `steam XXXXX-...`, or
+    `universal` for all of them), `platform` is used otherwise. It may also
+    name their game (e.g. `bl4`), like the lines printed by `extract`.
+    Returns the game (if any) of the unique (code, platform) pairs in order and
+    the number of duplicates"""
+    codes: dict[tuple[str, Platform], Game | None] = {}
+    duplicates = 0
+    for num, line in enumerate(lines, 1):
+        line = line.split("#", 1)[0]
+        if not (found := r_code.findall(line.upper())):
+            if line.strip():
+                _L.warning(f"No code in line {num}: {line.strip()}")
+            continue
+        platforms: list[Platform] = []
+        game = None
+        for word in r_word.findall(r_code.sub("", line.upper()).lower()):
+            if word == "universal":
+                platforms.extend(Platform)
+            elif word in Platform._value2member_map_:
+                platforms.append(Platform(word))
+            elif word in Game._value2member_map_ and word != Game.UNKNOWN:
+                game = Game(word)
+        if not platforms:
+            if not platform:
+                _L.warning(f"No platform for line {num}: {line.strip()}")
+                continue
+            platforms = [platform]
+        for code in found:
+            for p in platforms:
+                if (code, p) in codes:
+                    duplicates += 1
+                codes[(code, p)] = codes.get((code, p)) or game
+    return codes, duplicates
+
+
+def redeem_codes(lines: Iterable[str], platform: Platform | None):
+    """Redeem all codes in `lines` (see `read_codes`) and show a summary"""
+    codes, duplicates = read_codes(lines, platform)
+
+    # reuse stored keys (preferring the ones for the game of the line, then
+    # the ones with a known game), unknown codes are stored for the game of
+    # their line
+    def preference(key: Key) -> tuple[bool, bool]:
+        return key.game == codes[(key.code, key.platform)], key.game != Game.UNKNOWN
+
+    known: dict[tuple[str, Platform], Key] = {}
+    for key in sorted(storage.find_codes(codes), key=preference):
+        known[(key.code, key.platform)] = key
+    new_rows = [
+        dict(code=code, game=game or Game.UNKNOWN, platform=p)
+        for (code, p), game in codes.items()
+        if (code, p) not in known
+    ]
+    num_new = storage.insert_keys(new_rows)
+    keys = [*known.values(), *storage.find_keys(new_rows)]
+
+    stats: Counter[str] = Counter()
+    resume_at = redeem_all(stats, keys)
+
+    typer.echo(
+        f"Read {len(codes)} codes ({duplicates} duplicates), {num_new} of them new"
     )
+    if stats:
+        typer.echo(", ".join(f"{n} {status}" for status, n in stats.most_common()))
+    if skipped := len(codes) - stats.total():
+        typer.echo(
+            f"Skipped {skipped} (already redeemed, expired or claimed by another worker)"
+        )
+    if resume_at:
+        typer.echo(
+            f"Redemption quota exhausted until around {resume_at.astimezone():%H:%M}, "
+            "run again afterwards to redeem the rest"
+        )
 
 
 @app.command("redeem")
 def redeem_one(
-    platform: Annotated[Platform, typer.Argument()],
-    code: Annotated[str, typer.Argument()],
+    platform: Annotated[
+        Platform | None,
+        typer.Argument(help="Platform of the code (default for codes read --from)"),
+    ] = None,
+    code: Annotated[str | None, typer.Argument()] = None,
+    source: Annotated[
+        typer.FileText | None,
+        typer.Option(
+            "--from",
+            help="Redeem all codes of this file ('-' for stdin). "
+            "Lines may name the game and platform(s) of their codes",
+        ),
+    ] = None,
 ):
-    db_key = Key.get_or_none((Key.code == code) & (Key.platform == platform))
+    """Redeem a single code or all codes of a file."""
+    if source is not None:
+        redeem_codes(source, platform)
+        return
+    if not (platform and code):
+        raise typer.BadParameter("pass PLATFORM and CODE or --from FILE")
 
-    if not db_key:
-        db_key = Key.create(
-            code=code,
-            platform=platform,
-            game="UNKNOWN",
-        )
-    elif db_key.redeemed:
+    db_key = stored_key(code, platform)
+    if storage.is_redeemed(db_key):
         _L.info("You already redeemed that code.")
         return
     redeem(db_key)
@@ -298,19 +515,140 @@ def auto_redeem_codes(
         settings.LIMIT = limit
 
     # Execute main logic
-    main()
+    resume_at = main()
 
     # Handle scheduling
     if settings.SCHEDULE:
         hours, minutes = divmod(settings.SCHEDULE, 60)
-        _L.info(f"Scheduling to run every {hours:02}:{minutes:02} hours")
-        from apscheduler.schedulers.blocking import BlockingScheduler
+        _L.info(
+            f"Scheduling to run {hours:02}:{minutes:02} hours after each run finished"
+        )
+        from datetime import timedelta
+
+        from autoshift.scheduling import create_scheduler, now, schedule_after
 
-        scheduler = BlockingScheduler()
-        scheduler.add_job(
+        scheduler = create_scheduler()
+        schedule_after(
+            scheduler,
             main,
-            "interval",
-            minutes=settings.SCHEDULE,
+            timedelta(minutes=settings.SCHEDULE),
+            delay=resume_at and max(resume_at - now(), timedelta(0)),
+        )
+        if settings.MAINTENANCE:
+            from autoshift.maintenance import run_maintenance
+
+            schedule_after(
+                scheduler,
+                run_maintenance,
+                timedelta(hours=settings.MAINTENANCE),
+                delay=timedelta(0),
+            )
+        typer.echo(f"Press Ctrl+{'Break' if os.name == 'nt' else 'C'} to exit")
+
+        try:
+            scheduler.start()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+
+    _L.info("Goodbye.")
+
+
+@app.command("daemon")
+def daemon(
+    interval: Annotated[
+        int | None,
+        typer.Option(
+            help="Check for new keys every N minutes",
+        ),
+    ] = None,
+    limit: Annotated[
+        int | None,
+        typer.Option(
+            "--limit",
+            "-l",
+            min=1,
+            help="Maximum number of keys to queue at once",
+        ),
+    ] = None,
+    api_port: Annotated[
+        int | None,
+        typer.Option(
+            help="Serve the local HTTP control API on this port",
+        ),
+    ] = None,
+):
+    """Keep running as a service: query keys on a schedule and redeem them from a queue."""
+    from autoshift.daemon import run_daemon
+
+    if interval:
+        settings.SCHEDULE = interval
+
+    if limit:
+        settings.LIMIT = limit
+
+    if api_port:
+        settings.API_PORT = api_port
+
+    run_daemon()
+
+
+@app.command("supervise")
+def supervise(
+    profiles_file: Annotated[
+        Path,
+        typer.Argument(
+            exists=True,
+            dir_okay=False,
+            help="JSON file with a list of account profiles",
+        ),
+    ],
+    workers: Annotated[
+        int,
+        typer.Option(
+            "--workers",
+            "-w",
+            min=1,
+            help="Maximum number of accounts to redeem for in parallel",
+        ),
+    ] = os.cpu_count() or 1,
+    interval: Annotated[
+        int | None,
+        typer.Option(
+            help="Keep checking for keys every N minutes",
+        ),
+    ] = None,
+):
+    """Redeem keys for many accounts in parallel, one worker process per account."""
+    from functools import partial
+
+    from pydantic import ValidationError
+
+    from autoshift.supervisor import load_profiles
+    from autoshift.supervisor import supervise as run_supervisor
+
+    try:
+        profiles = load_profiles(profiles_file)
+    except ValidationError as e:
+        raise typer.BadParameter(str(e), param_hint="PROFILES_FILE") from None
+    if not profiles:
+        _L.warning(f"No profiles in {profiles_file}")
+        return
+
+    run = partial(run_supervisor, profiles, workers)
+    resume_at = run()
+
+    if interval:
+        from datetime import timedelta
+
+        from autoshift.scheduling import create_scheduler, now, schedule_after
+
+        scheduler = create_scheduler()
+        schedule_after(
+            scheduler,
+            run,
+            timedelta(minutes=interval),
+            delay=resume_at and max(resume_at - now(), timedelta(0)),
+            job_id="supervise",
         )
         typer.echo(f"Press Ctrl+{'Break' if os.name == 'nt' else 'C'} to exit")
 
@@ -322,30 +660,245 @@ def auto_redeem_codes(
     _L.info("Goodbye.")
 
 
+@app.command("traces")
+def traces(
+    top: Annotated[
+        int,
+        typer.Option(
+            "--top",
+            "-n",
+            min=1,
+            help="Number of phases and traces to show",
+        ),
+    ] = 10,
+):
+    """Summarize the slowest phases of traced redemptions (see SHIFT_TRACE)."""
+    from autoshift.tracing import summarize
+
+    summarize(top)
+
+
+@app.command("profile")
+def profile(
+    feed: Annotated[
+        Path | None,
+        typer.Option(
+            exists=True,
+            dir_okay=False,
+            help="Local feed file to ingest (default: a generated one)",
+        ),
+    ] = None,
+    num_keys: Annotated[
+        int,
+        typer.Option(
+            "--keys",
+            min=1,
+            help="Number of keys in the generated feed",
+        ),
+    ] = 100,
+    output: Annotated[
+        Path | None,
+        typer.Option(
+            "--output",
+            "-o",
+            file_okay=False,
+            help="Directory for the reports (default: DATA_DIR/profile)",
+        ),
+    ] = None,
+):
+    """Profile a full ingest and redemption cycle offline (cProfile + tracemalloc)."""
+    from autoshift.profiling import run_profile
+
+    typer.echo(run_profile(feed, num_keys, output or settings.DATA_DIR / "profile"))
+
+
+@app.command("plan")
+def plan(
+    ingest: Annotated[
+        bool, typer.Option(help="Query new keys first (like every cycle does)")
+    ] = True,
+    latency: Annotated[
+        float,
+        typer.Option(min=0, help="Estimated duration of one request (seconds)"),
+    ] = 0.5,
+):
+    """Predict requests and duration of the next redemption cycle without redeeming anything."""
+    import time
+
+    from autoshift.planning import plan_cycle, render
+
+    if ingest:
+        ingest_keys()
+
+    started = time.perf_counter()
+    ingest_requests = int(
+        bool(settings.SHIFT_SOURCE and settings.SHIFT_SOURCE.startswith("http"))
+    )
+    if settings.COLLECT:
+        from autoshift.collector import collectors
+
+        ingest_requests += len(
+            {
+                c.url
+                for game in settings._GAMES_PLATFORM_MAP
+                for c in collectors.get(game, ())
+            }
+        )
+    tracker = get_tracker()
+    cycle = plan_cycle(
+        storage.get_keys(settings._GAMES_PLATFORM_MAP),
+        tracker,
+        settings.LIMIT,
+        unresolved=len(storage.get_unresolved()),
+        ingest_requests=ingest_requests,
+        logged_in=settings.COOKIE_FILE.exists(),
+        latency=latency,
+    )
+    typer.echo(render(cycle, tracker, settings.LIMIT, latency))
+    typer.echo(f"\nPlanned in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
 @app.command("query")
 def query():
     query_keys(settings._GAMES_PLATFORM_MAP)
 
 
-def main():
-    from time import sleep
+@app.command("extract")
+def extract(
+    sources: Annotated[
+        list[Path], typer.Argument(help="Files to scan for codes ('-' for stdin)")
+    ],
+    ingest: Annotated[
+        bool,
+        typer.Option(help="Add the codes to the key catalog instead of printing them"),
+    ] = False,
+):
+    """Find SHiFT codes in arbitrary text (chat logs, HTML pages, dumps).
 
-    # query all keys
-    all_keys = query_keys(settings._GAMES_PLATFORM_MAP)
+    Prints one code per line with the game and platform mentioned before it,
+    which `redeem --from -` understands."""
+    from autoshift.extract import Extractor, rows
 
-    _L.info("Trying to redeem now.")
+    extractor = Extractor()
+    found = (
+        code
+        for source in sources
+        for code in extractor.scan(sys.stdin.buffer if str(source) == "-" else source)
+    )
+    if not ingest:
+        for code in found:
+            platforms = code.platforms or ()
+            platform = (
+                "universal" if len(platforms) == len(Platform) else ",".join(platforms)
+            )
+            typer.echo(f"{code.code}\t{code.game or ''}\t{platform}".rstrip())
+        return
 
-    for num, key in enumerate(all_keys):
-        if num and not (num % 15):
-            _L.info("Trying to prevent a 'too many requests'-block.")
-            sleep(60)
+    with metrics.ingest_seconds.time():
+        num_new_keys = storage.insert_keys(rows(found))
+    metrics.ingested_keys.inc(num_new_keys)
+    typer.echo(
+        f"Found {len(extractor.seen)} codes in {extractor.scanned / 1024**2:.1f} MiB, "
+        f"{num_new_keys} new keys"
+    )
 
-        status = redeem(key)
-        # don't spam if we reached the hourly limit
-        if status == Status.TRYLATER:
-            return
 
-    _L.info("No more keys left!")
+@app.command("maintenance")
+def maintenance(
+    days: Annotated[
+        int | None,
+        typer.Option(
+            help="Archive expired keys older than N days",
+        ),
+    ] = None,
+):
+    """Archive cold keys and optimize the database."""
+    from autoshift.maintenance import run_maintenance
+
+    run_maintenance(days)
+
+
+def main() -> datetime | None:
+    """Query new keys and redeem them.
+
+    Returns the estimated reset of the redemption quota if it got exhausted"""
+    # query all keys
+    ingest_keys()
+
+    try:
+        return redeem_all()
+    finally:
+        metrics.write_textfile()
+
+
+def redeem_all(
+    stats: Counter[str] | None = None, keys: Collection[Key] | None = None
+) -> datetime | None:
+    """Redeem all keys of `settings.ACCOUNT` for the configured games and platforms.
+
+    At most `settings.LIMIT` keys are attempted per call, the rest is left for
+    the next cycle. If `keys` are given, redeem all of them (whatever games and
+    platforms are configured). Counts the resulting status of every key in
+    `stats`. Returns the estimated reset of the redemption quota if it got
+    exhausted"""
+    game_map = settings._GAMES_PLATFORM_MAP
+    key_ids: list[int] | None = None
+    limit = settings.LIMIT
+    if keys is not None:
+        if not keys:
+            return None
+        game_map = defaultdict(set)
+        for key in keys:
+            game_map[key.game].add(key.platform)
+        key_ids = [key.id for key in keys]
+        limit = len(key_ids)
+
+    if resume_at := get_tracker().blocked_until():
+        _L.info(f"Redemption quota exhausted until around {resume_at.astimezone():%H:%M}")
+        return resume_at
+
+    _L.info("Trying to redeem now.")
+    # unresolved submissions have to be verified before claiming anything
+    verify_submitted()
+    if jobs.current():
+        jobs.begin(min(len(storage.get_keys(game_map)), limit) if keys is None else limit)
+
+    # keys are claimed in batches, so other processes using
+    # the same database don't try to redeem them as well
+    attempted: set[int] = set()
+    try:
+        while len(attempted) < limit and (
+            batch := storage.claim_keys(
+                game_map,
+                min(BURST, limit - len(attempted)),
+                exclude=attempted,
+                key_ids=key_ids,
+            )
+        ):
+            for key in batch:
+                jobs.check_cancelled()
+                if attempted and not (len(attempted) % BURST):
+                    _L.info("Trying to prevent a 'too many requests'-block.")
+                    metrics.sleep(BURST_PAUSE, reason="burst")
+
+                status = redeem(key)
+                attempted.add(key.id)
+                jobs.advance()
+                if stats is not None:
+                    stats[status.name] += 1
+                storage.release_claims([key])
+                storage.renew_claims()
+                # don't spam if we reached the hourly limit
+                if status == Status.TRYLATER:
+                    return get_tracker().blocked_until()
+    finally:
+        storage.release_claims()
+
+    if keys is None and len(attempted) >= limit:
+        _L.info(f"Reached the limit of {limit} keys, leaving the rest for the next run.")
+    else:
+        _L.info("No more keys left!")
+    return None
 
 
 click_app = cast(click.Group, typer.main.get_command(app))
@@ -383,7 +936,8 @@ for name, cmd in click_app.commands.items():
 
 def run():
     click_app()
-    client.__save_cookie()
+    if client:
+        client.__save_cookie()
 
 
 if __name__ == "__main__":
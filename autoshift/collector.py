@@ -1,42 +1,231 @@
-# from collections import defaultdict
-# from collections.abc import Callable
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Collect keys from web pages (besides the `SHIFT_SOURCE` feed)
 
-# import httpx
-# from bs4 import BeautifulSoup as BSoup
+Pages rarely change, so every page keeps a fingerprint in
+`DATA_DIR/collectors.json`: its ETag/Last-Modified for conditional requests
+and a hash of the region holding the codes. Unchanged pages are answered with
+`304 Not Modified` or skipped after hashing. Only changed ones get parsed,
+with lxml XPath in worker threads."""
 
-# from autoshift.common import Game, Platform
-# from autoshift.models import Key
-# import re
+import hashlib
+import json
+from collections import defaultdict
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
-# KEY = re.compile(r"((?:\w{5}-){4}\w{5})")
+from autoshift.common import _L, Game, Platform, settings
+from autoshift.extract import CODE, hints
 
-# type KeyCollector = Callable[[list[Game], list[Platform]], list[Key]]
+if TYPE_CHECKING:
+    import httpx
 
+# pages fetched and parsed at once
+WORKERS = 4
 
-# collectors: dict[Game, list[KeyCollector]] = defaultdict(list)
 
+@dataclass(frozen=True)
+class Fingerprint:
+    etag: str | None = None
+    last_modified: str | None = None
+    # sha256 of the region of the page holding the codes
+    digest: str | None = None
 
-# def register(games: list[Game]):
-#     def wrapper(f: KeyCollector):
-#         for game in games:
-#             collectors[game].append(f)
-#         return f
 
-#     return wrapper
+class Fingerprints:
+    """Fingerprints of all pages, persisted in `path`"""
 
+    def __init__(self, path: Path):
+        self.path = path
+        self.pages: dict[str, Fingerprint] = {}
+        self.load()
 
-# @register(games=[Game.bl4])
-# def collect_ign_bl4(_games: list[Game], _platforms: list[Platform]) -> list[Key]:
-#     url = "https://www.ign.com/wikis/borderlands-4/Borderlands_4_SHiFT_Codes"
-#     client = httpx.Client(follow_redirects=True)
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+            self.pages = {url: Fingerprint(**page) for url, page in data.items()}
+        except Exception:
+            _L.warning(
+                f"Could not read page fingerprints from {self.path}. Starting over"
+            )
 
-#     response = client.get(url)
-#     soup = BSoup(response.text, "lxml")
+    def save(self):
+        self.path.write_text(
+            json.dumps({url: asdict(page) for url, page in self.pages.items()})
+        )
 
-#     code_tags = soup.find_all("code", class_="copy-the-code-target")
 
-#     for tag in code_tags:
-#         td = tag.find_parent("td")
-#         siblings = td.find_previous_siblings("td")
+@dataclass(frozen=True)
+class HtmlCollector:
+    """Scrapes the codes of a page
 
-#     return []
+    `rows` selects one element per code, `code` and `reward` are evaluated
+    relative to it. Codes are stored for the game and platforms mentioned in
+    their row, falling back to `games[0]` and all platforms.
+
+    Only the region holding the codes is hashed to detect changes, so ads or
+    timestamps around it don't count as one: from the last `region[0]` before
+    the first `marker` up to the first `region[1]` after the last one (the
+    whole page if the marker isn't found)."""
+
+    name: str
+    url: str
+    games: tuple[Game, ...]
+    rows: str
+    code: str
+    reward: str | None = None
+    marker: bytes | None = None
+    region: tuple[bytes, bytes] = (b"<table", b"</table>")
+
+    def digest(self, html: bytes) -> str:
+        start, end = 0, len(html)
+        if self.marker and (first := html.find(self.marker)) >= 0:
+            start = max(html.rfind(self.region[0], 0, first), 0)
+            end = html.find(self.region[1], html.rfind(self.marker))
+            end = len(html) if end < 0 else end + len(self.region[1])
+        return hashlib.sha256(html[start:end]).hexdigest()
+
+    def parse(self, html: bytes) -> list[dict[str, Any]]:
+        """Key rows (see `storage.insert_keys`) of the page"""
+        from lxml import html as lxml_html
+
+        tree = lxml_html.fromstring(html)
+        keys: list[dict[str, Any]] = []
+        for row in tree.xpath(self.rows):
+            match = CODE.search(" ".join(row.xpath(self.code)).encode())
+            if not match:
+                continue
+            reward = " ".join(row.xpath(self.reward)).strip() if self.reward else ""
+            game, platforms = hints(row.text_content().encode())
+            if game not in self.games:
+                game = self.games[0]
+            keys.extend(
+                dict(
+                    code=match.group().decode().upper(),
+                    game=game,
+                    platform=p,
+                    reward=reward,
+                )
+                for p in platforms or Platform
+            )
+        return keys
+
+
+collectors: dict[Game, list[HtmlCollector]] = defaultdict(list)
+
+
+def register(collector: HtmlCollector) -> HtmlCollector:
+    for game in collector.games:
+        collectors[game].append(collector)
+    return collector
+
+
+register(
+    HtmlCollector(
+        name="IGN Borderlands 4",
+        url="https://www.ign.com/wikis/borderlands-4/Borderlands_4_SHiFT_Codes",
+        games=(Game.bl4,),
+        rows="//tr[.//code[contains(@class, 'copy-the-code-target')]]",
+        code=".//code[contains(@class, 'copy-the-code-target')]//text()",
+        reward="./td[1]//text()",
+        marker=b"copy-the-code-target",
+    )
+)
+
+
+def fetch(
+    client: "httpx.Client", collector: HtmlCollector, fingerprint: Fingerprint
+) -> tuple[list[dict[str, Any]] | None, Fingerprint]:
+    """Keys of the page (None if it didn't change) and its new fingerprint
+
+    Raises if the page can't be fetched or parsed, so a failed page keeps its
+    old fingerprint and gets parsed again next time"""
+    headers = {}
+    if fingerprint.etag:
+        headers["If-None-Match"] = fingerprint.etag
+    if fingerprint.last_modified:
+        headers["If-Modified-Since"] = fingerprint.last_modified
+
+    response = client.get(collector.url, headers=headers)
+    if response.status_code == 304:
+        _L.debug(f"{collector.name}: not modified")
+        return None, fingerprint
+    response.raise_for_status()
+    new = Fingerprint(
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        digest=collector.digest(response.content),
+    )
+    if new.digest == fingerprint.digest:
+        _L.debug(f"{collector.name}: codes unchanged")
+        return None, new
+    keys = collector.parse(response.content)
+    _L.info(f"{collector.name}: found {len(keys)} keys")
+    return keys, new
+
+
+def collect(
+    games: Iterable[Game],
+    client: "httpx.Client | None" = None,
+    fingerprints: Fingerprints | None = None,
+) -> tuple[list[dict[str, Any]], Fingerprints]:
+    """Keys of all changed pages of the collectors of `games`
+
+    Only pages that were fetched and parsed get a new fingerprint. Save the
+    returned fingerprints once the keys are stored, so a failed run parses the
+    pages again. `client` is left open for the caller"""
+    import httpx
+
+    fingerprints = fingerprints or Fingerprints(settings.DATA_DIR / "collectors.json")
+    pages = {c.url: c for game in games for c in collectors.get(game, ())}
+    if not pages:
+        return [], fingerprints
+
+    def run(collector: HtmlCollector) -> list[dict[str, Any]] | None:
+        fingerprint = fingerprints.pages.get(collector.url, Fingerprint())
+        try:
+            keys, fingerprints.pages[collector.url] = fetch(http, collector, fingerprint)
+        except Exception as e:
+            _L.warning(f"Could not collect keys from {collector.name}: {e}")
+            return None
+        return keys
+
+    with nullcontext(client) if client else httpx.Client(follow_redirects=True) as http:
+        with ThreadPoolExecutor(min(WORKERS, len(pages))) as pool:
+            results = list(pool.map(run, pages.values()))
+    return [key for keys in results if keys for key in keys], fingerprints
+
+
+def ingest(game_map: Mapping[Game, Any]) -> int:
+    """Insert the keys of all changed pages. Returns the number of new keys"""
+    from autoshift import storage
+
+    keys, fingerprints = collect(game_map)
+    num_new_keys = storage.insert_keys(keys) if keys else 0
+    fingerprints.save()
+    return num_new_keys
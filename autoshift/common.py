@@ -22,15 +22,13 @@
 import logging
 import logging.config
 import re
-from collections import defaultdict
+import threading
 from enum import StrEnum, auto
 from pathlib import Path
-from typing import Annotated, Any, Literal, override
+from typing import TYPE_CHECKING, Any, cast, override
 
-import rich.logging
-from pydantic import BeforeValidator, Field, PrivateAttr, SecretStr
-from pydantic_core import PydanticUndefined
-from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
+if TYPE_CHECKING:
+    from autoshift.config import Settings
 
 ROOT_DIR = Path(__file__).parent.parent
 
@@ -84,171 +82,72 @@ def validate_list(value):
     return value
 
 
-class SettingsFields(BaseSettings):
-    model_config = SettingsConfigDict(
-        env_prefix="SHIFT_",
-        extra="allow",
-        validate_default=True,
-    )
-
-    PLATFORMS: Annotated[
-        list[Platform],
-        Field(
-            description="Platforms you want to redeem SHiFT keys for",
-        ),
-        BeforeValidator(validate_list),
-        NoDecode,
-    ] = []
-
-    GAMES: Annotated[
-        list[Game],
-        Field(
-            description="Games you want to redeem SHiFT keys for",
-        ),
-        BeforeValidator(validate_list),
-        NoDecode,
-    ] = []
-
-    _GAMES_PLATFORM_MAP: dict[Game, set[Platform]] = PrivateAttr(
-        init=False, default_factory=lambda: defaultdict(set)
-    )
+class LazySettings:
+    """Stands in for `config.Settings` until the first setting is used
 
-    USER: str | None = Field(
-        default=None,
-        description="E-Mail for your login\n  (only needed for the first login & will be prompted if missing)",
-    )
-    PASS: SecretStr | None = Field(
-        default=None,
-        description="Password for your login\n  (only needed for the first login & will be prompted if missing)",
-    )
-
-    DATA_DIR: Annotated[Path, BeforeValidator(path)] = Field(
-        default=ROOT_DIR / "data", description="Path to the data directory"
-    )
-
-    COOKIE_FILE: Annotated[Path, BeforeValidator(path)] = Field(
-        default_factory=lambda data: (data["DATA_DIR"] / ".cookies.save"),
-        description="Path to the cookie file (will be created if it doesn't exist)",
-    )
-    DB_FILE: Annotated[Path, BeforeValidator(path)] = Field(
-        default_factory=lambda data: (data["DATA_DIR"] / "keys.db"),
-        description="Path to the database file (will be created if it doesn't exist)",
-    )
+    Reading the settings means importing pydantic-settings, which would
+    otherwise take a good part of every start (see `autoshift.importtime`)"""
 
-    LOG_LEVEL: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "WARNING"
-    HTTP_LOG_LEVEL: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "WARNING"
+    _lock: threading.Lock
+    _settings: "Settings | None"
 
-    SCHEDULE: int | None = Field(
-        default=120, description="Check for new keys every N minutes"
-    )
+    def __init__(self):
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "_settings", None)
 
-    LIMIT: int = Field(
-        default=255,
-        gt=1,
-        description="Maximum number of keys to redeem at once (GearBox caps at 255)",
-    )
+    def _load(self) -> "Settings":
+        with self._lock:
+            if self._settings is not None:
+                return self._settings
+            from autoshift.config import Settings
 
-    SHIFT_SOURCE: str | None = Field(
-        default="https://raw.githubusercontent.com/ugoogalizer/autoshift-codes/main/shiftcodes.json",
-        description="""Can be a URL or a local file path (absolute or relative to the root dir)
-                      |  Set this to `None` to disable querying new keys.""",
-    )
+            loaded = Settings()
+            # `--verbose` may have set the level already
+            logger = logging.getLogger("autoshift")
+            if logger.level == logging.NOTSET:
+                logger.setLevel(loaded.LOG_LEVEL)
+            for name in ("httpx", "httpcore"):
+                logging.getLogger(name).setLevel(loaded.HTTP_LOG_LEVEL)
+            object.__setattr__(self, "_settings", loaded)
+            return loaded
 
-    @staticmethod
-    def write_defaults_file():
-        with (ROOT_DIR / "env.default").open("w") as f:
-            f.write("# -*- mode: sh -*-\n\n")
-            default_settings = SettingsFields().model_dump()
-
-            default_settings["COOKIE_FILE"] = "${SHIFT_DATA_DIR}/.cookies.save"
-            default_settings["DB_FILE"] = "${SHIFT_DATA_DIR}/keys.db"
-
-            indent_re = re.compile(r"^\s+\|")
-
-            f.write("# There's a new way to specify game/platform combinations!\n")
-            f.write("# just add an entry with the game name and a list of platforms\n")
-            f.write("# supported games:\n")
-            f.write(f"#{' ' * 4}{', '.join(Game)}\n")
-            f.write("# supported platforms: \n")
-            f.write(f"#{' ' * 4}{', '.join(Platform)}\n\n")
-
-            for game in Game:
-                f.write(f"# SHIFT_{game.upper()}=steam,psn\n")
-
-            f.write("\n\n")
-            for key, field_info in SettingsFields.model_fields.items():
-                desc = field_info.description or ""
-                desc_lines = desc.split("\n")
-                for line in desc_lines:
-                    line = indent_re.sub("", line)
-                    f.write(f"# {line}\n")
-
-                f.write(f"SHIFT_{key}=")
-
-                default = default_settings.get(key)
-                if default and default is not PydanticUndefined:
-                    if isinstance(default, list):
-                        default = ",".join(str(x) for x in default)
-                    f.write(f"{default}  # default: {default}")
-                f.write("\n\n")
-
-
-class Settings(SettingsFields):
-    """Read Settings from different sources: (in order of precedence)
-    - Command line args
-    - ENV variables
-    - .env file
-    """
-
-    model_config = SettingsConfigDict(
-        env_file=(ROOT_DIR / ".env"),
-        env_prefix="SHIFT_",
-        env_file_encoding="utf-8",
-        env_ignore_empty=True,
-        env_parse_none_str="None",
-        extra="allow",
-    )
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._settings or self._load(), name)
 
     @override
-    def model_post_init(self, context: Any, /) -> None:
-        super().model_post_init(context)
-        self.COOKIE_FILE.parent.mkdir(parents=True, exist_ok=True)
-        self.DB_FILE.parent.mkdir(parents=True, exist_ok=True)
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._settings or self._load(), name, value)
 
-        if self.SHIFT_SOURCE and not self.SHIFT_SOURCE.startswith("http"):
-            path = Path(self.SHIFT_SOURCE)
-            if not path.is_absolute():
-                path = ROOT_DIR / path
-            self.SHIFT_SOURCE = str(path.resolve())
 
+settings = cast("Settings", LazySettings())
 
-        for game in self.GAMES:
-            self._GAMES_PLATFORM_MAP[game] = set(self.PLATFORMS)
 
-        if not self.model_extra:
-            return
+class LazyRichHandler(logging.Handler):
+    """Creates the `RichHandler` on the first record
 
-        for game in Game:
-            if platforms := self.model_extra.get(f"shift_{game.name.lower()}"):
-                platforms = validate_list(platforms)
-                self._GAMES_PLATFORM_MAP[game] = set(
-                    Platform(platform) for platform in platforms
-                )
+    Importing rich and probing the terminal would otherwise slow down every start"""
 
-        return
+    def __init__(self, **kwargs: Any):
+        super().__init__()
+        self._kwargs = kwargs
+        self._handler: logging.Handler | None = None
 
+    @override
+    def emit(self, record: logging.LogRecord):
+        if self._handler is None:
+            from rich.logging import RichHandler
 
-settings = Settings()
+            self._handler = RichHandler(**self._kwargs)
+        self._handler.emit(record)
 
 
 logging.config.dictConfig(
     dict(
         version=1,
         disable_existing_loggers=False,
-        level=settings.LOG_LEVEL,
         handlers=dict(
             console={
-                "class": "rich.logging.RichHandler",
+                "()": LazyRichHandler,
                 "rich_tracebacks": True,
                 "enable_link_path": False,
             },
@@ -260,17 +159,14 @@ logging.config.dictConfig(
             "autoshift": {
                 "handlers": ["console"],
                 "propagate": False,
-                "level": settings.LOG_LEVEL,
             },
             "httpx": {
                 "handlers": ["console"],
                 "propagate": False,
-                "level": settings.HTTP_LOG_LEVEL,
             },
             "httpcore": {
                 "handlers": ["console"],
                 "propagate": False,
-                "level": settings.HTTP_LOG_LEVEL,
             },
         },
     )
@@ -278,5 +174,17 @@ logging.config.dictConfig(
 
 _L = logging.getLogger("autoshift")
 
+
+def __getattr__(name: str):
+    # the settings classes moved to `config`, which is only imported on use
+    if name in ("Settings", "SettingsFields"):
+        from autoshift import config
+
+        return getattr(config, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == "__main__":
+    from autoshift.config import SettingsFields
+
     SettingsFields.write_defaults_file()
@@ -0,0 +1,274 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Long-running service mode on a single asyncio event loop.
+
+Ingestion runs on its own schedule and feeds claimed keys into a queue, which
+a single redemption worker drains using the already logged-in session.
+Blocking work (HTTP, database) runs in worker threads."""
+
+import asyncio
+import signal
+import time
+from collections import defaultdict
+from collections.abc import Callable, Coroutine
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, cast
+
+from autoshift import metrics, storage
+from autoshift.auto import BURST, BURST_PAUSE, ingest_keys, redeem, verify_submitted
+from autoshift.common import _L, Game, Platform, settings
+from autoshift.models import Key
+from autoshift.quota import get_tracker
+from autoshift.shift import Status
+
+
+class Daemon:
+    def __init__(self):
+        self.queue: asyncio.Queue[Key] = asyncio.Queue()
+        # ids of claimed keys waiting in the queue
+        self.queued: set[int] = set()
+        self.stopped = asyncio.Event()
+        self.tasks: list[asyncio.Task] = []
+        # scheduled and file-triggered ingestion must not claim concurrently
+        self.ingest_lock = asyncio.Lock()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except NotImplementedError:
+                # windows: KeyboardInterrupt still ends `asyncio.run`
+                pass
+
+        self.start(self.ingest_loop(), "ingest")
+        self.start(self.redeem_loop(), "redeem")
+        self.start(self.heartbeat_loop(), "heartbeat")
+        if settings.API_PORT:
+            from autoshift.api import ControlAPI
+
+            self.start(
+                ControlAPI(self).serve(settings.API_HOST, settings.API_PORT), "api"
+            )
+        if settings.WATCH is not None and is_local_source():
+            self.start(self.watch_loop(), "watch")
+        if settings.MAINTENANCE:
+            self.start(self.maintenance_loop(), "maintenance")
+
+        try:
+            await self.stopped.wait()
+        finally:
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            await asyncio.to_thread(storage.release_claims)
+            _L.info("Daemon stopped.")
+
+    def stop(self):
+        _L.info("Stopping daemon..")
+        self.stopped.set()
+
+    def start(self, coro: Coroutine[Any, Any, Any], name: str) -> asyncio.Task:
+        task = asyncio.create_task(coro, name=name)
+        task.add_done_callback(self.task_done)
+        self.tasks.append(task)
+        return task
+
+    def task_done(self, task: asyncio.Task):
+        """Stop the daemon if one of its loops died, instead of running without it"""
+        if task.cancelled() or not (e := task.exception()):
+            return
+        _L.error(f"The {task.get_name()} loop failed: {e!r}", exc_info=e)
+        self.stop()
+
+    async def sleep(self, seconds: float) -> bool:
+        """Sleep for `seconds` or until stopped. Returns False when stopped"""
+        try:
+            await asyncio.wait_for(self.stopped.wait(), timeout=seconds)
+        except TimeoutError:
+            return True
+        return False
+
+    async def pause(self, seconds: float, reason: str) -> bool:
+        """`sleep` to prevent or recover from rate limiting"""
+        start = time.monotonic()
+        try:
+            return await self.sleep(seconds)
+        finally:
+            metrics.sleep_seconds.inc(time.monotonic() - start, reason=reason)
+
+    async def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run blocking `func` in a worker thread"""
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def ingest(self) -> int:
+        """Ingest new keys and queue all redeemable ones. Returns the number queued"""
+        async with self.ingest_lock:
+            try:
+                await self.call(ingest_keys)
+            except Exception as e:
+                # keep redeeming what we already know about
+                _L.error(f"Could not query new keys: {e}")
+            try:
+                await self.call(verify_submitted)
+            except Exception as e:
+                _L.error(f"Could not verify submitted keys: {e}")
+
+            try:
+                keys = await self.call(
+                    storage.claim_keys,
+                    settings._GAMES_PLATFORM_MAP,
+                    settings.LIMIT,
+                    exclude=self.queued,
+                )
+            except Exception as e:
+                # e.g. the database is locked by other workers, try next time
+                _L.error(f"Could not claim keys: {e}")
+                return 0
+            self.put(keys)
+        return len(keys)
+
+    async def enqueue(self, keys: list[Key]) -> int:
+        """Claim and queue the given keys, whatever games and platforms are configured
+
+        Returns the number queued"""
+        game_map: dict[Game, set[Platform]] = defaultdict(set)
+        for key in keys:
+            game_map[key.game].add(key.platform)
+        if not game_map:
+            return 0
+
+        async with self.ingest_lock:
+            claimed = await self.call(
+                storage.claim_keys,
+                game_map,
+                len(keys),
+                exclude=self.queued,
+                key_ids=[key.id for key in keys],
+            )
+            self.put(claimed)
+        return len(claimed)
+
+    def put(self, keys: list[Key]):
+        for key in keys:
+            self.queued.add(key.id)
+            self.queue.put_nowait(key)
+        if keys:
+            _L.info(f"Queued {len(keys)} keys")
+
+    async def ingest_loop(self):
+        while True:
+            await self.ingest()
+            if not settings.SCHEDULE:
+                return
+            if not await self.sleep(settings.SCHEDULE * 60):
+                return
+
+    async def watch_loop(self):
+        """Ingest right away whenever the local `SHIFT_SOURCE` changes"""
+        from autoshift.watcher import watch_file
+
+        source = Path(cast(str, settings.SHIFT_SOURCE))
+        _L.info(f"Watching {source} for new keys")
+        async for _ in watch_file(source, settings.WATCH or 0):
+            _L.info(f"{source.name} changed")
+            await self.ingest()
+
+    async def redeem_loop(self):
+        burst = 0
+        # the key that hit the quota, redeemed first once it reset
+        retry: Key | None = None
+        while True:
+            if retry is None and self.queue.empty():
+                # starting over after idling
+                burst = 0
+            key, retry = retry or await self.queue.get(), None
+            if get_tracker().blocked_until():
+                if not await self.wait_for_quota():
+                    return
+                burst = 0
+
+            if burst and not (burst % BURST):
+                _L.info("Trying to prevent a 'too many requests'-block.")
+                if not await self.pause(BURST_PAUSE, reason="burst"):
+                    return
+
+            status = None
+            try:
+                # a TRYLATER pauses the loop through the quota tracker
+                status = await self.call(redeem, key)
+            except Exception as e:
+                _L.error(f"Could not redeem {key.code}: {e}")
+            finally:
+                if status == Status.TRYLATER:
+                    # stays claimed (and queued) until the quota reset
+                    retry = key
+                else:
+                    self.queued.discard(key.id)
+                    try:
+                        await self.call(storage.release_claims, [key])
+                    except Exception as e:
+                        # the claim expires after `LEASE` seconds
+                        _L.error(f"Could not release {key.code}: {e}")
+            burst += 1
+
+    async def wait_for_quota(self) -> bool:
+        """Wait until the redemption quota is expected to reset.
+
+        Queued keys stay claimed meanwhile. Returns False when stopped"""
+        resume_at = get_tracker().blocked_until()
+        if not resume_at:
+            return True
+        _L.info(f"Pausing redemption until around {resume_at.astimezone():%H:%M}")
+        return await self.pause(
+            (resume_at - datetime.now(UTC)).total_seconds(), reason="quota"
+        )
+
+    async def heartbeat_loop(self):
+        # renew well before the claims of queued keys expire
+        while await self.sleep(settings.LEASE / 3):
+            if not self.queued:
+                continue
+            try:
+                await self.call(storage.renew_claims)
+            except Exception as e:
+                _L.error(f"Could not renew claims: {e}")
+
+    async def maintenance_loop(self):
+        from autoshift.maintenance import run_maintenance
+
+        while True:
+            try:
+                await self.call(run_maintenance)
+            except Exception as e:
+                _L.error(f"Database maintenance failed: {e}")
+            if not await self.sleep((settings.MAINTENANCE or 24) * 3600):
+                return
+
+
+def is_local_source() -> bool:
+    return bool(settings.SHIFT_SOURCE) and not settings.SHIFT_SOURCE.startswith("http")
+
+
+def run_daemon():
+    asyncio.run(Daemon().run())
@@ -0,0 +1,269 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Extract SHiFT codes from arbitrary text
+
+Chat logs, HTML pages or multi-GB dumps: files are memory-mapped and scanned
+in chunks without copying them, streams (like stdin) are read in chunks. A
+code crossing the end of a chunk is found in the overlap with the next one and
+reported exactly once.
+
+Codes are normalized to upper case and reported once. The text right before a
+code is searched for the game and platform it is for (e.g. "Borderlands 4",
+"PSN"). Benchmark the throughput with
+
+    python -m autoshift.extract --size 256
+"""
+
+import mmap
+import re
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any
+
+from autoshift.common import Game, Platform
+
+CODE = re.compile(rb"(?<![0-9A-Za-z])(?:[0-9A-Za-z]{5}-){4}[0-9A-Za-z]{5}(?![0-9A-Za-z])")
+CODE_LENGTH = 29
+# `CODE` without its first block. Starting with a literal lets the regex engine
+# skip ahead to the next "-" instead of trying to match at every byte, the
+# first block is checked separately
+_TAIL = re.compile(rb"-(?:[0-9A-Za-z]{5}-){3}[0-9A-Za-z]{5}(?![0-9A-Za-z])")
+_ALNUM = frozenset(b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz")
+
+# bytes before a code searched for game and platform hints
+HINT_WINDOW = 160
+
+CHUNK_SIZE = 16 * 1024**2
+# a code starting in a chunk is matched in full if it ends in the overlap
+# (plus one byte for the lookahead)
+OVERLAP = CODE_LENGTH + 1
+
+GAME_HINTS = {
+    Game.bl1: (rb"bl1", rb"borderlands goty", rb"borderlands: game of the year"),
+    Game.bl2: (rb"bl2", rb"borderlands 2"),
+    Game.bl3: (rb"bl3", rb"borderlands 3"),
+    Game.bl4: (rb"bl4", rb"borderlands 4"),
+    Game.blps: (rb"blps", rb"bltps", rb"pre-sequel", rb"presequel"),
+    Game.ttw: (rb"ttw", rb"wonderlands"),
+    Game.gdfll: (rb"godfall",),
+}
+PLATFORM_HINTS = {
+    Platform.steam: (rb"steam",),
+    Platform.epic: (rb"epic",),
+    Platform.psn: (rb"psn", rb"playstation", rb"ps4", rb"ps5"),
+    Platform.xboxlive: (rb"xbox",),
+}
+# valid for all platforms
+UNIVERSAL_HINTS = (rb"universal", rb"all platforms", rb"cross-platform")
+
+
+def _hint_pattern(hints: dict[Any, tuple[bytes, ...]]) -> re.Pattern[bytes]:
+    return re.compile(
+        rb"\b(?:"
+        + rb"|".join(
+            rb"(?P<%s>%s)" % (value.encode(), rb"|".join(map(re.escape, words)))
+            for value, words in hints.items()
+        )
+        + rb")\b"
+    )
+
+
+GAME_PATTERN = _hint_pattern(GAME_HINTS)
+PLATFORM_PATTERN = _hint_pattern(
+    {**PLATFORM_HINTS, "universal": UNIVERSAL_HINTS}  # pyright: ignore[reportArgumentType]
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Found:
+    code: str
+    game: Game | None = None
+    # None: no hint. An empty tuple never happens
+    platforms: tuple[Platform, ...] | None = None
+
+
+def _last_hint(pattern: re.Pattern[bytes], text: bytes) -> str | None:
+    name = None
+    for match in pattern.finditer(text):
+        name = match.lastgroup
+    return name
+
+
+def hints(text: bytes) -> tuple[Game | None, tuple[Platform, ...] | None]:
+    """Game and platforms mentioned last in `text`"""
+    text = text.lower()
+    game = _last_hint(GAME_PATTERN, text)
+    platform = _last_hint(PLATFORM_PATTERN, text)
+    if platform == "universal":
+        platforms = tuple(Platform)
+    else:
+        platforms = (Platform(platform),) if platform else None
+    return Game(game) if game else None, platforms
+
+
+class Extractor:
+    """Finds every code once, across all texts it scans"""
+
+    def __init__(self, with_hints: bool = True):
+        self.with_hints = with_hints
+        self.seen: set[bytes] = set()
+        self.scanned = 0
+        # end of the last match in the buffer being scanned, codes can't overlap
+        self._after = 0
+
+    def _scan(self, buf: Any, start: int, end: int, size: int) -> Iterator[Found]:
+        """Codes starting in `buf[start:end]` (`buf` holds `size` bytes)"""
+        pos, endpos = max(start, self._after) + 5, min(end + OVERLAP, size)
+        while match := _TAIL.search(buf, pos, endpos):
+            begin = match.start() - 5
+            if begin >= end:
+                # the next chunk reports it
+                break
+            head = buf[begin : match.start()]
+            if not _ALNUM.issuperset(head) or (begin and buf[begin - 1] in _ALNUM):
+                # a code may still start within this match
+                pos = match.start() + 1
+                continue
+            self._after = match.end()
+            pos = self._after + 5
+            code = (head + match.group()).upper()
+            if code in self.seen:
+                continue
+            self.seen.add(code)
+            if not self.with_hints:
+                yield Found(code.decode())
+                continue
+            game, platforms = hints(buf[max(begin - HINT_WINDOW, 0) : begin])
+            yield Found(code.decode(), game, platforms)
+
+    def scan_bytes(self, data: bytes) -> Iterator[Found]:
+        self.scanned += len(data)
+        self._after = 0
+        yield from self._scan(data, 0, len(data), len(data))
+
+    def scan_text(self, text: str) -> Iterator[Found]:
+        yield from self.scan_bytes(text.encode(errors="replace"))
+
+    def scan_file(self, path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[Found]:
+        """Scan the file memory-mapped, `chunk_size` bytes at a time"""
+        with path.open("rb") as f:
+            size = f.seek(0, 2)
+            if not size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                self._after = 0
+                for start in range(0, size, chunk_size):
+                    end = min(start + chunk_size, size)
+                    yield from self._scan(mm, start, end, size)
+                    self.scanned += end - start
+
+    def scan_stream(self, f: IO[bytes], chunk_size: int = CHUNK_SIZE) -> Iterator[Found]:
+        """Scan a stream `chunk_size` bytes at a time
+
+        The end of every chunk is kept for the next one, as the overlap to
+        match codes crossing the boundary and for the hints"""
+        buf = b""
+        # position in `buf` up to which codes were reported
+        done = self._after = 0
+        while data := f.read(chunk_size):
+            self.scanned += len(data)
+            buf += data
+            end = max(len(buf) - OVERLAP, done)
+            yield from self._scan(buf, done, end, len(buf))
+            keep = max(end - HINT_WINDOW, 0)
+            buf, done = buf[keep:], end - keep
+            self._after -= keep
+        yield from self._scan(buf, done, len(buf), len(buf))
+
+    def scan(self, source: Path | IO[bytes]) -> Iterator[Found]:
+        if isinstance(source, Path):
+            return self.scan_file(source)
+        return self.scan_stream(source)
+
+
+def rows(
+    found: Iterable[Found], platforms: Iterable[Platform] = Platform
+) -> Iterator[dict]:
+    """Key rows for `storage.insert_keys`
+
+    Codes without a platform hint are stored for all `platforms`, codes without
+    a game hint for `Game.UNKNOWN`"""
+    default = tuple(platforms)
+    for f in found:
+        for platform in f.platforms or default:
+            yield dict(code=f.code, game=f.game or Game.UNKNOWN, platform=platform)
+
+
+def benchmark(size_mb: int = 256, codes_per_mb: int = 50, chunk_size: int = CHUNK_SIZE):
+    """Throughput of `Extractor.scan_file` on a generated dump (MB/s)"""
+    import random
+    import tempfile
+    import time
+
+    rnd = random.Random(0)
+    alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ0123456789"
+    filler = (
+        "<tr><td>[12:03] someone: did anyone get the new borderlands 4 shift code "
+        "for psn? https://shift.gearboxsoftware.com/rewards - ABCDE-FGHIJ</td></tr>\n"
+    ) * (1024**2 // 150)
+    expected = set()
+    with tempfile.NamedTemporaryFile(suffix=".txt") as f:
+        for _ in range(size_mb):
+            block = bytearray(filler.encode())
+            for _ in range(codes_per_mb):
+                code = "-".join("".join(rnd.choices(alphabet, k=5)) for _ in range(5))
+                expected.add(code)
+                # somewhere in a line, but not inside another code
+                at = block.find(b" - ", rnd.randrange(len(block) - 200)) + 1
+                block[at:at] = f" {code.lower()} ".encode()
+            f.write(block)
+        f.flush()
+        path = Path(f.name)
+        size = path.stat().st_size
+
+        results = {}
+        for with_hints in (False, True):
+            extractor = Extractor(with_hints)
+            started = time.perf_counter()
+            found = {found.code for found in extractor.scan_file(path, chunk_size)}
+            elapsed = time.perf_counter() - started
+            assert found == expected, f"found {len(found)} of {len(expected)} codes"
+            results[with_hints] = size / 1024**2 / elapsed
+    return size / 1024**2, len(expected), results
+
+
+if __name__ == "__main__":
+    from typing import Annotated
+
+    import typer
+
+    def main(
+        size: Annotated[int, typer.Option(help="Size of the generated dump (MiB)")] = 256,
+        chunk: Annotated[int, typer.Option(help="Chunk size (MiB)")] = 16,
+    ):
+        mb, num_codes, results = benchmark(size, chunk_size=chunk * 1024**2)
+        typer.echo(f"{mb:.0f} MiB, {num_codes} codes")
+        typer.echo(f"{results[False]:8.1f} MB/s  codes only")
+        typer.echo(f"{results[True]:8.1f} MB/s  with game/platform hints")
+
+    typer.run(main)
@@ -0,0 +1,111 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Check the startup time of the CLI
+
+Imports the CLI in fresh interpreters with `-X importtime` and fails if the
+best run exceeds the budget, or if one of the heavy dependencies that should
+only be imported on first use got imported. Meant to run in CI:
+
+    python -m autoshift.importtime --budget 400
+"""
+
+import subprocess
+import sys
+from typing import Annotated
+
+import typer
+
+# only needed once we read the settings, talk to SHiFT, schedule runs or start
+# the TUI
+DEFERRED = (
+    "pydantic",
+    "pydantic_settings",
+    "textual",
+    "httpx",
+    "bs4",
+    "lxml",
+    "apscheduler",
+    "rich.logging",
+)
+
+# import time of the CLI (ms)
+BUDGET = 400
+
+
+def measure(module: str) -> dict[str, tuple[int, float]]:
+    """Import `module` in a fresh interpreter
+
+    Returns the nesting level and cumulative import time (in ms) of every
+    module imported along the way"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: dict[str, tuple[int, float]] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (level, int(cumulative) / 1000)
+    return times
+
+
+def main(
+    module: Annotated[str, typer.Option(help="Module to import")] = "autoshift.auto",
+    budget: Annotated[
+        float, typer.Option(help="Maximum import time of the best run (ms)")
+    ] = BUDGET,
+    runs: Annotated[int, typer.Option(min=1, help="Number of fresh imports")] = 5,
+    top: Annotated[int, typer.Option(help="Number of slowest imports to show")] = 10,
+):
+    results = [measure(module) for _ in range(runs)]
+    best = min(results, key=lambda times: times[module][1])
+    total = best[module][1]
+
+    # direct imports of `module` and the modules imported before it
+    slowest = sorted(
+        (
+            (ms, name)
+            for name, (level, ms) in best.items()
+            if level <= 1 and name != module
+        ),
+        reverse=True,
+    )
+    for ms, name in slowest[:top]:
+        typer.echo(f"{ms:8.1f} ms  {name}")
+    typer.echo(f"{total:8.1f} ms  {module} (best of {runs}, budget {budget:g} ms)")
+
+    failed = False
+    if eager := [name for name in DEFERRED if name in best]:
+        typer.echo(f"imported on startup: {', '.join(eager)}", err=True)
+        failed = True
+    if total > budget:
+        typer.echo(f"import time over budget by {total - budget:.1f} ms", err=True)
+        failed = True
+    raise typer.Exit(int(failed))
+
+
+if __name__ == "__main__":
+    typer.run(main)
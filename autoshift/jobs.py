@@ -0,0 +1,187 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Cancellable background jobs
+
+Every job runs in its own thread and `JobManager` runs at most one job of a
+kind at a time. Cancellation is cooperative: `sleep` and `check_cancelled`
+raise `Cancelled` once the job calling them got cancelled. Jobs report their
+progress with `begin` and `advance`.
+
+Outside of a job all of these behave like `time.sleep` or do nothing, so the
+CLI can share the code paths."""
+
+import threading
+import time
+from collections.abc import Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from autoshift.common import _L
+
+
+class Cancelled(BaseException):
+    """The running job got cancelled
+
+    Not an `Exception`, so it isn't swallowed by broad error handling on its way up"""
+
+
+@dataclass(eq=False)
+class Job:
+    kind: str
+    description: str
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    thread: threading.Thread | None = None
+    started: float = field(default_factory=time.monotonic)
+    done: int = 0
+    total: int | None = None
+    result: Any = None
+    error: Exception | None = None
+    finished: bool = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def eta(self) -> float | None:
+        """Estimated seconds until the job is done"""
+        if not self.done or self.total is None:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed / self.done * max(self.total - self.done, 0)
+
+    def outcome(self) -> str:
+        if self.error:
+            return f"{self.description} failed: {self.error}"
+        if self.cancelled:
+            return f"{self.description} cancelled"
+        return f"{self.description} completed"
+
+    def status(self) -> str:
+        text = self.description
+        if self.cancelled:
+            return f"{text} (cancelling)"
+        if self.total:
+            text += f": {self.done}/{self.total}"
+            if (eta := self.eta()) is not None:
+                minutes, seconds = divmod(round(eta), 60)
+                text += f", ETA {minutes}:{seconds:02}"
+        return text
+
+
+_current: ContextVar[Job | None] = ContextVar("job", default=None)
+
+
+def current() -> Job | None:
+    """The job running in this thread"""
+    return _current.get()
+
+
+def check_cancelled():
+    """Raise `Cancelled` if the current job got cancelled"""
+    if (job := _current.get()) and job.cancelled:
+        raise Cancelled
+
+
+def sleep(seconds: float):
+    """`time.sleep` that wakes up and raises `Cancelled` when the current job is cancelled"""
+    job = _current.get()
+    if job is None:
+        time.sleep(seconds)
+    elif job.cancel_event.wait(seconds):
+        raise Cancelled
+
+
+def begin(total: int | None):
+    """Start counting the progress of the current job towards `total`"""
+    if job := _current.get():
+        job.started = time.monotonic()
+        job.done = 0
+        job.total = total
+
+
+def advance(steps: int = 1):
+    if job := _current.get():
+        job.done += steps
+
+
+class JobManager:
+    """Runs background jobs, at most one per kind"""
+
+    def __init__(self):
+        self.jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def start(
+        self, kind: str, description: str, fn: Callable[..., Any], *args: Any
+    ) -> Job | None:
+        """Run `fn(*args)` as a job of `kind`
+
+        Returns None if a job of that kind is still running"""
+        with self._lock:
+            if (job := self.jobs.get(kind)) and job.running:
+                return None
+            job = self.jobs[kind] = Job(kind, description)
+            job.thread = threading.Thread(
+                target=self._run, args=(job, fn, args), name=f"job-{kind}", daemon=True
+            )
+            job.thread.start()
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple[Any, ...]):
+        _current.set(job)
+        try:
+            job.result = fn(*args)
+        except Cancelled:
+            _L.info(f"{job.description} cancelled")
+        except Exception as e:
+            job.error = e
+            _L.exception(f"{job.description} failed")
+        finally:
+            job.finished = True
+
+    def running(self) -> list[Job]:
+        return [job for job in list(self.jobs.values()) if job.running]
+
+    def cancel(self, kind: str | None = None):
+        """Cancel the job of `kind` (all jobs if None)"""
+        for job in self.running():
+            if kind is None or job.kind == kind:
+                job.cancel()
+
+    def shutdown(self, timeout: float = 10) -> bool:
+        """Cancel all jobs and wait up to `timeout` seconds for them to stop
+
+        Returns whether all of them stopped"""
+        self.cancel()
+        deadline = time.monotonic() + timeout
+        for job in self.running():
+            if job.thread:
+                job.thread.join(max(deadline - time.monotonic(), 0))
+        return not self.running()
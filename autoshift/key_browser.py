@@ -0,0 +1,274 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Key browser of the TUI
+
+Shows the number of keys per game, platform and status and one page of keys at
+a time. Filtering, sorting and paging happen in the database (see
+`storage.browse_keys`), so only a page of rows is ever loaded, no matter how
+many keys there are.
+
+Queries run in a worker thread. The current page and the counts are refreshed
+periodically and only cells that changed get updated."""
+
+from dataclasses import dataclass, field
+from typing import Any
+
+from textual import on, work
+from textual.app import ComposeResult
+from textual.containers import Horizontal
+from textual.screen import Screen
+from textual.widgets import DataTable, Footer, Header, Input, Select, Static
+from textual.worker import get_current_worker
+
+from autoshift.common import Game, Platform
+from autoshift.storage import SORT_COLUMNS, KeyStatus
+
+PAGE_SIZE = 100
+REFRESH_INTERVAL = 10
+
+STATUSES: tuple[KeyStatus, ...] = ("pending", "redeemed", "expired")
+
+COLUMNS = ("id", "code", "game", "platform", "reward", "status", "added")
+
+
+@dataclass
+class Page:
+    """Keys of one page and the counts at the time it was loaded"""
+
+    rows: dict[str, tuple[str, ...]]
+    has_next: bool
+    # sort value and id of the last key
+    last: tuple[Any, int] | None = None
+    counts: dict[tuple[Game, Platform], dict[KeyStatus, int]] = field(
+        default_factory=dict
+    )
+
+
+def _row(key: Any) -> tuple[str, ...]:
+    return (
+        str(key.id),
+        key.code,
+        key.game.name,
+        key.platform.name,
+        key.reward,
+        key.status,
+        f"{key.added:%Y-%m-%d %H:%M}",
+    )
+
+
+class KeyBrowserScreen(Screen):
+    """Paged, filterable and sortable view of all keys"""
+
+    DEFAULT_CSS = """
+    #key-counts {
+        height: auto;
+        max-height: 12;
+    }
+    #key-filter {
+        height: auto;
+    }
+    #key-filter Select {
+        width: 22;
+    }
+    #key-search {
+        width: 1fr;
+    }
+    #keys {
+        height: 1fr;
+    }
+    #key-page {
+        height: 1;
+    }
+    """
+
+    BINDINGS = [
+        ("escape", "app.pop_screen", "Close"),
+        ("n", "next_page", "Next Page"),
+        ("p", "previous_page", "Previous Page"),
+        ("r", "refresh", "Refresh"),
+    ]
+
+    def __init__(self, account: str | None = None):
+        super().__init__()
+        self.account = account
+        self.sort = "id"
+        self.descending = False
+        # `after` cursor of every page up to the current one
+        self.cursors: list[tuple[Any, int] | None] = [None]
+        self._page: Page | None = None
+
+    def compose(self) -> ComposeResult:
+        yield Header()
+        yield DataTable(id="key-counts", cursor_type="none", zebra_stripes=True)
+        with Horizontal(id="key-filter"):
+            yield Select(
+                [(game.value, game) for game in Game if game != Game.UNKNOWN],
+                prompt="All games",
+                id="key-game",
+            )
+            yield Select(
+                [(platform.value, platform) for platform in Platform],
+                prompt="All platforms",
+                id="key-platform",
+            )
+            yield Select(
+                [(status, status) for status in STATUSES],
+                prompt="All states",
+                id="key-status",
+            )
+            yield Input(placeholder="Search code or reward...", id="key-search")
+        yield DataTable(id="keys", cursor_type="row", zebra_stripes=True)
+        yield Static(id="key-page")
+        yield Footer()
+
+    def on_mount(self):
+        counts = self.query_one("#key-counts", DataTable)
+        counts.add_columns("game", "platform", *STATUSES, "total")
+        keys = self.query_one("#keys", DataTable)
+        for column in COLUMNS:
+            keys.add_column(column, key=column)
+        self.load(counts=True)
+        self.set_interval(REFRESH_INTERVAL, self.action_refresh)
+
+    def _filters(self) -> dict[str, Any]:
+        def value(selector: str) -> Any:
+            select = self.query_one(selector, Select)
+            return None if select.is_blank() else select.value
+
+        return {
+            "game": value("#key-game"),
+            "platform": value("#key-platform"),
+            "status": value("#key-status"),
+            "search": self.query_one("#key-search", Input).value.strip(),
+        }
+
+    def load(self, counts: bool = False):
+        """Load the current page (and the counts) and show them"""
+        self._load(
+            self._filters(),
+            self.sort,
+            self.descending,
+            self.cursors[-1],
+            counts,
+        )
+
+    @work(thread=True, exclusive=True, group="key-browser")
+    def _load(
+        self,
+        filters: dict[str, Any],
+        sort: str,
+        descending: bool,
+        after: tuple[Any, int] | None,
+        counts: bool,
+    ):
+        from autoshift.storage import browse_keys, count_keys, database
+
+        with database.connection_context():
+            keys = browse_keys(
+                self.account,
+                **filters,
+                sort=sort,
+                descending=descending,
+                after=after,
+                limit=PAGE_SIZE + 1,
+            )
+            keys, has_next = keys[:PAGE_SIZE], len(keys) > PAGE_SIZE
+            page = Page({str(key.id): _row(key) for key in keys}, has_next)
+            if keys:
+                page.last = (getattr(keys[-1], sort), keys[-1].id)
+            if counts:
+                for game, platform, status, n in count_keys(self.account):
+                    page.counts.setdefault((game, platform), {})[status] = n
+        # filters, sort or page changed in the meantime
+        if not get_current_worker().is_cancelled:
+            self.app.call_from_thread(self._show, page)
+
+    def _show(self, page: Page):
+        self._page = page
+        table = self.query_one("#keys", DataTable)
+        current = [row.value for row in table.rows]
+        if current == list(page.rows):
+            # same keys, only update what changed (keeps cursor and scroll position)
+            for key_id, row in page.rows.items():
+                for column, old, new in zip(COLUMNS, table.get_row(key_id), row):
+                    if old != new:
+                        table.update_cell(key_id, column, new)
+        else:
+            table.clear()
+            for key_id, row in page.rows.items():
+                table.add_row(*row, key=key_id)
+
+        if page.counts:
+            self._show_counts(page.counts)
+
+        order = "descending" if self.descending else "ascending"
+        self.query_one("#key-page", Static).update(
+            f"Page {len(self.cursors)}"
+            f"{'' if page.has_next else ' (last)'}"
+            f" - sorted by {self.sort} ({order})"
+        )
+
+    def _show_counts(self, counts: dict[tuple[Game, Platform], dict[KeyStatus, int]]):
+        table = self.query_one("#key-counts", DataTable)
+        table.clear()
+        totals = dict.fromkeys(STATUSES, 0)
+        for (game, platform), by_status in counts.items():
+            row = [by_status.get(status, 0) for status in STATUSES]
+            table.add_row(game.name, platform.name, *row, sum(row))
+            for status, n in zip(STATUSES, row):
+                totals[status] += n
+        table.add_row("all", "", *totals.values(), sum(totals.values()))
+
+    def _reload(self):
+        """Start over at the first page"""
+        self.cursors = [None]
+        self.load()
+
+    @on(Select.Changed)
+    @on(Input.Changed, "#key-search")
+    def on_filter_changed(self):
+        self._reload()
+
+    @on(DataTable.HeaderSelected, "#keys")
+    def on_header_selected(self, event: DataTable.HeaderSelected):
+        column = str(event.column_key.value)
+        if column not in SORT_COLUMNS:
+            self.notify(f"Can't sort by {column}", severity="warning")
+            return
+        if column == self.sort:
+            self.descending = not self.descending
+        else:
+            self.sort, self.descending = column, False
+        self._reload()
+
+    def action_next_page(self):
+        if self._page and self._page.has_next and self._page.last:
+            self.cursors.append(self._page.last)
+            self.load()
+
+    def action_previous_page(self):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+            self.load()
+
+    def action_refresh(self):
+        self.load(counts=True)
@@ -0,0 +1,243 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Headless scheduler for Termux and other low-memory devices
+
+The resident process only uses the standard library: plain `logging`, a
+minimal reader for the few settings it needs and a sleep loop. Every run
+(and the database maintenance) happens in a short-lived child process
+running the regular CLI, so pydantic, httpx, bs4 and friends only take up
+memory while keys are redeemed and are handed back to the system afterwards.
+
+    python -m autoshift.lite --bl4=steam
+
+All arguments are passed on to `autoshift schedule`. `--check` measures the
+resident memory after startup and fails if it exceeds the budget:
+
+    python -m autoshift.lite --check --budget 20
+"""
+
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+
+# resident set size the runner may use between runs (MiB)
+RSS_BUDGET = 20
+
+# only ever imported by the child processes
+HEAVY = ("pydantic", "peewee", "httpx", "bs4", "typer", "rich", "apscheduler")
+
+_L = logging.getLogger("autoshift.lite")
+
+
+def read_settings(env_file: Path = ROOT_DIR / ".env") -> dict[str, str]:
+    """`SHIFT_*` settings from the environment and the `.env` file
+
+    Environment variables take precedence, empty values are ignored (like in
+    `config.Settings`). Only supports the `KEY=value  # comment` lines used by
+    `env.default`, which is all the runner needs."""
+    values: dict[str, str] = {}
+    if env_file.exists():
+        for line in env_file.read_text(encoding="utf-8").splitlines():
+            key, sep, value = line.partition("=")
+            key = key.strip()
+            if not sep or not key.startswith("SHIFT_"):
+                continue
+            value = value.split(" #", 1)[0].strip().strip("'\"")
+            if value:
+                values[key] = value
+    values.update((k, v) for k, v in os.environ.items() if k.startswith("SHIFT_") and v)
+    return values
+
+
+def int_setting(values: dict[str, str], key: str, default: int | None) -> int | None:
+    """Integer setting, None if set to `None`"""
+    value = values.get(key)
+    if value is None:
+        return default
+    if value == "None":
+        return None
+    return int(value)
+
+
+def peak_rss(children: bool = False) -> float:
+    """Peak resident set size of this process or its finished children (MiB)"""
+    import resource
+
+    peak = resource.getrusage(
+        resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    ).ru_maxrss
+    # bytes on macOS, KiB everywhere else
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def rss() -> float:
+    """Current resident set size of this process (MiB)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except OSError:
+        # no procfs
+        return peak_rss()
+
+
+class Runner:
+    """Runs the CLI in a child process every `schedule` minutes until stopped"""
+
+    def __init__(
+        self,
+        args: list[str],
+        schedule: int | None,
+        maintenance: int | None,
+        budget: float = RSS_BUDGET,
+    ):
+        self.args = args
+        self.schedule = schedule
+        self.maintenance = maintenance
+        self.budget = budget
+        self.stopped = threading.Event()
+        self._child: subprocess.Popen | None = None
+        self._last_maintenance: float | None = None
+
+    def stop(self, *_):
+        self.stopped.set()
+        if self._child and self._child.poll() is None:
+            self._child.terminate()
+
+    def run_cli(self, *args: str) -> int:
+        """Run `autoshift <args>` and wait for it"""
+        # run only once, the scheduling happens here
+        env = {**os.environ, "SHIFT_SCHEDULE": "0"}
+        self._child = subprocess.Popen(
+            [sys.executable, "-m", "autoshift.auto", *args], env=env
+        )
+        try:
+            return self._child.wait()
+        finally:
+            self._child = None
+
+    def run_once(self):
+        started = time.monotonic()
+        code = self.run_cli("schedule", *self.args)
+        if code:
+            _L.warning(f"Run failed with exit code {code}")
+
+        # in a child process as well, so the memory of vacuuming and archiving is
+        # handed back afterwards. It doesn't talk to SHiFT, a failed run doesn't
+        # keep it from running
+        if self.maintenance and (
+            self._last_maintenance is None
+            or time.monotonic() - self._last_maintenance >= self.maintenance * 3600
+        ):
+            self._last_maintenance = time.monotonic()
+            if code := self.run_cli("maintenance"):
+                _L.warning(f"Maintenance failed with exit code {code}")
+
+        resident = rss()
+        _L.info(
+            f"Run took {time.monotonic() - started:.0f}s "
+            f"(peak of runs {peak_rss(children=True):.1f} MiB, "
+            f"resident {resident:.1f} MiB)"
+        )
+        if resident > self.budget:
+            _L.warning(f"Resident memory over budget ({self.budget:g} MiB)")
+
+    def loop(self):
+        while not self.stopped.is_set():
+            self.run_once()
+            if not self.schedule:
+                return
+            hours, mins = divmod(self.schedule, 60)
+            _L.info(f"Next run in {hours:02}:{mins:02} hours")
+            self.stopped.wait(self.schedule * 60)
+        _L.info("Goodbye.")
+
+
+def check(budget: float) -> int:
+    """Exit code 1 if the resident memory after startup exceeds `budget` MiB
+
+    or if one of the heavy dependencies got imported"""
+    read_settings()
+    resident = rss()
+    print(f"resident {resident:.1f} MiB (budget {budget:g} MiB)")
+    failed = False
+    if heavy := [name for name in HEAVY if name in sys.modules]:
+        print(f"imported on startup: {', '.join(heavy)}", file=sys.stderr)
+        failed = True
+    if resident > budget:
+        print(f"over budget by {resident - budget:.1f} MiB", file=sys.stderr)
+        failed = True
+    return int(failed)
+
+
+def main(argv: list[str] | None = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Redeem SHiFT codes every SHIFT_SCHEDULE minutes with minimal memory",
+        epilog="All other arguments are passed on to `autoshift schedule`",
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="Check the resident memory after startup"
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=RSS_BUDGET,
+        help="Resident memory budget between runs (MiB)",
+    )
+    options, args = parser.parse_known_args(argv)
+    if options.check:
+        return check(options.budget)
+
+    values = read_settings()
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)-8s %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        level=values.get("SHIFT_LOG_LEVEL", "WARNING"),
+    )
+    # the runner reports its own progress
+    _L.setLevel(logging.INFO)
+
+    runner = Runner(
+        args,
+        int_setting(values, "SHIFT_SCHEDULE", 120),
+        int_setting(values, "SHIFT_MAINTENANCE", 24),
+        options.budget,
+    )
+    signal.signal(signal.SIGTERM, runner.stop)
+    try:
+        runner.loop()
+    except KeyboardInterrupt:
+        runner.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Log output of the TUI
+
+Lines are kept in a fixed-capacity ring buffer (the oldest ones are dropped)
+and only the visible lines are rendered, so writing stays cheap no matter how
+long the log gets. Writes are collected and applied once per frame.
+
+`write` is thread-safe. Log records of any thread are streamed into the view by
+`LogViewHandler`, and output printed while the app runs ends up there as well
+(see `App.begin_capture_print`).
+
+The view can be filtered by minimum level and a (case-insensitive) search term.
+Filtering keeps a list of the matching lines, so scrolling through a filtered
+log is as cheap as through the full one."""
+
+import logging
+from collections.abc import Iterator
+from dataclasses import dataclass
+from logging.handlers import QueueHandler
+from queue import Empty, SimpleQueue
+from typing import cast, override
+
+from rich.cells import cell_len
+from rich.style import Style
+from rich.text import Text
+from textual import events
+from textual.geometry import Size
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+
+DEFAULT_CAPACITY = 100_000
+
+LEVEL_STYLES = {
+    logging.DEBUG: Style(dim=True),
+    logging.INFO: Style(),
+    logging.WARNING: Style(color="yellow"),
+    logging.ERROR: Style(color="red"),
+    logging.CRITICAL: Style(color="red", bold=True),
+}
+
+SEARCH_STYLE = Style(reverse=True)
+
+
+@dataclass(slots=True)
+class LogLine:
+    seq: int
+    level: int
+    text: str
+
+
+class RingBuffer[T]:
+    """List of at most `capacity` items, dropping the oldest ones"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items: list[T | None] = [None] * capacity
+        self._start = 0
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, index: int) -> T:
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        return cast(T, self._items[(self._start + index) % self.capacity])
+
+    def __iter__(self) -> Iterator[T]:
+        for index in range(self._len):
+            yield self[index]
+
+    def append(self, item: T) -> T | None:
+        """Append `item`. Returns the dropped item if the buffer was full"""
+        end = (self._start + self._len) % self.capacity
+        dropped = self._items[end] if self._len == self.capacity else None
+        self._items[end] = item
+        if dropped is None:
+            self._len += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+        return dropped
+
+    def clear(self):
+        self._items = [None] * self.capacity
+        self._start = self._len = 0
+
+
+class LogView(ScrollView, can_focus=True):
+    """Virtual log widget backed by a `RingBuffer`"""
+
+    DEFAULT_CSS = """
+    LogView {
+        background: $surface;
+        color: $text;
+        overflow: scroll;
+    }
+    """
+
+    # pending writes are applied at most this often
+    FLUSH_INTERVAL = 1 / 30
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_CAPACITY,
+        *,
+        name: str | None = None,
+        id: str | None = None,
+        classes: str | None = None,
+    ):
+        super().__init__(name=name, id=id, classes=classes)
+        self.lines = RingBuffer[LogLine](capacity)
+        self.min_level = logging.NOTSET
+        self.search = ""
+        self._seq = 0
+        self._width = 0
+        # (level, text) written by any thread since the last frame
+        self.inbox: SimpleQueue[tuple[int, str]] = SimpleQueue()
+        # sequence numbers of the lines matching the filter (None: no filter).
+        # `_dropped` of them were already dropped from the buffer
+        self._matches: list[int] | None = None
+        self._dropped = 0
+
+    def on_mount(self):
+        self.set_interval(self.FLUSH_INTERVAL, self.flush)
+
+    def write(self, text: str, level: int = logging.INFO):
+        """Add `text` (may span multiple lines) with the next frame"""
+        self.inbox.put((level, text))
+
+    def on_print(self, event: events.Print):
+        # `print` writes the line ending separately
+        if text := event.text.rstrip("\n"):
+            self.write(text, logging.ERROR if event.stderr else logging.INFO)
+
+    def clear(self):
+        self.lines.clear()
+        self._width = 0
+        if self._matches is not None:
+            self._matches.clear()
+        self._dropped = 0
+        self._update_size()
+        self.refresh()
+
+    def set_filter(self, min_level: int = logging.NOTSET, search: str = ""):
+        """Only show lines of at least `min_level` containing `search`"""
+        self.min_level = min_level
+        self.search = search.lower()
+        if min_level <= logging.NOTSET and not search:
+            self._matches = None
+        else:
+            self._matches = [line.seq for line in self.lines if self._match(line)]
+        self._dropped = 0
+        self._update_size()
+        self.scroll_end(animate=False, immediate=True, x_axis=False)
+        self.refresh()
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines matching the filter"""
+        if self._matches is None:
+            return len(self.lines)
+        return len(self._matches) - self._dropped
+
+    def flush(self):
+        """Apply pending writes"""
+        pending: list[tuple[int, str]] = []
+        try:
+            while True:
+                pending.append(self.inbox.get_nowait())
+        except Empty:
+            pass
+        if not pending:
+            return
+        follow = self.is_vertical_scroll_end
+
+        for level, text in pending:
+            for part in text.splitlines() or [""]:
+                self._append(level, part)
+
+        if self._matches is not None and self._dropped > len(self._matches) // 2:
+            del self._matches[: self._dropped]
+            self._dropped = 0
+
+        self._update_size()
+        if follow and not self.is_vertical_scrollbar_grabbed:
+            self.scroll_end(animate=False, immediate=True, x_axis=False)
+        self.refresh()
+
+    def _append(self, level: int, text: str):
+        line = LogLine(self._seq, level, text)
+        self._seq += 1
+        self._width = max(self._width, cell_len(text))
+        dropped = self.lines.append(line)
+        if self._matches is None:
+            return
+        if (
+            dropped
+            and self._dropped < len(self._matches)
+            and self._matches[self._dropped] == dropped.seq
+        ):
+            self._dropped += 1
+        if self._match(line):
+            self._matches.append(line.seq)
+
+    def _match(self, line: LogLine) -> bool:
+        return line.level >= self.min_level and (
+            not self.search or self.search in line.text.lower()
+        )
+
+    def _update_size(self):
+        self.virtual_size = Size(self._width, self.line_count)
+
+    def _line_at(self, y: int) -> LogLine:
+        if self._matches is None:
+            return self.lines[y]
+        first_seq = self._seq - len(self.lines)
+        return self.lines[self._matches[self._dropped + y] - first_seq]
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, scroll_y = self.scroll_offset
+        width = self.scrollable_content_region.width
+        rich_style = self.rich_style
+        y += scroll_y
+        if y >= self.line_count:
+            return Strip.blank(width, rich_style)
+
+        line = self._line_at(y)
+        text = Text(line.text, style=rich_style, no_wrap=True, end="")
+        text.stylize(LEVEL_STYLES.get(line.level, Style()))
+        if self.search:
+            text.highlight_words([self.search], SEARCH_STYLE, case_sensitive=False)
+        strip = Strip(text.render(self.app.console), cell_len(line.text))
+        return strip.crop_extend(scroll_x, scroll_x + width, rich_style)
+
+
+class LogViewHandler(QueueHandler):
+    """Streams log records of any thread into a `LogView`
+
+    Emitting only puts the formatted message into the view's inbox, so worker
+    threads never touch the UI and the view picks it up with its next frame."""
+
+    def __init__(self, view: LogView):
+        super().__init__(cast(SimpleQueue, view.inbox))
+
+    @override
+    def prepare(self, record: logging.LogRecord) -> tuple[int, str]:  # pyright: ignore[reportIncompatibleMethodOverride]
+        return record.levelno, self.format(record)
@@ -0,0 +1,108 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Database maintenance: keep the hot `keys` table small on long-lived installs"""
+
+from datetime import UTC, datetime, timedelta
+from typing import cast
+
+import peewee as pw
+
+from autoshift.common import _L, settings
+from autoshift.storage import col, database
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def archive_keys(days: int) -> int:
+    """Move expired keys older than `days` to the archive
+
+    Only the key's own state counts, not whether the known accounts redeemed it:
+    accounts added later still get every key that is valid.
+    Returns the number of archived keys"""
+    from autoshift.models import ArchivedKey, Key, Redemption
+
+    now = datetime.now(UTC)
+    cutoff = now - timedelta(days=days)
+
+    cold = cast(pw.Select, Key.select(Key.id)).where(
+        (Key.added < cutoff) & ((Key.expired == True) | (Key.expires < now))  # noqa: E712
+    )
+
+    names = Key._meta.sorted_field_names
+    archived = int(now.timestamp())
+    with database.atomic():
+        key_ids = [key_id for (key_id,) in cold.tuples()]
+        for batch in pw.chunked(key_ids, 500):
+            ArchivedKey.insert_from(
+                cast(
+                    pw.Select,
+                    Key.select(
+                        *(getattr(Key, name) for name in names), pw.Value(archived)
+                    ),
+                ).where(col(Key.id).in_(batch)),
+                [*(getattr(ArchivedKey, name) for name in names), ArchivedKey.archived],
+            ).on_conflict_ignore().execute()
+            Redemption.delete().where(col(Redemption.key).in_(batch)).execute()
+            Key.delete().where(col(Key.id).in_(batch)).execute()
+
+    return len(key_ids)
+
+
+def db_size() -> int:
+    """Size of the database in bytes (without free pages)"""
+    page_size = database.pragma("page_size")
+    return (database.pragma("page_count") - database.pragma("freelist_count")) * page_size
+
+
+def optimize():
+    """Refresh query planner statistics and give free pages back to the OS"""
+    if not database.table_exists("sqlite_stat1"):
+        database.execute_sql("ANALYZE")
+    else:
+        database.pragma("optimize")
+
+    if database.pragma("auto_vacuum") != AUTO_VACUUM_INCREMENTAL:
+        # one-time conversion of databases created before incremental vacuum
+        _L.info("Enabling incremental vacuum (this may take a moment)")
+        database.pragma("auto_vacuum", "INCREMENTAL")
+        database.execute_sql("VACUUM")
+
+    freed = database.pragma("freelist_count")
+    database.execute_sql("PRAGMA incremental_vacuum")
+    return freed
+
+
+def run_maintenance(days: int | None = None):
+    """Archive cold keys and optimize the database"""
+    days = days if days is not None else settings.ARCHIVE_DAYS
+    if database.is_closed():
+        database.connect()
+
+    size_before = db_size()
+    num_archived = archive_keys(days) if days is not None else 0
+    freed_pages = optimize()
+
+    _L.info(
+        f"Database maintenance: archived {num_archived or 'no'} keys, "
+        f"freed {freed_pages} pages "
+        f"({size_before / 1024:.0f} KiB -> {db_size() / 1024:.0f} KiB)"
+    )
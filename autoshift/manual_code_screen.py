@@ -5,7 +5,6 @@ from textual.screen import ModalScreen
 from textual.widgets import Button, Input, Label, Static
 
 from autoshift.shift import ShiftClient, Status
-from autoshift.models import Key
 
 
 class ManualCodeScreen(ModalScreen[str]):
@@ -71,22 +70,16 @@ class ManualCodeScreen(ModalScreen[str]):
 
 
 def redeem_single_code(code: str, platform: str) -> str:
-    """Redeem a single code directly."""
-    from autoshift.common import settings
-    from autoshift.shift import ShiftClient
+    """Redeem a single code with the session shared by all jobs."""
+    from autoshift import storage
+    from autoshift.auto import redeem, stored_key
 
-    client = ShiftClient()
-    # Login first
-    client.login(settings.USER, settings.PASS.get_secret_value() if settings.PASS else None)
+    with storage.database.connection_context():
+        key = stored_key(code, platform)
+        if storage.is_redeemed(key):
+            return "You already redeemed that code."
 
-    # Create a temporary key object
-    temp_key = Key(
-        code=code,
-        platform=platform,
-        game="UNKNOWN",
-    )
+        # Redeem the code (logs in if needed and waits for redemptions of other jobs)
+        status = redeem(key)
 
-    # Redeem the code
-    status = client.redeem(temp_key)
-
-    return str(status.msg)  # Return the status message
\ No newline at end of file
+    return str(status.msg)  # Return the status message
@@ -0,0 +1,233 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Prometheus metrics of the redemption and ingestion hot paths
+
+Metrics are only recorded if `SHIFT_METRICS` or `SHIFT_METRICS_FILE` is set.
+Otherwise every call returns right away.
+
+They are served at `/metrics` of the daemon's control API (`SHIFT_API_PORT`)
+and written to `SHIFT_METRICS_FILE` at the end of every run, e.g. for the
+node_exporter textfile collector."""
+
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from functools import wraps
+
+from autoshift import jobs
+from autoshift.common import settings
+
+
+def enabled() -> bool:
+    return settings.METRICS or settings.METRICS_FILE is not None
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+type Labels = tuple[str, ...]
+
+_registry: list["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict[str, object]) -> Labels:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _labels(self, key: Labels, **extra: str) -> str:
+        pairs = [*zip(self.label_names, key), *extra.items()]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self.samples()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: object):
+        if not enabled():
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{self._labels(key)} {value}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = sorted(buckets)
+        # per label set: counts per bucket (+Inf last), sum
+        self._values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: object):
+        if not enabled():
+            return
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    def time(self, **labels: object) -> AbstractContextManager:
+        """Observe the duration of a `with` block"""
+        if not enabled():
+            return nullcontext()
+        return self._time(labels)
+
+    @contextmanager
+    def _time(self, labels: dict[str, object]) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [
+                (key, list(counts), total[0])
+                for key, (counts, total) in self._values.items()
+            ]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                yield f"{self.name}_bucket{self._labels(key, le=str(bound))} {cumulative}"
+            yield f"{self.name}_sum{self._labels(key)} {total}"
+            yield f"{self.name}_count{self._labels(key)} {cumulative}"
+
+
+redemptions = Counter(
+    "autoshift_redemptions_total",
+    "Redemption attempts by resulting status",
+    ["status", "game", "platform"],
+)
+http_seconds = Histogram(
+    "autoshift_http_request_seconds",
+    "Latency of SHiFT website requests by redemption phase",
+    ["phase"],
+)
+sleep_seconds = Counter(
+    "autoshift_ratelimit_sleep_seconds_total",
+    "Time spent waiting to prevent or recover from rate limiting",
+    ["reason"],
+)
+ingested_keys = Counter(
+    "autoshift_ingested_keys_total",
+    "New keys inserted from SHIFT_SOURCE",
+)
+ingest_seconds = Histogram(
+    "autoshift_ingest_seconds",
+    "Duration of fetching and storing SHIFT_SOURCE",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+db_write_seconds = Histogram(
+    "autoshift_db_write_seconds",
+    "Latency of database writes",
+    ["op"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+
+def db_write[**P, R](func: Callable[P, R]) -> Callable[P, R]:
+    """Observe the latency of a database write function"""
+
+    @wraps(func)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        if not enabled():
+            return func(*args, **kwargs)
+        with db_write_seconds.time(op=func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def sleep(seconds: float, reason: str):
+    """`jobs.sleep` that accounts for the time spent"""
+    start = time.monotonic()
+    try:
+        jobs.sleep(seconds)
+    except jobs.Cancelled:
+        sleep_seconds.inc(time.monotonic() - start, reason=reason)
+        raise
+    sleep_seconds.inc(seconds, reason=reason)
+
+
+def render() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+def write_textfile():
+    """Write all metrics to `SHIFT_METRICS_FILE` (if set)"""
+    if not (enabled() and settings.METRICS_FILE):
+        return
+    # write atomically: collectors may read the file at any time
+    tmp = settings.METRICS_FILE.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(render())
+    os.replace(tmp, settings.METRICS_FILE)
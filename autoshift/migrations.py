@@ -20,6 +20,7 @@
 #
 #############################################################################
 from collections.abc import Callable
+from datetime import UTC, datetime
 from functools import wraps
 from typing import Any
 
@@ -27,7 +28,7 @@ import peewee as pw
 from peewee import Context, SqliteDatabase
 from playhouse.migrate import SqliteMigrator, migrate, operation
 
-from autoshift.common import _L
+from autoshift.common import _L, settings
 
 
 class ShiftMigrator(SqliteMigrator):
@@ -63,11 +64,13 @@ def revision(func: MigrationFunc):
 def run_migrations(db: SqliteDatabase):
     current_version = db.user_version
     if current_version == 0:
-        from autoshift.models import Key
+        from autoshift.models import Account, ArchivedKey, Key, Redemption
 
         # skip the whole migration if the db is new
         # and just create the tables
-        db.create_tables([Key], safe=True)
+        # (incremental vacuum has to be enabled before creating any table)
+        db.pragma("auto_vacuum", "INCREMENTAL")
+        db.create_tables([Key, ArchivedKey, Account, Redemption], safe=True)
         db.user_version = len(migrationFunctions)
         return
 
@@ -116,3 +119,95 @@ def update_2(ops: ShiftMigrator):
     yield ops.add_index("keys", ["code"])
     # codes are unique
     yield ops.add_unique("keys", "code", "game", "platform")
+
+
+@revision
+def update_3(ops: ShiftMigrator):
+    ## per-account redemption state
+    yield ops.execute(
+        pw.SQL(
+            'CREATE TABLE IF NOT EXISTS "accounts" ('
+            '"id" INTEGER NOT NULL PRIMARY KEY, "name" VARCHAR(255) NOT NULL)'
+        )
+    )
+    yield ops.add_index("accounts", ["name"], unique=True)
+    yield ops.execute(
+        pw.SQL(
+            'CREATE TABLE IF NOT EXISTS "redemptions" ('
+            '"id" INTEGER NOT NULL PRIMARY KEY, '
+            '"account_id" INTEGER NOT NULL, '
+            '"key_id" INTEGER NOT NULL, '
+            '"redeemed" INTEGER NOT NULL, '
+            '"redeemed_at" INTEGER, '
+            'FOREIGN KEY ("account_id") REFERENCES "accounts" ("id") ON DELETE CASCADE, '
+            'FOREIGN KEY ("key_id") REFERENCES "keys" ("id") ON DELETE CASCADE)'
+        )
+    )
+    yield ops.add_index("redemptions", ["account_id"])
+    yield ops.add_index("redemptions", ["key_id"])
+    yield ops.add_index("redemptions", ["account_id", "key_id"], unique=True)
+
+    ## move the global `redeemed` flag to the configured account
+    yield ops.execute(
+        pw.SQL('INSERT INTO "accounts" ("name") VALUES (?)', [settings.ACCOUNT])
+    )
+    yield ops.execute(
+        pw.SQL(
+            'INSERT INTO "redemptions" ("account_id", "key_id", "redeemed") '
+            'SELECT "accounts"."id", "keys"."id", 1 FROM "keys", "accounts" '
+            'WHERE "keys"."redeemed" AND "accounts"."name" = ?',
+            [settings.ACCOUNT],
+        )
+    )
+    yield ops.drop_column("keys", "redeemed")
+
+
+@revision
+def update_4(ops: ShiftMigrator):
+    ## leases for worker processes sharing the database
+    claimed_by = pw.CharField(null=True, default=None)
+    yield ops.add_column("redemptions", "claimed_by", claimed_by)
+    lease_expires = pw.TimestampField(utc=True, null=True, default=None)
+    yield ops.add_column("redemptions", "lease_expires", lease_expires)
+
+    yield ops.add_index("redemptions", ["claimed_by"])
+
+
+@revision
+def update_5(ops: ShiftMigrator):
+    ## age of keys for the database maintenance
+    added = pw.TimestampField(utc=True, default=lambda: datetime.now(UTC))
+    yield ops.add_column("keys", "added", added)
+
+    ## archive for cold keys
+    yield ops.execute(
+        pw.SQL(
+            'CREATE TABLE IF NOT EXISTS "keys_archive" ('
+            '"id" INTEGER NOT NULL PRIMARY KEY, '
+            '"code" VARCHAR(255) NOT NULL, '
+            '"game" VARCHAR(255) NOT NULL, '
+            '"platform" VARCHAR(255) NOT NULL, '
+            '"reward" VARCHAR(255) NOT NULL, '
+            '"num_golden" INTEGER, '
+            '"expires" INTEGER, '
+            '"expired" INTEGER NOT NULL, '
+            '"added" INTEGER NOT NULL, '
+            '"archived" INTEGER NOT NULL)'
+        )
+    )
+    yield ops.add_index("keys_archive", ["code", "platform", "game"], unique=True)
+
+
+@revision
+def update_6(ops: ShiftMigrator):
+    ## write-ahead journal of submitted redemptions
+    submitted_at = pw.TimestampField(utc=True, null=True, default=None)
+    yield ops.add_column("redemptions", "submitted_at", submitted_at)
+
+
+@revision
+def update_7(ops: ShiftMigrator):
+    ## indexes for browsing keys
+    yield ops.add_index("keys", ["game", "platform"])
+    yield ops.add_index("keys", ["added"])
+    yield ops.add_index("keys", ["reward"])
@@ -20,15 +20,12 @@
 #
 #############################################################################
 
-from enum import Enum, StrEnum, auto
+from datetime import UTC, datetime
+from enum import Enum
 from typing import TYPE_CHECKING, Any, ClassVar, override
 
 from peewee import (
-    AutoField,
-    IntegerField,
-    Metadata,
-    Model,
-    TimestampField,
+    AutoField as PAutoField,
 )
 from peewee import (
     BooleanField as PBooleanField,
@@ -36,22 +33,36 @@ from peewee import (
 from peewee import (
     CharField as PCharField,
 )
+from peewee import (
+    ForeignKeyField,
+    IntegerField,
+    Metadata,
+    Model,
+    TimestampField,
+)
 
+from autoshift.common import Game, Platform
 from autoshift.storage import database
 
 if TYPE_CHECKING:
 
+    def AutoField(*args, **kwargs) -> Any: ...
     def CharField(max_length: int = ..., *args, **kwargs) -> Any: ...
     def BooleanField(*args, **kwargs) -> Any: ...
 
     EnumField = CharField
 else:
+    AutoField = PAutoField
     CharField = PCharField
     BooleanField = PBooleanField
 
     class EnumField(PCharField):
         def __set_name__(self, cls, value: str) -> None:
-            self.enum_class = cls.__annotations__[value]
+            # inherited fields are annotated on one of the base classes
+            for klass in cls.__mro__:
+                if value in (annotations := klass.__dict__.get("__annotations__", {})):
+                    self.enum_class = annotations[value]
+                    return
 
         def db_value(self, value: Enum | None) -> Any:
             if value is None:
@@ -65,40 +76,8 @@ else:
             return self.enum_class(value)
 
 
-class AltEnum(StrEnum):
-    def __init__(self, name: str, *json_names: str):
-        super().__init__()
-        self.long_name = json_names[0] if json_names else name
-
-    def __new__(cls, value: str, *json_names: str):
-        obj = str.__new__(cls, value)
-        obj._value_ = value
-        obj.long_name = json_names[0] if json_names else value
-        for alias in json_names:
-            cls._value2member_map_[alias.lower()] = obj
-        return obj
-
-    @classmethod
-    def _missing_(cls, value):
-        return cls._value2member_map_.get(str(value).lower())
-
-
-class Game(AltEnum):
-    bl1 = auto(), "Borderlands: Game of the Year Edition", "Borderlands 1"
-    bl2 = auto(), "Borderlands 2"
-    bl3 = auto(), "Borderlands 3"
-    bl4 = auto(), "Borderlands 4"
-    blps = auto(), "Borderlands The Pre-Sequel"
-    ttw = auto(), "Tiny Tina's Wonderlands"
-    gdfll = auto(), "Godfall"
-    UNKNOWN = auto(), "Unknown"
-
-
-class Platform(AltEnum):
-    steam = auto()
-    epic = auto()
-    psn = auto(), "playstation"
-    xboxlive = auto(), "xbox"
+def utcnow() -> datetime:
+    return datetime.now(UTC)
 
 
 class BaseModel(Model):
@@ -111,7 +90,7 @@ class BaseModel(Model):
 class Key(BaseModel):
     """Model for SHiFT keys."""
 
-    id = AutoField()
+    id: int = AutoField()
     code: str = CharField()
     game: Game = EnumField(choices=list(Game))
     platform: Platform = EnumField(choices=list(Platform))
@@ -119,13 +98,17 @@ class Key(BaseModel):
     num_golden = IntegerField(null=True, default=None)
     expires = TimestampField(utc=True, null=True, default=None)
     expired: bool = BooleanField(default=False)
-    redeemed: bool = BooleanField(default=False)
+    added = TimestampField(utc=True, default=utcnow)
 
     class Meta:  # pyright: ignore[reportIncompatibleVariableOverride]
         table_name = "keys"
         indexes = (
             # Unique constraint on code, platform, game combination
             (("code", "platform", "game"), True),
+            # filtering, counting and sorting in the key browser
+            (("game", "platform"), False),
+            (("added",), False),
+            (("reward",), False),
         )
 
     def copy(self) -> "Key":
@@ -149,4 +132,56 @@ class Key(BaseModel):
         return super().__setattr__(name, value)
 
     def __repr__(self) -> str:
-        return f"<Key game={self.game} platform={self.platform} code={self.code} redeemed={self.redeemed} reward={self.reward}>"
+        return f"<Key game={self.game} platform={self.platform} code={self.code} expired={self.expired} reward={self.reward}>"
+
+
+class ArchivedKey(Key):
+    """Cold keys moved out of the `keys` table by the database maintenance.
+
+    Archived keys are never redeemed again but still prevent re-ingesting them."""
+
+    archived = TimestampField(utc=True, default=utcnow)
+
+    class Meta:  # pyright: ignore[reportIncompatibleVariableOverride]
+        table_name = "keys_archive"
+
+
+class Account(BaseModel):
+    """Model for SHiFT accounts sharing the same key catalog."""
+
+    id: int = AutoField()
+    name: str = CharField(unique=True)
+
+    class Meta:  # pyright: ignore[reportIncompatibleVariableOverride]
+        table_name = "accounts"
+
+    def __repr__(self) -> str:
+        return f"<Account name={self.name}>"
+
+
+class Redemption(BaseModel):
+    """Redemption state of a key for a single account."""
+
+    id: int = AutoField()
+    account = ForeignKeyField(Account, backref="redemptions", on_delete="CASCADE")
+    key = ForeignKeyField(Key, backref="redemptions", on_delete="CASCADE")
+    # ids of the foreign keys, accessing them doesn't query the related rows
+    account_id: int
+    key_id: int
+    redeemed: bool = BooleanField(default=False)
+    redeemed_at = TimestampField(utc=True, null=True, default=None)
+    # work claims of worker processes sharing the database
+    claimed_by: str | None = CharField(null=True, default=None, index=True)
+    lease_expires = TimestampField(utc=True, null=True, default=None)
+    # write-ahead journal: set while a redemption is submitted but not resolved
+    submitted_at = TimestampField(utc=True, null=True, default=None)
+
+    class Meta:  # pyright: ignore[reportIncompatibleVariableOverride]
+        table_name = "redemptions"
+        indexes = (
+            # one state per account and key
+            (("account", "key"), True),
+        )
+
+    def __repr__(self) -> str:
+        return f"<Redemption account={self.account_id} key={self.key_id} redeemed={self.redeemed}>"
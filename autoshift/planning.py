@@ -0,0 +1,189 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Predict a redemption cycle without redeeming anything (`autoshift plan`)
+
+Replays the redemption loop of `auto.redeem_all` in memory: keys in claim
+order, a pause after every `BURST` keys, at most `LIMIT` keys per cycle (like
+`redeem_all` and the daemon) and the hourly quota as observed by
+`quota.QuotaTracker`. Every key is assumed to redeem successfully, which uses
+up the quota the fastest. Nothing is sent to SHiFT, request durations are
+estimated."""
+
+from collections import Counter, deque
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from autoshift.auto import BURST, BURST_PAUSE
+from autoshift.models import Key
+from autoshift.quota import MARGIN, WINDOW, QuotaTracker, now
+
+# requests of one key by phase (see `ShiftClient.redeem`), assuming the
+# redemption status is there on the first poll
+REDEEM_REQUESTS = {"token": 1, "entitlement": 1, "submit": 1, "status": 1}
+# looking up the redemption form of an unresolved submission
+VERIFY_REQUESTS = {"token": 1, "entitlement": 1}
+# checking the saved session, a full login needs a token and the login itself
+LOGIN_REQUESTS = 1
+FULL_LOGIN_REQUESTS = 2
+
+# estimated duration of one request (seconds)
+REQUEST_SECONDS = 0.5
+
+
+@dataclass
+class Plan:
+    started: datetime
+    # keys in the order they get redeemed
+    keys: list[Key]
+    requests: Counter[str] = field(default_factory=Counter)
+    pauses: int = 0
+    # predicted wall time (seconds)
+    seconds: float = 0
+    redeemed: int = 0
+    # left for later cycles
+    outside_quota: list[Key] = field(default_factory=list)
+    over_limit: list[Key] = field(default_factory=list)
+    # estimated reset of the quota if it gets exhausted
+    resume_at: datetime | None = None
+
+    @property
+    def sleep(self) -> float:
+        return self.pauses * BURST_PAUSE
+
+    @property
+    def finished(self) -> datetime:
+        return self.started + timedelta(seconds=self.seconds)
+
+
+def plan_cycle(
+    keys: Sequence[Key],
+    tracker: QuotaTracker,
+    limit: int,
+    *,
+    unresolved: int = 0,
+    ingest_requests: int = 0,
+    logged_in: bool = True,
+    latency: float = REQUEST_SECONDS,
+    started: datetime | None = None,
+) -> Plan:
+    """Simulate one cycle of `auto.main` for `keys` (see `storage.get_keys`)
+
+    `logged_in` tells whether there is a saved session to check instead of
+    logging in with the credentials"""
+    keys = sorted(keys, key=lambda key: key.id)
+    plan = Plan(started or now(), keys[:limit], over_limit=keys[limit:])
+    plan.requests["ingest"] = ingest_requests
+
+    if tracker.reset_at and tracker.reset_at > plan.started:
+        # `redeem_all` doesn't even log in
+        plan.outside_quota, plan.resume_at = plan.keys, tracker.reset_at
+        plan.seconds = ingest_requests * latency
+        return plan
+
+    if plan.keys or unresolved:
+        plan.requests["login"] = LOGIN_REQUESTS if logged_in else FULL_LOGIN_REQUESTS
+    for phase, n in VERIFY_REQUESTS.items():
+        plan.requests[phase] += unresolved * n
+    elapsed = plan.requests.total() * latency
+
+    # successful redemptions within the last `WINDOW`
+    window = deque(sorted(d for d in tracker.redemptions if d > plan.started - WINDOW))
+    for i, key in enumerate(plan.keys):
+        if i and not i % BURST:
+            plan.pauses += 1
+            elapsed += BURST_PAUSE
+        at = plan.started + timedelta(seconds=elapsed)
+        while window and window[0] <= at - WINDOW:
+            window.popleft()
+
+        plan.requests.update(REDEEM_REQUESTS)
+        elapsed += sum(REDEEM_REQUESTS.values()) * latency
+        if tracker.limit is not None and len(window) >= tracker.limit:
+            # TRYLATER ends the cycle
+            plan.outside_quota = plan.keys[i:]
+            plan.resume_at = window[0] + WINDOW + MARGIN if window else at + WINDOW
+            break
+        window.append(at)
+        plan.redeemed += 1
+
+    plan.seconds = elapsed
+    return plan
+
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+
+def _by_code(keys: Iterable[Key]) -> list[str]:
+    """One line per code with all its platforms"""
+    codes: dict[str, list[Key]] = {}
+    for key in keys:
+        codes.setdefault(key.code, []).append(key)
+    return [
+        f"  {code}  {same[0].game.name:6} "
+        f"{', '.join(key.platform.name for key in same):24} {same[0].reward}".rstrip()
+        for code, same in codes.items()
+    ]
+
+
+def render(plan: Plan, tracker: QuotaTracker, limit: int, latency: float) -> str:
+    lines = [
+        f"{len(plan.keys)} keys ({len({key.code for key in plan.keys})} codes) "
+        f"to redeem this cycle"
+    ]
+
+    lines += ["", "Requests by phase:"]
+    lines += [f"  {phase:12} {n:6}" for phase, n in plan.requests.items() if n]
+    lines.append(f"  {'total':12} {plan.requests.total():6}")
+
+    lines += [
+        "",
+        f"Sleep:     {_duration(plan.sleep)} ({plan.pauses} x {BURST_PAUSE}s, "
+        f"after every {BURST} keys)",
+        f"Duration:  {_duration(plan.seconds)} (assuming {latency:g}s per request)",
+        f"Done at:   {plan.finished.astimezone():%Y-%m-%d %H:%M}",
+    ]
+
+    if tracker.limit is None:
+        lines.append("Quota:     not exhausted yet, limit unknown")
+    else:
+        lines.append(
+            f"Quota:     {tracker.limit} redemptions per hour (last observed), "
+            f"{plan.redeemed} keys fit"
+        )
+    if plan.outside_quota:
+        resume_at = plan.resume_at or plan.finished
+        lines += [
+            "",
+            f"Outside the quota window, resuming around {resume_at.astimezone():%H:%M}:",
+            *_by_code(plan.outside_quota),
+        ]
+    if plan.over_limit:
+        lines += [
+            "",
+            f"Over the LIMIT of {limit} keys per cycle, left for the next one:",
+            *_by_code(plan.over_limit),
+        ]
+    return "\n".join(lines)
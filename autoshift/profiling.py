@@ -0,0 +1,229 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Profile a full ingest and redemption cycle offline
+
+Runs `query_keys` and the redemption loop against a local feed and a fake
+SHiFT website (an httpx mock transport), in a throw-away data directory, so
+neither your database nor your account are touched. All sleeps are virtual.
+
+Writes cProfile and tracemalloc reports to the output directory."""
+
+import cProfile
+import io
+import json
+import pstats
+import random
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from unittest import mock
+
+import httpx
+
+from autoshift.common import Game, Platform, settings
+
+FORM = """\
+<html><head><meta name="csrf-token" content="{token}"></head><body>
+<h2>{game}</h2>
+{forms}
+</body></html>"""
+
+FORM_ENTRY = """\
+<form class="new_archway_code_redemption" id="new_archway_code_redemption" \
+action="/code_redemptions" method="post">
+<input name="authenticity_token" type="hidden" value="{token}">
+<input name="archway_code_redemption[code]" type="hidden" value="{code}">
+<input name="archway_code_redemption[check]" type="hidden" value="{check}">
+<input id="archway_code_redemption_service" name="archway_code_redemption[service]" \
+type="hidden" value="{platform}">
+<input type="submit" value="Redeem for {platform}">
+</form>"""
+
+REWARDS = """\
+<html><head><meta name="csrf-token" content="{token}"></head><body>
+{rewards}
+</body></html>"""
+
+
+class FakeShift:
+    """Minimal stand-in for the SHiFT website
+
+    Most codes redeem successfully, some are expired or already redeemed, and
+    status checks report "in progress" once before returning the result."""
+
+    def __init__(self, seed: int = 0):
+        self.random = random.Random(seed)
+        self.polls: Counter[str] = Counter()
+        self.rewards = REWARDS.format(
+            token="t0k3n",
+            rewards="\n".join(
+                f'<div class="reward_unlocked">Reward {i}</div>' for i in range(200)
+            ),
+        )
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/rewards":
+            return httpx.Response(200, text=self.rewards)
+        if path == "/entitlement_offer_codes":
+            return self.entitlement(request.url.params["code"])
+        if path == "/code_redemptions" and request.method == "POST":
+            location = f"https://{request.url.host}/code_redemptions/{len(self.polls)}"
+            return httpx.Response(302, headers={"location": location})
+        if path.startswith("/code_redemptions/"):
+            self.polls[path] += 1
+            if self.polls[path] < 2:
+                return httpx.Response(200, json={"in_progress": True})
+            return httpx.Response(
+                200, json={"text": "Your code was successfully redeemed"}
+            )
+        return httpx.Response(404)
+
+    def entitlement(self, code: str) -> httpx.Response:
+        roll = self.random.random()
+        if roll < 0.1:
+            return httpx.Response(200, text="This SHiFT code has expired")
+        if roll < 0.2:
+            return httpx.Response(200, text="This SHiFT code has already been redeemed")
+        game, _, _ = code.partition("-")
+        forms = "\n".join(
+            FORM_ENTRY.format(token="t0k3n", code=code, check=i, platform=platform)
+            for i, platform in enumerate(Platform)
+        )
+        return httpx.Response(
+            200, text=FORM.format(token="t0k3n", game=Game(game).long_name, forms=forms)
+        )
+
+
+def fake_feed(num_keys: int, seed: int = 0) -> list[dict]:
+    """Feed in the format of `SHIFT_SOURCE`"""
+    rnd = random.Random(seed)
+    games = [game for game in Game if game != Game.UNKNOWN]
+    codes = []
+    for i in range(num_keys):
+        game = rnd.choice(games)
+        golden = rnd.random() < 0.3
+        codes.append(
+            {
+                "code": f"{game}-{i:05}-{rnd.randrange(16**10):010X}",
+                "game": game.long_name,
+                "platform": rnd.choice(["universal", *Platform]),
+                "reward": f"{rnd.randint(1, 5)} Golden Keys" if golden else "Cosmetic",
+                "archived": "",
+                "expires": "Unknown",
+                "link": "https://example.com",
+            }
+        )
+    return [{"meta": {"version": "0.1"}, "codes": codes}]
+
+
+class VirtualClock:
+    """Replacement for `time.sleep` that only counts the time"""
+
+    def __init__(self):
+        self.slept = 0.0
+
+    def sleep(self, seconds: float):
+        self.slept += seconds
+
+
+def run_profile(feed: Path | None, num_keys: int, output: Path, top: int = 40) -> str:
+    """Profile one cycle and write the reports to `output`. Returns a summary"""
+    from autoshift import auto
+    from autoshift.migrations import run_migrations
+    from autoshift.shift import ShiftClient
+    from autoshift.storage import database
+
+    output.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="autoshift-profile-") as tmp:
+        data_dir = Path(tmp)
+        if feed is None:
+            feed = data_dir / "shiftcodes.json"
+            feed.write_text(json.dumps(fake_feed(num_keys)))
+
+        # throw-away database, quota state and session
+        settings.DATA_DIR = data_dir
+        settings.ACCOUNT = "profile"
+        settings.SHIFT_SOURCE = str(feed)
+        game_map = dict(settings._GAMES_PLATFORM_MAP) or {
+            game: set(Platform) for game in Game
+        }
+        settings._GAMES_PLATFORM_MAP.clear()
+        settings._GAMES_PLATFORM_MAP.update(game_map)
+
+        database.close()
+        database.init(str(data_dir / "keys.db"), timeout=30)
+        database.connect()
+        run_migrations(database)
+
+        client = ShiftClient()
+        client.client = httpx.Client(
+            transport=httpx.MockTransport(FakeShift()), follow_redirects=True
+        )
+        client.logged_in = True
+        auto.client = client
+
+        clock = VirtualClock()
+        stats: Counter[str] = Counter()
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        started = time.perf_counter()
+        with mock.patch("time.sleep", clock.sleep):
+            profiler.enable()
+            try:
+                keys = auto.query_keys(settings._GAMES_PLATFORM_MAP)
+                auto.redeem_all(stats)
+            finally:
+                profiler.disable()
+        elapsed = time.perf_counter() - started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        database.close()
+
+    profiler.dump_stats(output / "profile.prof")
+    with (output / "hotspots.txt").open("w") as f:
+        for sort in (pstats.SortKey.TIME, pstats.SortKey.CUMULATIVE):
+            f.write(f"##### sorted by {sort.value}\n")
+            pstats.Stats(profiler, stream=f).sort_stats(sort).print_stats(top)
+
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    with (output / "allocations.txt").open("w") as f:
+        f.write(f"peak traced memory: {peak / 1024**2:.1f} MiB\n\n")
+        f.write("##### by line\n")
+        for stat in snapshot.statistics("lineno")[:top]:
+            f.write(f"{stat}\n")
+        f.write("\n##### by file\n")
+        for stat in snapshot.statistics("filename")[:top]:
+            f.write(f"{stat}\n")
+
+    summary = io.StringIO()
+    summary.write(
+        f"Profiled {len(keys)} keys ({', '.join(f'{n} {s}' for s, n in stats.items())}) "
+        f"in {elapsed:.2f}s wall time, {clock.slept:.0f}s virtual sleep, "
+        f"peak memory {peak / 1024**2:.1f} MiB\n"
+    )
+    pstats.Stats(profiler, stream=summary).sort_stats(pstats.SortKey.TIME).print_stats(10)
+    summary.write(f"Reports written to {output}\n")
+    return summary.getvalue()
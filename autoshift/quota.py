@@ -0,0 +1,123 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Estimate when the hourly SHiFT redemption quota resets
+
+SHiFT answers with `Status.TRYLATER` once an account redeemed too many codes
+within an hour. We remember successful redemptions of the last hour, so when
+that happens the quota is expected to free up as soon as the oldest of them
+is an hour old. The estimate is persisted per account in `DATA_DIR`."""
+
+import json
+import os
+import threading
+from datetime import UTC, datetime, timedelta
+from functools import cache
+from pathlib import Path
+
+from autoshift.common import _L, settings
+from autoshift.shift import Status
+
+WINDOW = timedelta(hours=1)
+# safety margin added to the estimated reset
+MARGIN = timedelta(minutes=1)
+
+
+def now() -> datetime:
+    return datetime.now(UTC)
+
+
+class QuotaTracker:
+    def __init__(self, path: Path):
+        self.path = path
+        # successful redemptions within the last `WINDOW`
+        self.redemptions: list[datetime] = []
+        # estimated reset of the quota after the last TRYLATER
+        self.reset_at: datetime | None = None
+        # number of redemptions that fit into one window (last observation)
+        self.limit: int | None = None
+        self.load()
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+            self.redemptions = [datetime.fromisoformat(d) for d in data["redemptions"]]
+            self.reset_at = data["reset_at"] and datetime.fromisoformat(data["reset_at"])
+            self.limit = data["limit"]
+        except Exception:
+            _L.warning(f"Could not read quota state from {self.path}. Starting over")
+
+    def save(self):
+        # write atomically: other processes of the account may read it any time
+        tmp = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(
+            json.dumps(
+                dict(
+                    redemptions=[d.isoformat() for d in self.redemptions],
+                    reset_at=self.reset_at and self.reset_at.isoformat(),
+                    limit=self.limit,
+                )
+            )
+        )
+        os.replace(tmp, self.path)
+
+    def prune(self):
+        cutoff = now() - WINDOW
+        self.redemptions = [d for d in self.redemptions if d > cutoff]
+
+    def record(self, status: Status):
+        """Record the result of a redemption attempt"""
+        if status == Status.SUCCESS:
+            self.prune()
+            self.redemptions.append(now())
+            self.reset_at = None
+            self.save()
+        elif status == Status.TRYLATER:
+            self.prune()
+            self.limit = len(self.redemptions)
+            if self.redemptions:
+                self.reset_at = self.redemptions[0] + WINDOW + MARGIN
+            else:
+                # redeemed somewhere else or we lost track
+                self.reset_at = now() + WINDOW
+            self.save()
+            _L.info(
+                f"Quota exhausted after {self.limit} redemptions this hour. "
+                f"Resuming around {self.reset_at.astimezone():%H:%M}"
+            )
+
+    def blocked_until(self) -> datetime | None:
+        """Estimated reset of the quota if it is currently exhausted"""
+        if self.reset_at and self.reset_at > now():
+            return self.reset_at
+        return None
+
+
+@cache
+def _tracker(account: str) -> QuotaTracker:
+    return QuotaTracker(settings.DATA_DIR / f"quota-{account}.json")
+
+
+def get_tracker(account: str | None = None) -> QuotaTracker:
+    """Quota tracker of the given account (default: `settings.ACCOUNT`)"""
+    return _tracker(account or settings.ACCOUNT)
@@ -0,0 +1,136 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Overlap-safe scheduling for the `schedule` command
+
+Every job runs at most once at a time and the next run is scheduled
+`interval` after the previous one *finished*, so long runs can't pile up.
+Late runs are never dropped but coalesced into a single run and logged."""
+
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from typing import Any
+
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, JobEvent
+from apscheduler.schedulers.base import BaseScheduler
+from apscheduler.schedulers.blocking import BlockingScheduler
+
+from autoshift.common import _L
+
+# runs starting later than this are reported
+LATE_THRESHOLD = timedelta(seconds=30)
+
+
+def now() -> datetime:
+    return datetime.now().astimezone()
+
+
+def fmt(delta: timedelta) -> str:
+    minutes, seconds = divmod(int(delta.total_seconds()), 60)
+    return f"{minutes}m{seconds:02}s"
+
+
+def create_scheduler() -> BlockingScheduler:
+    scheduler = BlockingScheduler(
+        job_defaults=dict(
+            # never run the same job concurrently
+            max_instances=1,
+            # run a job once, no matter how many runs were missed
+            coalesce=True,
+            # never drop late runs, or the chain of runs would break
+            misfire_grace_time=None,
+        )
+    )
+    scheduler.add_listener(log_event, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+    return scheduler
+
+
+def log_event(event: JobEvent):
+    scheduled: datetime = getattr(event, "scheduled_run_time", None) or now()
+    if event.code == EVENT_JOB_MAX_INSTANCES:
+        _L.warning(
+            f"Skipped run of '{event.job_id}' scheduled for {scheduled:%H:%M:%S}: "
+            "previous run is still in progress"
+        )
+    else:
+        _L.warning(
+            f"Missed run of '{event.job_id}' scheduled for {scheduled:%H:%M:%S} "
+            f"({fmt(now() - scheduled)} late)"
+        )
+
+
+def schedule_after(
+    scheduler: BaseScheduler,
+    func: Callable[[], Any],
+    interval: timedelta,
+    delay: timedelta | None = None,
+    job_id: str | None = None,
+):
+    """Run `func` after `delay` (default: `interval`), then `interval` after each run
+
+    `func` may return a `datetime` to run again earlier than that, e.g. to resume
+    redeeming as soon as the redemption quota resets."""
+    job_id = job_id or func.__name__
+    run_date = now() + (interval if delay is None else delay)
+    scheduler.add_job(
+        _run,
+        "date",
+        run_date=run_date,
+        args=(scheduler, func, interval, job_id, run_date),
+        id=job_id,
+        name=job_id,
+        replace_existing=True,
+    )
+
+
+def _run(
+    scheduler: BaseScheduler,
+    func: Callable[[], Any],
+    interval: timedelta,
+    job_id: str,
+    scheduled: datetime,
+):
+    started = now()
+    if started - scheduled > LATE_THRESHOLD:
+        _L.warning(
+            f"Run of '{job_id}' scheduled for {scheduled:%H:%M:%S} "
+            f"started {fmt(started - scheduled)} late"
+        )
+
+    run_at = None
+    try:
+        run_at = func()
+    finally:
+        finished = now()
+        duration = finished - started
+        if duration > interval:
+            _L.warning(
+                f"Run of '{job_id}' took {fmt(duration)}, "
+                f"longer than its interval of {fmt(interval)}"
+            )
+        else:
+            _L.debug(f"Run of '{job_id}' took {fmt(duration)}")
+
+        delay = interval
+        if isinstance(run_at, datetime):
+            delay = min(max(run_at - finished, timedelta(0)), interval)
+        schedule_after(scheduler, func, interval, delay=delay, job_id=job_id)
+        _L.info(f"Next run of '{job_id}' at {(finished + delay).astimezone():%H:%M}")
@@ -22,17 +22,21 @@
 
 import pickle
 import time
+from collections.abc import Iterator
+from contextlib import contextmanager
 from enum import Enum
-from typing import Any, Literal
+from typing import TYPE_CHECKING, Any, Literal
 
-import httpx
 import typer
-from bs4 import BeautifulSoup as BSoup
-from bs4 import Tag
 
+from autoshift import metrics, storage, tracing
 from autoshift.common import _L, settings
 from autoshift.models import Key
 
+if TYPE_CHECKING:
+    # imported on first use: they make up most of the startup time otherwise
+    import httpx
+
 base_url = "https://shift.gearboxsoftware.com"
 
 
@@ -40,6 +44,13 @@ def json_headers(token: str) -> dict[str, str]:
     return {"x-csrf-token": token, "x-requested-with": "XMLHttpRequest"}
 
 
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Record the duration of a redemption phase in the metrics and the trace"""
+    with tracing.span(name), metrics.http_seconds.time(phase=name):
+        yield
+
+
 # filthy enum hack with auto convert
 class Status(Enum):
     NONE = "Something unexpected happened.."
@@ -84,11 +95,19 @@ class ShiftClient:
     logged_in: bool = False
 
     def __init__(self):
+        import httpx
+
         # try to load cookies. Query for login data if not present
         self.cookies = self.__load_cookie()
-        self.client = httpx.Client(follow_redirects=True, cookies=self.cookies)
+        self.client = httpx.Client(
+            follow_redirects=True,
+            cookies=self.cookies,
+            event_hooks=tracing.event_hooks(),
+        )
 
     def login(self, user: str | None = None, pw: str | None = None):
+        if self.logged_in:
+            return True
         if self.cookies:
             self.logged_in = self.check_login()
         if self.logged_in:
@@ -126,8 +145,10 @@ class ShiftClient:
                 return True
         return False
 
-    def __load_cookie(self) -> httpx.Cookies | None:
+    def __load_cookie(self) -> "httpx.Cookies | None":
         """Check if there is a saved cookie and load it."""
+        import httpx
+
         if not settings.COOKIE_FILE.exists() or settings.COOKIE_FILE.stat().st_size == 0:
             return None
         try:
@@ -143,62 +164,123 @@ class ShiftClient:
             _L.error("Could not load cookies. Re-login required")
             return None
 
-    def redeem(self, key: Key) -> Status:
-        from time import sleep
-
+    def redeem(self, key: Key, account: str | None = None) -> Status:
+        if key.id is None:
+            # the submission is journaled per key (see `storage.set_submitted`)
+            raise ValueError(f"Can't redeem {key.code}, it isn't stored")
         retry = True
         status = Status.NONE
-        game_longname = key.game.long_name
-
-        while retry:
-            found, status_code, form_data = self.__get_redemption_form(
-                key.code, game_longname, key.platform
-            )
-            # the expired message comes from even wanting to redeem
-            if not found:
-                if status_code >= 500:
-                    # entered key was invalid
-                    status = Status.INVALID
-                elif status_code == 429:
-                    status = Status.SLOWDOWN
-                elif "expired" in form_data:
-                    status = Status.EXPIRED
-                elif "not available" in form_data:
-                    status = Status.INVALID
-                elif "does not exist" in form_data:
-                    status = Status.INVALID
-                elif "already been redeemed" in form_data:
-                    status = Status.REDEEMED
-                else:
-                    # unknown
-                    # _L.error(form_data)
-                    status = Status.UNKNOWN(str(form_data))
-            else:
-                # the key is valid and all.
-                if isinstance(form_data, dict):
-                    status = self.__redeem_form(form_data)
-                else:
-                    status = Status.UNKNOWN(str(form_data))
-
-            if status == Status.SLOWDOWN:
-                sleep(60)
-            else:
-                retry = False
 
-            key.redeemed = status in (Status.SUCCESS, Status.REDEEMED)
-            key.expired = status in (Status.EXPIRED, Status.INVALID)
-            key.save()
+        with tracing.span(
+            "redeem", code=key.code, game=key.game, platform=key.platform
+        ) as trace:
+            # a submission whose outcome isn't known yet
+            in_flight = False
+            try:
+                while retry:
+                    status, form_data = self.__check_code(key)
+                    if form_data is not None:
+                        # the key is valid and all.
+                        # journal the submission first: if we die before the
+                        # outcome is stored, the key is verified instead of being
+                        # submitted again
+                        storage.set_submitted(key, account)
+                        in_flight = True
+                        status = self.__redeem_form(form_data)
+                        in_flight = False
+
+                    if status == Status.SLOWDOWN:
+                        with tracing.span("slowdown"):
+                            metrics.sleep(60, reason="slowdown")
+                    else:
+                        retry = False
+
+                    self.__store_status(key, status, account)
+            except BaseException:
+                # failing (or being cancelled) with a known outcome must not leave
+                # the key to `verify_submitted`, it would never be claimed again
+                if not in_flight:
+                    storage.set_resolved(key, account)
+                raise
+
+            storage.set_resolved(key, account)
+            if trace:
+                trace.attrs["status"] = status.name
+        return status
 
-            if key.expired:
-                # set all keys with the same code as expired
-                (Key.update(expired=True).where(Key.code == key.code).execute())
+    def verify_submitted(self, account: str | None = None) -> int:
+        """Resolve redemptions a crashed process submitted without storing the outcome
+
+        Only looks at the redemption form of those codes, without submitting them.
+        Returns the number of resolved keys"""
+        num_resolved = 0
+        for key in storage.get_unresolved(account):
+            with tracing.span("verify", code=key.code) as trace:
+                status, form_data = self.__check_code(key)
+                if trace:
+                    trace.attrs["status"] = status.name
+            if form_data is not None:
+                # still redeemable: the submission never went through
+                _L.info(f"Redemption of {key.code} didn't go through. Retrying later")
+            elif status in (Status.REDEEMED, Status.EXPIRED, Status.INVALID):
+                _L.info(f"Redemption of {key.code}: {status.name}")
+                self.__store_status(key, status, account)
+            else:
+                _L.warning(f"Could not verify redemption of {key.code}: {status.name}")
+                continue
+            storage.set_resolved(key, account)
+            num_resolved += 1
+        return num_resolved
 
-        return status
+    def __check_code(self, key: Key) -> tuple[Status, dict[str, str] | None]:
+        """Check if `key` can be redeemed without submitting it
 
-    def __get_token(self, url_or_reply: str | httpx.Response) -> tuple[int, str | None]:
+        Returns the form data to submit if so"""
+        found, status_code, form_data = self.__get_redemption_form(
+            key.code, key.game.long_name, key.platform
+        )
+        if found:
+            if isinstance(form_data, dict):
+                return Status.NONE, form_data
+            return Status.UNKNOWN(str(form_data)), None
+
+        # the expired message comes from even wanting to redeem
+        if status_code >= 500:
+            # entered key was invalid
+            return Status.INVALID, None
+        if status_code == 429:
+            return Status.SLOWDOWN, None
+        if "expired" in form_data:
+            return Status.EXPIRED, None
+        if "not available" in form_data:
+            return Status.INVALID, None
+        if "does not exist" in form_data:
+            return Status.INVALID, None
+        if "already been redeemed" in form_data:
+            return Status.REDEEMED, None
+        # unknown
+        # _L.error(form_data)
+        return Status.UNKNOWN(str(form_data)), None
+
+    def __store_status(self, key: Key, status: Status, account: str | None = None):
+        key.expired = status in (Status.EXPIRED, Status.INVALID)
+        key.save()
+
+        if status in (Status.SUCCESS, Status.REDEEMED):
+            storage.set_redeemed(key, account)
+
+        if key.expired:
+            # set all keys with the same code as expired
+            (Key.update(expired=True).where(Key.code == key.code).execute())
+
+    def __get_token(self, url_or_reply: "str | httpx.Response") -> tuple[int, str | None]:
         """Get CSRF-Token from given URL"""
+        from bs4 import BeautifulSoup as BSoup
+        from bs4 import Tag
+
         if isinstance(url_or_reply, str):
-            r = self.client.get(url_or_reply)
+            with phase("token"):
+                r = self.client.get(url_or_reply)
         else:
             r = url_or_reply
 
@@ -208,7 +290,7 @@ class ShiftClient:
             return r.status_code, None
         return r.status_code, str(meta.get("content", ""))
 
-    def __login(self, user: str, pw: str) -> httpx.Response | None:
+    def __login(self, user: str, pw: str) -> "httpx.Response | None":
         """Login with user/pw"""
         the_url = f"{base_url}/home"
         _, token = self.__get_token(the_url)
@@ -228,6 +310,8 @@ class ShiftClient:
         self, code: str, game: str | None, platform: str
     ) -> tuple[Literal[False], int, str] | tuple[Literal[True], int, dict[str, str]]:
         """Get Form data for code redemption"""
+        from bs4 import BeautifulSoup as BSoup
+        from bs4 import Tag
 
         the_url = f"{base_url}/rewards"
         status_code, token = self.__get_token(the_url)
@@ -235,9 +319,11 @@ class ShiftClient:
             _L.debug("no token")
             return False, status_code, "Could not retrieve Token"
 
-        r = self.client.get(
-            f"{base_url}/entitlement_offer_codes?code={code}", headers=json_headers(token)
-        )
+        with phase("entitlement"):
+            r = self.client.get(
+                f"{base_url}/entitlement_offer_codes?code={code}",
+                headers=json_headers(token),
+            )
 
         if r.status_code != 200:
             return False, r.status_code, str(r.status_code)
@@ -286,7 +372,10 @@ class ShiftClient:
 
         return status
 
-    def __get_redemption_status(self, r: httpx.Response) -> tuple[str, str, str]:
+    def __get_redemption_status(self, r: "httpx.Response") -> tuple[str, str, str]:
+        from bs4 import BeautifulSoup as BSoup
+        from bs4 import Tag
+
         # return None
         soup = BSoup(r.text, "lxml")
         div = soup.find("div", id="check_redemption_status")
@@ -300,7 +389,7 @@ class ShiftClient:
             )
         return ("", "", "")
 
-    def __check_redemption_status(self, r: httpx.Response) -> Status:
+    def __check_redemption_status(self, r: "httpx.Response") -> Status:
         """Check redemption"""
         import json
         from time import sleep
@@ -321,24 +410,28 @@ class ShiftClient:
                     return Status.REDIRECT(fallback)
                 _L.info(get_status)
                 _L.debug(f"get {base_url}/{url}")
-                raw_json = self.client.get(
-                    f"{base_url}/{url}",
-                    follow_redirects=False,
-                    headers=json_headers(token or ""),
-                )
+                with phase("status"):
+                    raw_json = self.client.get(
+                        f"{base_url}/{url}",
+                        follow_redirects=False,
+                        headers=json_headers(token or ""),
+                    )
                 _L.debug(f"Raw json text: {raw_json.text}")
                 data = json.loads(raw_json.text)
 
                 if "text" in data:
                     return self.__get_status(data["text"])
                 # wait 500
-                sleep(0.5)
+                with tracing.span("poll_wait"):
+                    sleep(0.5)
                 cnt += 1
 
         return Status.NONE
 
     def _query_rewards(self) -> list[str]:
         """Query reward list"""
+        from bs4 import BeautifulSoup as BSoup
+
         # self.old_rewards
         the_url = f"{base_url}/rewards"
         r = self.client.get(the_url)
@@ -352,9 +445,10 @@ class ShiftClient:
 
         the_url = f"{base_url}/code_redemptions"
         headers = {"Referer": f"{base_url}/rewards"}
-        response = self.client.post(
-            the_url, data=data, headers=headers, follow_redirects=False
-        )
+        with phase("submit"):
+            response = self.client.post(
+                the_url, data=data, headers=headers, follow_redirects=False
+            )
         _L.debug(f"{response.request.method} {response.url} {response.status_code}")
         status = self.__check_redemption_status(response)
         # did we visit /code_redemptions/...... route?
@@ -364,17 +458,19 @@ class ShiftClient:
             if "code_redemptions/" in status.value:
                 redemption = True
                 while True:
-                    response2 = self.client.get(
-                        status.value,
-                        headers={
-                            "referer": status.value,
-                            "x-requested-with": "XMLHttpRequest",
-                            "accept": "application/json",
-                        },
-                    )
+                    with phase("status"):
+                        response2 = self.client.get(
+                            status.value,
+                            headers={
+                                "referer": status.value,
+                                "x-requested-with": "XMLHttpRequest",
+                                "accept": "application/json",
+                            },
+                        )
                     json_data = response2.json()
                     if json_data.get("in_progress", False):
-                        time.sleep(0.5)
+                        with tracing.span("poll_wait"):
+                            time.sleep(0.5)
                         continue
                     try:
                         status = self.__get_status(json_data["text"])
@@ -386,7 +482,8 @@ class ShiftClient:
 
             else:
                 _L.debug(f"redirect to '{status.value}'")
-                response2 = self.client.get(status.value)
+                with phase("status"):
+                    response2 = self.client.get(status.value)
                 status = self.__check_redemption_status(response2)
 
         # workaround for new SHiFT website.
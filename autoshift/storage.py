@@ -20,28 +20,158 @@
 #
 #############################################################################
 import operator
+import os
+import socket
+from collections.abc import Collection, Iterable, Mapping
+from datetime import UTC, datetime, timedelta
 from functools import reduce
-from typing import TYPE_CHECKING, Any, cast
+from typing import TYPE_CHECKING, Any, Literal, cast, override
 
 import peewee as pw
 
+from autoshift import metrics
 from autoshift.common import _L, Game, Platform, settings
 
 if TYPE_CHECKING:
-    from autoshift.models import Key
+    from autoshift.models import Account, Key
+
+
+class LazyDatabase(pw.SqliteDatabase):
+    """Opens `settings.DB_FILE` on the first connection, unless `init` was
+    called with another file before
+
+    Reading the settings on import would slow down every start"""
+
+    @override
+    def connect(self, reuse_if_open: bool = False) -> bool:
+        if self.deferred:
+            # wait for other processes holding the write lock instead of
+            # failing right away
+            self.init(str(settings.DB_FILE), timeout=30)
+        return super().connect(reuse_if_open)
+
 
-database = pw.SqliteDatabase(settings.DB_FILE)
+database = LazyDatabase(None)
+
+# identifies this process when claiming keys
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+type KeyStatus = Literal["pending", "redeemed", "expired"]
+
+# columns `browse_keys` can sort by
+SORT_COLUMNS = ("id", "code", "game", "platform", "reward", "added")
 
 
 def col(prop: Any) -> pw.Field:
     return prop
 
 
-def get_keys(game_platform_map: dict[Game, set[Platform]]) -> list["Key"]:
-    """Get all keys for the given game/platform map"""
+def get_account(name: str | None = None) -> "Account":
+    """Get or create the account with the given name (default: `settings.ACCOUNT`)"""
+    from autoshift.models import Account
+
+    account, _ = Account.get_or_create(name=name or settings.ACCOUNT)
+    return account
+
+
+def is_redeemed(key: "Key", account: str | None = None) -> bool:
+    """Check if `key` was already redeemed by the given account"""
+    from autoshift.models import Redemption
+
+    return (
+        cast(pw.Select, Redemption.select())
+        .where(
+            (Redemption.key == key)
+            & (Redemption.account == get_account(account))
+            & (Redemption.redeemed == True)  # noqa: E712
+        )
+        .exists()
+    )
+
+
+@metrics.db_write
+def set_redeemed(key: "Key", account: str | None = None):
+    """Mark `key` as redeemed for the given account"""
+    from autoshift.models import Redemption
+
+    now = datetime.now(UTC)
+    (
+        Redemption.insert(
+            account=get_account(account), key=key, redeemed=True, redeemed_at=now
+        )
+        .on_conflict(
+            conflict_target=[Redemption.account, Redemption.key],
+            update={
+                Redemption.redeemed: True,
+                Redemption.redeemed_at: now,
+                Redemption.claimed_by: None,
+                Redemption.lease_expires: None,
+                Redemption.submitted_at: None,
+            },
+        )
+        .execute()
+    )
+
+
+@metrics.db_write
+def set_submitted(key: "Key", account: str | None = None):
+    """Journal the submission of `key` before sending it to SHiFT
+
+    Must be closed with `set_resolved` once the outcome is known. Entries left
+    open by a crashed process are checked by `ShiftClient.verify_submitted`."""
+    from autoshift.models import Redemption
+
+    now = datetime.now(UTC)
+    (
+        Redemption.insert(
+            account=get_account(account), key=key, redeemed=False, submitted_at=now
+        )
+        .on_conflict(
+            conflict_target=[Redemption.account, Redemption.key],
+            update={Redemption.submitted_at: now},
+        )
+        .execute()
+    )
+
+
+@metrics.db_write
+def set_resolved(key: "Key", account: str | None = None):
+    """Close the journal entry of `key`"""
+    from autoshift.models import Redemption
+
+    (
+        Redemption.update(submitted_at=None)
+        .where((Redemption.key == key) & (Redemption.account == get_account(account)))
+        .execute()
+    )
+
+
+def get_unresolved(account: str | None = None) -> list["Key"]:
+    """Keys submitted by a process that died before the outcome was known
+
+    Submissions of live workers holding a claim on the key are skipped"""
+    from autoshift.models import Key, Redemption
+
+    return list(
+        cast(pw.Select, Key.select())
+        .join(Redemption)
+        .where(
+            (Redemption.account == get_account(account))
+            & col(Redemption.submitted_at).is_null(False)
+            & (
+                col(Redemption.claimed_by).is_null()
+                | (Redemption.claimed_by == WORKER_ID)
+                | (Redemption.lease_expires < datetime.now(UTC))
+            )
+        )
+        .order_by(Key.id)
+    )
+
+
+def _game_platform_predicate(game_platform_map: dict[Game, set[Platform]]):
     from autoshift.models import Key
 
-    predicate = reduce(
+    return reduce(
         operator.or_,
         [
             (Key.game == game) & (col(Key.platform).in_(platforms))
@@ -49,8 +179,95 @@ def get_keys(game_platform_map: dict[Game, set[Platform]]) -> list["Key"]:
         ],
     )
 
+
+@metrics.db_write
+def insert_keys(rows: Iterable[Mapping[str, Any]]) -> int:
+    """Insert new keys, skipping known and expired archived ones.
+
+    Archived keys that are still valid are restored.
+    Returns the number of inserted keys"""
+    from autoshift.models import ArchivedKey, Key
+
+    now = datetime.now(UTC)
+    num_new_keys = 0
+    for batch in pw.chunked(rows, 500):
+        wanted = {(row["code"], row["game"], row["platform"]) for row in batch}
+        # archived keys were moved out of `keys`, so the unique index can't catch them
+        archived = cast(
+            pw.Select,
+            ArchivedKey.select(
+                ArchivedKey.id, ArchivedKey.code, ArchivedKey.game, ArchivedKey.platform
+            ),
+        ).where(col(ArchivedKey.code).in_({code for code, _, _ in wanted}))
+        expired = {
+            (code, game, platform)
+            for _, code, game, platform in archived.where(
+                (ArchivedKey.expired == True) | (ArchivedKey.expires < now)  # noqa: E712
+            ).tuples()
+        }
+        restored = [
+            key_id
+            for key_id, code, game, platform in archived.tuples()
+            if (code, game, platform) in wanted - expired
+        ]
+        if restored:
+            ArchivedKey.delete().where(col(ArchivedKey.id).in_(restored)).execute()
+
+        batch = [
+            row
+            for row in batch
+            if (row["code"], row["game"], row["platform"]) not in expired
+        ]
+        if batch:
+            num_new_keys += (
+                Key.insert_many(batch).on_conflict_ignore().as_rowcount().execute()
+            )
+
+    return num_new_keys
+
+
+def find_keys(rows: Iterable[Mapping[str, Any]]) -> list["Key"]:
+    """Look up the stored keys matching the (code, game, platform) of `rows`"""
+    from autoshift.models import Key
+
+    wanted = {(row["code"], row["game"], row["platform"]) for row in rows}
+    return [
+        key
+        for batch in pw.chunked({code for code, _, _ in wanted}, 500)
+        for key in cast(pw.Select, Key.select()).where(col(Key.code).in_(batch))
+        if (key.code, key.game, key.platform) in wanted
+    ]
+
+
+def find_codes(codes: Collection[tuple[str, Platform]]) -> list["Key"]:
+    """Look up the stored keys matching (code, platform) pairs, whatever their game"""
+    from autoshift.models import Key
+
+    wanted = set(codes)
+    return [
+        key
+        for batch in pw.chunked({code for code, _ in wanted}, 500)
+        for key in cast(pw.Select, Key.select()).where(col(Key.code).in_(batch))
+        if (key.code, key.platform) in wanted
+    ]
+
+
+def get_keys(
+    game_platform_map: dict[Game, set[Platform]], account: str | None = None
+) -> list["Key"]:
+    """Get all keys for the given game/platform map the account hasn't redeemed yet"""
+    from autoshift.models import Key, Redemption
+
+    predicate = _game_platform_predicate(game_platform_map)
+
+    redeemed = cast(pw.Select, Redemption.select()).where(
+        (Redemption.key == Key.id)
+        & (Redemption.account == get_account(account))
+        & (Redemption.redeemed == True)  # noqa: E712
+    )
+
     query = cast(pw.Select, Key.select()).where(
-        (Key.redeemed == False)  # noqa: E712
+        ~pw.fn.EXISTS(redeemed)
         & (Key.expired == False)  # noqa: E712
         & predicate
     )
@@ -58,3 +275,200 @@ def get_keys(game_platform_map: dict[Game, set[Platform]]) -> list["Key"]:
     keys = list(query)
     _L.debug(f"Found {len(keys)} redeemable keys")
     return keys
+
+
+@metrics.db_write
+def claim_keys(
+    game_platform_map: dict[Game, set[Platform]],
+    limit: int,
+    account: str | None = None,
+    exclude: Collection[int] = (),
+    worker: str = WORKER_ID,
+    key_ids: Collection[int] | None = None,
+) -> list["Key"]:
+    """Claim up to `limit` redeemable keys for `worker` (only out of `key_ids` if given)
+
+    Claims are leases on the account's redemption state. Keys claimed by another
+    worker are skipped until their lease expires (see `renew_claims`) or they
+    are released, so multiple processes can share one database without
+    redeeming the same keys."""
+    from autoshift.models import Key, Redemption
+
+    acc = get_account(account)
+    now = datetime.now(UTC)
+    predicate = _game_platform_predicate(game_platform_map) & (
+        Key.expired == False  # noqa: E712
+    )
+    if exclude:
+        predicate &= col(Key.id).not_in(list(exclude))
+    if key_ids is not None:
+        predicate &= col(Key.id).in_(list(key_ids))
+
+    with database.atomic("IMMEDIATE"):
+        # make sure every candidate has a state row we can claim
+        missing = (
+            cast(pw.Select, Key.select(pw.Value(acc.id), Key.id, pw.Value(False)))
+            .where(predicate)
+            .where(
+                ~pw.fn.EXISTS(
+                    Redemption.select().where(
+                        (Redemption.key == Key.id) & (Redemption.account == acc)
+                    )
+                )
+            )
+        )
+        Redemption.insert_from(
+            missing, [Redemption.account, Redemption.key, Redemption.redeemed]
+        ).on_conflict_ignore().execute()
+
+        claimable = (
+            cast(pw.Select, Redemption.select(Redemption.id))
+            .join(Key)
+            .where(
+                (Redemption.account == acc)
+                & (Redemption.redeemed == False)  # noqa: E712
+                # unresolved submissions are verified, never submitted again
+                & col(Redemption.submitted_at).is_null()
+                & (
+                    col(Redemption.lease_expires).is_null()
+                    | (Redemption.lease_expires < now)
+                )
+                & predicate
+            )
+            .order_by(Key.id)
+            .limit(limit)
+        )
+        claimed = (
+            Redemption.update(
+                claimed_by=worker,
+                lease_expires=now + timedelta(seconds=settings.LEASE),
+            )
+            .where(col(Redemption.id).in_(claimable))
+            .returning(Redemption.key)
+            .execute()
+        )
+        key_ids = [row.key_id for row in claimed]
+
+    if not key_ids:
+        return []
+    keys = list(
+        cast(pw.Select, Key.select()).where(col(Key.id).in_(key_ids)).order_by(Key.id)
+    )
+    _L.debug(f"Claimed {len(keys)} keys for {worker}")
+    return keys
+
+
+@metrics.db_write
+def renew_claims(worker: str = WORKER_ID) -> int:
+    """Heartbeat: extend the leases of all keys claimed by `worker`"""
+    from autoshift.models import Redemption
+
+    return (
+        Redemption.update(
+            lease_expires=datetime.now(UTC) + timedelta(seconds=settings.LEASE)
+        )
+        .where(Redemption.claimed_by == worker)
+        .execute()
+    )
+
+
+@metrics.db_write
+def release_claims(keys: Iterable["Key"] | None = None, worker: str = WORKER_ID) -> int:
+    """Release claims of `worker` (all of them if `keys` is None)"""
+    from autoshift.models import Redemption
+
+    query = Redemption.update(claimed_by=None, lease_expires=None).where(
+        Redemption.claimed_by == worker
+    )
+    if keys is not None:
+        query = query.where(col(Redemption.key).in_([key.id for key in keys]))
+    return query.execute()
+
+
+def _browse_query(account: str | None, *columns: Any) -> tuple[pw.Select, Any]:
+    """Select `columns` of all keys with their status for the account
+
+    Read-only: keys of an account that doesn't exist yet are all pending.
+    Returns the query and the status expression"""
+    from autoshift.models import Account, Key, Redemption
+
+    account_id = Account.select(Account.id).where(
+        Account.name == (account or settings.ACCOUNT)
+    )
+
+    status = pw.Case(
+        None,
+        [
+            (Redemption.redeemed == True, "redeemed"),  # noqa: E712
+            (Key.expired == True, "expired"),  # noqa: E712
+        ],
+        "pending",
+    )
+    query = (
+        cast(pw.Select, Key.select(*columns, status.alias("status")))
+        .join(
+            Redemption,
+            pw.JOIN.LEFT_OUTER,
+            on=((Redemption.key == Key.id) & (Redemption.account == account_id)),
+        )
+        .objects()
+    )
+    return query, status
+
+
+def count_keys(account: str | None = None) -> list[tuple[Game, Platform, KeyStatus, int]]:
+    """Number of keys per game, platform and status for the account"""
+    from autoshift.models import Key
+
+    query, status = _browse_query(account, Key.game, Key.platform, pw.fn.COUNT(Key.id))
+    rows = (
+        query.group_by(Key.game, Key.platform, status)
+        .order_by(Key.game, Key.platform, status)
+        .tuples()
+    )
+    return [(game, platform, status, n) for game, platform, n, status in rows]
+
+
+def browse_keys(
+    account: str | None = None,
+    *,
+    game: Game | None = None,
+    platform: Platform | None = None,
+    status: KeyStatus | None = None,
+    search: str = "",
+    sort: str = "id",
+    descending: bool = False,
+    after: tuple[Any, int] | None = None,
+    limit: int = 100,
+) -> list["Key"]:
+    """One page of keys with their `status` for the account
+
+    Keyset pagination: pass the sort value and id of the last key of a page as
+    `after` to get the next one, so deep pages cost as much as the first one"""
+    from autoshift.models import Key
+
+    column: pw.Field = getattr(Key, sort)
+    query, status_expr = _browse_query(account, Key)
+    if game:
+        query = query.where(Key.game == game)
+    if platform:
+        query = query.where(Key.platform == platform)
+    if status:
+        query = query.where(status_expr == status)
+    if search:
+        query = query.where(
+            col(Key.code).contains(search) | col(Key.reward).contains(search)
+        )
+    if after:
+        value, key_id = after
+        if descending:
+            query = query.where(
+                (column < value) | ((column == value) & (Key.id < key_id))
+            )
+        else:
+            query = query.where(
+                (column > value) | ((column == value) & (Key.id > key_id))
+            )
+
+    order = (column.desc(), col(Key.id).desc()) if descending else (column, Key.id)
+    return list(query.order_by(*order).limit(limit))
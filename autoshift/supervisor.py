@@ -0,0 +1,142 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Redeem keys for many accounts in parallel
+
+Keys are ingested once by the supervisor. Every account profile is then
+redeemed in its own worker process with its own session, cookie file and
+rate-limit budget, since `settings` and the logged-in client are per process.
+
+A profiles file is a JSON list like:
+
+    [
+        {
+            "account": "main",
+            "cookie_file": "data/.cookies.main.save",
+            "games": {"bl4": ["steam"], "bl3": ["epic", "psn"]}
+        }
+    ]
+"""
+
+import json
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Annotated
+
+from pydantic import BaseModel, BeforeValidator, Field, SecretStr, TypeAdapter
+
+from autoshift.common import _L, Game, Platform, path, settings, validate_list
+
+
+class Profile(BaseModel):
+    account: str
+    cookie_file: Annotated[Path, BeforeValidator(path)]
+    # at least one game with at least one platform, there is nothing to redeem
+    # otherwise
+    games: dict[
+        Game,
+        Annotated[list[Platform], BeforeValidator(validate_list), Field(min_length=1)],
+    ] = Field(min_length=1)
+    user: str | None = None
+    password: SecretStr | None = Field(default=None, alias="pass")
+
+
+class ProfileResult(BaseModel):
+    account: str
+    stats: Counter[str] = Field(default_factory=Counter)
+    resume_at: datetime | None = None
+    error: str | None = None
+
+
+def load_profiles(profiles_file: Path) -> list[Profile]:
+    return TypeAdapter(list[Profile]).validate_python(
+        json.loads(profiles_file.read_text())
+    )
+
+
+def run_profile(profile: Profile) -> ProfileResult:
+    """Redeem all keys of one profile. Runs inside a fresh worker process"""
+    from autoshift import auto
+    from autoshift.shift import ShiftClient
+    from autoshift.storage import database
+
+    result = ProfileResult(account=profile.account)
+
+    settings.ACCOUNT = profile.account
+    settings.COOKIE_FILE = profile.cookie_file
+    settings._GAMES_PLATFORM_MAP.clear()
+    for game, platforms in profile.games.items():
+        settings._GAMES_PLATFORM_MAP[game] = set(platforms)
+
+    password = profile.password.get_secret_value() if profile.password else None
+    if not profile.cookie_file.exists() and not (profile.user and password):
+        # there is no one to prompt for credentials in a worker process
+        result.error = (
+            f"not logged in yet and no credentials in profile ({profile.cookie_file})"
+        )
+        return result
+
+    try:
+        database.connect(reuse_if_open=True)
+        auto.client = ShiftClient()
+        auto.client.login(profile.user, password)
+        auto.client.verify_submitted()
+        result.resume_at = auto.redeem_all(result.stats)
+    except (Exception, SystemExit) as e:
+        # `login` exits on wrong credentials
+        result.error = str(e) or type(e).__name__
+    return result
+
+
+def supervise(profiles: list[Profile], workers: int) -> datetime | None:
+    """Ingest keys once and redeem them for every profile in parallel
+
+    Returns the earliest estimated quota reset of all profiles, if any"""
+    from autoshift.auto import ingest_keys
+
+    ingest_keys()
+
+    totals: Counter[str] = Counter()
+    resume_at: list[datetime] = []
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(profiles)),
+        # fresh interpreter per profile: no shared settings, client or connection
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=1,
+    ) as pool:
+        futures = [pool.submit(run_profile, profile) for profile in profiles]
+        for future in as_completed(futures):
+            result = future.result()
+            totals.update(result.stats)
+            if result.error:
+                _L.error(f"[{result.account}] failed: {result.error}")
+                continue
+            if result.resume_at:
+                resume_at.append(result.resume_at)
+            summary = ", ".join(f"{n} {name}" for name, n in result.stats.items())
+            _L.info(f"[{result.account}] {summary or 'nothing to redeem'}")
+
+    summary = ", ".join(f"{n} {name}" for name, n in totals.most_common())
+    _L.info(f"Redeemed for {len(profiles)} accounts: {summary or 'nothing to redeem'}")
+    return min(resume_at, default=None)
@@ -0,0 +1,240 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Lightweight tracing of redemptions
+
+Every redemption is a trace made of nested spans (token fetch, entitlement
+lookup, form submission, status polling, ...) plus one span per HTTP request,
+recorded by httpx event hooks. Finished traces are appended as one JSON line
+to `DATA_DIR/traces.jsonl`, which is rotated like a log file.
+
+Tracing is only active if `SHIFT_TRACE` is set. Use `autoshift traces` to
+summarize the slowest phases."""
+
+import json
+import logging
+import logging.handlers
+import time
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from functools import cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from autoshift.common import settings
+
+if TYPE_CHECKING:
+    import httpx
+
+
+def enabled() -> bool:
+    return settings.TRACE
+
+
+# rotate the trace file at this size (bytes)
+MAX_BYTES = 5 * 1024 * 1024
+# number of rotated files to keep
+BACKUP_COUNT = 3
+
+
+@dataclass
+class Span:
+    name: str
+    attrs: dict[str, Any] = field(default_factory=dict)
+    start: float = field(default_factory=time.perf_counter)
+    end: float | None = None
+    children: list["Span"] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self, origin: float) -> dict[str, Any]:
+        data: dict[str, Any] = {
+            "name": self.name,
+            "offset_ms": round((self.start - origin) * 1000, 2),
+            "ms": round(self.duration * 1000, 2),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.children:
+            data["spans"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+_current: ContextVar[Span | None] = ContextVar("span", default=None)
+
+
+def trace_file() -> Path:
+    return settings.DATA_DIR / "traces.jsonl"
+
+
+@cache
+def _writer() -> logging.Logger:
+    logger = logging.getLogger("autoshift.trace")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = logging.handlers.RotatingFileHandler(
+        trace_file(), maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8"
+    )
+    logger.addHandler(handler)
+    return logger
+
+
+def span(name: str, **attrs: Any) -> AbstractContextManager[Span | None]:
+    """Time a `with` block as a child of the current span.
+
+    Without a current span this starts a new trace, written out when it ends"""
+    if not enabled():
+        return nullcontext()
+    return _span(name, attrs)
+
+
+@contextmanager
+def _span(name: str, attrs: dict[str, Any]) -> Iterator[Span]:
+    parent = _current.get()
+    current = Span(name, attrs)
+    if parent:
+        parent.children.append(current)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = repr(e)
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current.reset(token)
+        if not parent:
+            _export(current)
+
+
+def _export(root: Span):
+    record = {
+        "ts": datetime.now(UTC).isoformat(),
+        **root.to_dict(root.start),
+    }
+    del record["offset_ms"]
+    _writer().info(json.dumps(record, default=str))
+
+
+def _on_request(request: "httpx.Request"):
+    parent = _current.get()
+    if not parent:
+        return
+    current = Span(
+        "http",
+        {
+            "method": request.method,
+            "path": request.url.path,
+            "bytes_out": len(request.content),
+        },
+    )
+    parent.children.append(current)
+    request.extensions["trace_span"] = current
+
+
+def _on_response(response: "httpx.Response"):
+    current: Span | None = response.request.extensions.get("trace_span")
+    if not current:
+        return
+    # the body is read anyways: account for the download as well
+    response.read()
+    current.end = time.perf_counter()
+    current.attrs["status"] = response.status_code
+    current.attrs["bytes_in"] = len(response.content)
+
+
+def event_hooks() -> dict[str, list]:
+    """httpx event hooks recording a span per request"""
+    if not enabled():
+        return {}
+    return {"request": [_on_request], "response": [_on_response]}
+
+
+def _walk(spans: list[dict[str, Any]], prefix: str) -> Iterator[tuple[str, float]]:
+    for s in spans:
+        path = f"{prefix} > {s['name']}"
+        yield path, s["ms"]
+        yield from _walk(s.get("spans", []), path)
+
+
+def read_traces() -> Iterator[dict[str, Any]]:
+    """All recorded traces, oldest rotated file first"""
+    path = trace_file()
+    files = [path.with_name(f"{path.name}.{i}") for i in range(BACKUP_COUNT, 0, -1)]
+    for file in [*files, path]:
+        if not file.exists():
+            continue
+        with file.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # partially written line of a crashed process
+                    continue
+
+
+def summarize(top: int = 10):
+    """Print the phases that took the most time and the slowest traces"""
+    from rich.console import Console
+    from rich.table import Table
+
+    phases: dict[str, list[float]] = {}
+    slowest: list[tuple[float, dict[str, Any]]] = []
+    for record in read_traces():
+        phases.setdefault(record["name"], []).append(record["ms"])
+        for path, ms in _walk(record.get("spans", []), record["name"]):
+            phases.setdefault(path, []).append(ms)
+        slowest.append((record["ms"], record))
+
+    console = Console()
+    if not slowest:
+        console.print(f"No traces in {trace_file()} (enable with SHIFT_TRACE=true)")
+        return
+
+    table = Table(title=f"Phases of {len(slowest)} traces by total time")
+    for column in ("phase", "count", "total s", "mean ms", "p95 ms", "max ms"):
+        table.add_column(column, justify="left" if column == "phase" else "right")
+    ranked = sorted(phases.items(), key=lambda item: sum(item[1]), reverse=True)
+    for path, durations in ranked[:top]:
+        durations.sort()
+        table.add_row(
+            path,
+            str(len(durations)),
+            f"{sum(durations) / 1000:.1f}",
+            f"{sum(durations) / len(durations):.0f}",
+            f"{durations[int(0.95 * (len(durations) - 1))]:.0f}",
+            f"{durations[-1]:.0f}",
+        )
+    console.print(table)
+
+    table = Table(title="Slowest traces")
+    for column in ("time", "trace", "attributes", "ms"):
+        table.add_column(column, justify="right" if column == "ms" else "left")
+    slowest.sort(key=lambda item: item[0], reverse=True)
+    for ms, record in slowest[:top]:
+        attrs = " ".join(f"{k}={v}" for k, v in record.get("attrs", {}).items())
+        table.add_row(record["ts"], record["name"], attrs, f"{ms:.0f}")
+    console.print(table)
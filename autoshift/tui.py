@@ -4,7 +4,10 @@ Textual TUI for AutoSHiFt - A tool to automatically redeem Gearbox SHiFT codes.
 This provides a user-friendly terminal interface for configuring and running the application.
 """
 
-from typing import Dict
+import asyncio
+import logging
+from datetime import UTC, datetime, timedelta
+from typing import Dict, cast
 from rich.panel import Panel
 from rich.text import Text
 from textual import on
@@ -16,18 +19,25 @@ from textual.widgets import (
     Footer,
     Header,
     Label,
+    Select,
     Static,
     Switch,
     Input,
-    TextArea
 )
 from textual.screen import ModalScreen, Screen
 
+from autoshift.jobs import Job, JobManager
+from autoshift.key_browser import KeyBrowserScreen
+from autoshift.log_view import LogView, LogViewHandler
 from autoshift.manual_code_screen import ManualCodeScreen, redeem_single_code
 
 from autoshift.common import Game, Platform, settings
 from autoshift.auto import main as run_main, auto_redeem_codes
 
+# job kind of everything that redeems keys: only one of them may use the
+# shared session at a time
+REDEEM_JOB = "redeem"
+
 
 class SettingsScreen(ModalScreen[Dict]):
     """Modal screen for configuring application settings."""
@@ -165,6 +175,18 @@ class SettingsScreen(ModalScreen[Dict]):
 class MainScreen(Screen):
     """Main application screen."""
 
+    DEFAULT_CSS = """
+    #log-filter {
+        height: auto;
+    }
+    #log-level {
+        width: 24;
+    }
+    #log-search {
+        width: 1fr;
+    }
+    """
+
     BINDINGS = [
         ("ctrl+n", "new_session", "New Session"),
         ("ctrl+s", "settings", "Settings"),
@@ -172,8 +194,15 @@ class MainScreen(Screen):
         ("ctrl+q", "quit", "Quit"),
         ("ctrl+g", "query_codes", "Query Codes"),
         ("ctrl+m", "manual_run", "Manual Run"),
+        ("ctrl+x", "cancel_jobs", "Stop Jobs"),
+        ("ctrl+k", "browse_keys", "Keys"),
     ]
 
+    @property
+    def jobs(self) -> JobManager:
+        """Background jobs of the app."""
+        return cast("AutoSHiFtTUI", self.app).jobs
+
     def compose(self) -> ComposeResult:
         yield Header()
 
@@ -197,19 +226,24 @@ class MainScreen(Screen):
                 yield Button("Configure", variant="primary", id="configure-btn")
                 yield Button("Run Now", variant="success", id="run-btn")
                 yield Button("Query", variant="primary", id="query-btn")
+                yield Button("Keys", variant="default", id="keys-btn")
 
             with Horizontal(id="action-buttons-bottom"):
                 yield Button("Manual", variant="success", id="manual-btn")
                 yield Button("Schedule", variant="default", id="schedule-btn")
+                yield Button("Stop", variant="warning", id="stop-btn")
                 yield Button("Quit", variant="error", id="quit-btn")
 
             # Log output
             with Container(id="log-container"):
-                yield TextArea(
-                    text="Log output will appear here...\n",
-                    id="log-output",
-                    read_only=True
-                )
+                with Horizontal(id="log-filter"):
+                    yield Select(
+                        [(name, getattr(logging, name)) for name in ("DEBUG", "INFO", "WARNING", "ERROR")],
+                        prompt="All levels",
+                        id="log-level",
+                    )
+                    yield Input(placeholder="Search log...", id="log-search")
+                yield LogView(id="log-output")
 
         yield Footer()
 
@@ -223,25 +257,51 @@ class MainScreen(Screen):
             database.connect()
             run_migrations(database)
 
+        # Stream log records of all threads and anything printed into the log view.
+        # The console handlers are replaced while the TUI owns the terminal,
+        # their output would be captured as print output otherwise.
+        logger = logging.getLogger("autoshift")
+        self._log_view = self.query_one("#log-output", LogView)
+        self._console_handlers = logger.handlers[:]
+        logger.handlers = [LogViewHandler(self._log_view)]
+        self.app.begin_capture_print(self._log_view)
+
+        # Show the progress of running jobs and the outcome of finished ones
+        self._reported_jobs: set[Job] = set()
+        self.set_interval(0.5, self._show_job_progress)
+
         self.update_status("Ready to configure SHiFT code redemption")
+        self.append_log("Log output will appear here...")
+
+        # Log in once in the background, all jobs share the session afterwards
+        # (without a saved cookie this waits for the first redemption,
+        # which prompts for the credentials)
+        if settings.COOKIE_FILE.exists():
+            self._start_job("login", "Login", self._login)
+
+    def on_unmount(self) -> None:
+        """Stop streaming into the log view."""
+        logging.getLogger("autoshift").handlers = self._console_handlers
+        self.app.end_capture_print(self._log_view)
 
     def update_status(self, message: str) -> None:
         """Update the status message."""
         status_label = self.query_one("#status-label", Static)
         status_label.update(f"Status: {message}")
 
-    def append_log(self, message: str) -> None:
-        """Append a message to the log output."""
-        log_output = self.query_one("#log-output", TextArea)
-        current_text = log_output.text
-        new_text = current_text + f"{message}\n"
-        # Limit log size to prevent memory issues
-        lines = new_text.split('\n')
-        if len(lines) > 1000:  # Keep only last 1000 lines
-            new_text = '\n'.join(lines[-1000:])
-        log_output.text = new_text
-        # Scroll to bottom
-        log_output.move_cursor((len(new_text.split('\n')) - 1, len(new_text.split('\n')[-1]) if new_text.split('\n')[-1] else 0))
+    def append_log(self, message: str, level: int = logging.INFO) -> None:
+        """Append a message to the log output (shown with the next frame)."""
+        self.query_one("#log-output", LogView).write(message, level)
+
+    @on(Select.Changed, "#log-level")
+    @on(Input.Changed, "#log-search")
+    def on_log_filter_changed(self) -> None:
+        """Filter the log output by level and search term."""
+        level = self.query_one("#log-level", Select).value
+        search = self.query_one("#log-search", Input).value
+        self.query_one("#log-output", LogView).set_filter(
+            level if isinstance(level, int) else logging.NOTSET, search
+        )
 
     @on(Button.Pressed, "#configure-btn")
     def on_configure_pressed(self) -> None:
@@ -258,6 +318,11 @@ class MainScreen(Screen):
         """Handle Query Codes button press."""
         self.action_query_codes()
 
+    @on(Button.Pressed, "#keys-btn")
+    def on_keys_pressed(self) -> None:
+        """Handle Keys button press."""
+        self.action_browse_keys()
+
     @on(Button.Pressed, "#manual-btn")
     def on_manual_pressed(self) -> None:
         """Handle Manual Run button press."""
@@ -281,10 +346,15 @@ class MainScreen(Screen):
         """Handle Schedule button press."""
         self.run_scheduled()
 
+    @on(Button.Pressed, "#stop-btn")
+    def on_stop_pressed(self) -> None:
+        """Handle Stop button press."""
+        self.action_cancel_jobs()
+
     @on(Button.Pressed, "#quit-btn")
-    def on_quit_pressed(self) -> None:
+    async def on_quit_pressed(self) -> None:
         """Handle Quit button press."""
-        self.app.exit()
+        await self.app.action_quit()
 
     def action_settings(self) -> None:
         """Open settings modal."""
@@ -362,357 +432,100 @@ class MainScreen(Screen):
 
     def action_run(self) -> None:
         """Run the redemption process once."""
-        self.update_status("Running redemption process...")
-        self.append_log("Starting redemption process...")
-
-        # Run the redemption process in a background thread to prevent UI freezing
-        import threading
-        thread = threading.Thread(target=self._run_redemption_once, daemon=True)
-        thread.start()
+        # Run the redemption process as a background job to prevent UI freezing
+        self._start_job(REDEEM_JOB, "Redemption", self._run_redemption_once)
 
     def action_query_codes(self) -> None:
         """Query new codes."""
-        self.update_status("Querying for new codes...")
-        self.append_log("Starting code query process...")
+        self._start_job("query", "Code query", self._run_query_codes)
 
-        # Run the query process in a background thread to prevent UI freezing
-        import threading
-        thread = threading.Thread(target=self._run_query_codes, daemon=True)
-        thread.start()
+    def action_browse_keys(self) -> None:
+        """Open the key browser."""
+        self.app.push_screen(KeyBrowserScreen())
 
     def action_manual_run(self) -> None:
         """Run a single redemption manually."""
         # For now, just run the same process as regular redemption
-        self.update_status("Running manual redemption...")
-        self.append_log("Starting manual redemption process...")
-
-        # Run the manual redemption in a background thread to prevent UI freezing
-        import threading
-        thread = threading.Thread(target=self._run_manual_redemption, daemon=True)
-        thread.start()
+        self._start_job(REDEEM_JOB, "Manual redemption", self._run_redemption_once)
+
+    def action_cancel_jobs(self) -> None:
+        """Cancel all running jobs."""
+        if not self.jobs.running():
+            self.append_log("No running jobs to stop")
+            return
+        self.jobs.cancel()
+        self.update_status("Stopping running jobs...")
+
+    def _start_job(self, kind: str, description: str, fn, *args) -> bool:
+        """Run `fn` as a background job, unless a job of the same kind is still running."""
+        if self.jobs.start(kind, description, fn, *args) is None:
+            message = f"{self.jobs.jobs[kind].description} is still running, try again later"
+            self.app.notify(message, severity="warning")
+            self.append_log(message, logging.WARNING)
+            return False
+        self.update_status(f"{description} running...")
+        self.append_log(f"{description} started")
+        return True
+
+    def _show_job_progress(self) -> None:
+        """Show the progress of running jobs and report finished ones."""
+        for job in list(self.jobs.jobs.values()):
+            if job.finished and job not in self._reported_jobs:
+                self._reported_jobs.add(job)
+                self.update_status(job.outcome())
+                self.append_log(job.outcome(), logging.ERROR if job.error else logging.INFO)
+
+        if running := self.jobs.running():
+            self.update_status(" | ".join(job.status() for job in running))
 
     def _redeem_single_code(self, code: str, platform: str) -> None:
-        """Redeem a single code in a background thread."""
-        self.update_status(f"Redeeming code {code} for {platform}...")
-        self.append_log(f"Starting redemption for code: {code}")
-
-        import threading
+        """Redeem a single code in a background job."""
         def run_single_redemption():
-            try:
-                result = redeem_single_code(code, platform)
-                self.app.call_from_thread(self.update_status, f"Code {code} redemption completed")
-                self.app.call_from_thread(self.append_log, f"Result: {result}")
-            except Exception as e:
-                self.app.call_from_thread(self.update_status, f"Error redeeming code: {str(e)}")
-                self.app.call_from_thread(self.append_log, f"Error: {str(e)}")
+            result = redeem_single_code(code, platform)
+            self.app.call_from_thread(self.append_log, f"Result: {result}")
 
-        thread = threading.Thread(target=run_single_redemption, daemon=True)
-        thread.start()
+        self._start_job(REDEEM_JOB, f"Redemption of {code}", run_single_redemption)
 
     def run_scheduled(self) -> None:
         """Run the scheduled redemption process."""
-        self.update_status("Starting scheduled redemption...")
-        self.append_log("Starting scheduled redemption process...")
+        self._start_job(REDEEM_JOB, "Scheduled redemption", self._run_redemption_scheduled)
 
-        # Run the scheduled redemption process in a background thread to prevent UI freezing
-        import threading
-        thread = threading.Thread(target=self._run_redemption_scheduled, daemon=True)
-        thread.start()
+    def _login(self) -> None:
+        """Log in the session shared by all jobs (as a job)."""
+        from autoshift.auto import login
+        login()
 
     def _run_redemption_once(self) -> None:
-        """Run the redemption process once in a background thread."""
-        import sys
-        import io
-        import logging
-        from contextlib import redirect_stdout, redirect_stderr
-
-        try:
-            # Update status before starting
-            self.app.call_from_thread(self.update_status, "Running redemption process...")
-            self.app.call_from_thread(self.append_log, "Starting redemption process...")
-
-            # Temporarily disable scheduling to run once
-            original_schedule = settings.SCHEDULE
-            settings.SCHEDULE = None
-
-            # Get the autoshift logger and temporarily remove RichHandler during background execution
-            logger = logging.getLogger("autoshift")
-            original_handlers = logger.handlers[:]  # Make a copy of current handlers
-
-            # Clear all handlers temporarily
-            logger.handlers.clear()
-
-            # Create a custom handler to capture log messages
-            log_capture_string = io.StringIO()
-            string_handler = logging.StreamHandler(log_capture_string)
-            string_handler.setLevel(logging.INFO)  # Capture INFO and above
-            logger.addHandler(string_handler)
-
-            # Also capture stdout/stderr for any print statements
-            stdout_capture = io.StringIO()
-            stderr_capture = io.StringIO()
-
-            with redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
-                # Run the main redemption process
-                from autoshift.auto import main
-                main()
-
-            # Restore original handlers
-            logger.handlers.clear()
-            logger.handlers.extend(original_handlers)
-
-            # Close our temporary handler and get captured logs
-            string_handler.close()
-            log_output = log_capture_string.getvalue()
-
-            # Get captured stdout/stderr as well
-            stdout_output = stdout_capture.getvalue()
-            stderr_output = stderr_capture.getvalue()
-
-            # Send captured log output to the UI log
-            if log_output:
-                for line in log_output.split('\n'):
-                    if line.strip():
-                        self.app.call_from_thread(self.append_log, f"Log: {line.strip()}")
-
-            # Also send any stdout/stderr output
-            if stdout_output:
-                for line in stdout_output.split('\n'):
-                    if line.strip():
-                        self.app.call_from_thread(self.append_log, f"Output: {line.strip()}")
-            if stderr_output:
-                for line in stderr_output.split('\n'):
-                    if line.strip():
-                        self.app.call_from_thread(self.append_log, f"Error: {line.strip()}")
-
-            settings.SCHEDULE = original_schedule
-            self.app.call_from_thread(self.update_status, "Redemption process completed")
-        except Exception as e:
-            # Make sure to restore logger handlers even if there's an error
-            logger = logging.getLogger("autoshift")
-            from autoshift.common import settings  # Import settings again in case of exception
-            original_handlers = getattr(logging.getLogger("autoshift"), 'handlers', [])[:]
-            if original_handlers:
-                logger.handlers.clear()
-                logger.handlers.extend(original_handlers)
-            self.app.call_from_thread(self.update_status, f"Error during redemption: {str(e)}")
-            self.app.call_from_thread(self.append_log, f"Error: {str(e)}")
+        """Run the redemption process once (as a job)."""
+        # Log records and output stream into the log view while this runs
+        # (see LogViewHandler and `begin_capture_print` in `on_mount`)
+        from autoshift.auto import main
+        main()
 
     def _run_redemption_scheduled(self) -> None:
-        """Run the scheduled redemption process in a background thread."""
-        import io
-        import logging
-        from contextlib import redirect_stdout, redirect_stderr
-
-        try:
-            # Update status before starting
-            self.app.call_from_thread(self.update_status, "Starting scheduled redemption...")
-            self.app.call_from_thread(self.append_log, "Starting scheduled redemption process...")
-
-            # Get the autoshift logger and temporarily remove RichHandler during background execution
-            logger = logging.getLogger("autoshift")
-            original_handlers = logger.handlers[:]  # Make a copy of current handlers
-
-            # Clear all handlers temporarily
-            logger.handlers.clear()
-
-            # Create a custom handler to capture log messages
-            log_capture_string = io.StringIO()
-            string_handler = logging.StreamHandler(log_capture_string)
-            string_handler.setLevel(logging.INFO)  # Capture INFO and above
-            logger.addHandler(string_handler)
-
-            # Also capture stdout/stderr for any print statements
-            stdout_capture = io.StringIO()
-            stderr_capture = io.StringIO()
-
-            with redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
-                # Run scheduled redemption
-                from autoshift.auto import auto_redeem_codes
-                auto_redeem_codes(interval=settings.SCHEDULE, limit=settings.LIMIT)
-
-            # Restore original handlers
-            logger.handlers.clear()
-            logger.handlers.extend(original_handlers)
-
-            # Close our temporary handler and get captured logs
-            string_handler.close()
-            log_output = log_capture_string.getvalue()
-
-            # Get captured stdout/stderr as well
-            stdout_output = stdout_capture.getvalue()
-            stderr_output = stderr_capture.getvalue()
-
-            # Send captured log output to the UI log
-            if log_output:
-                for line in log_output.split('\n'):
-                    if line.strip():
-                        self.app.call_from_thread(self.append_log, f"Log: {line.strip()}")
-
-            # Also send any stdout/stderr output
-            if stdout_output:
-                for line in stdout_output.split('\n'):
-                    if line.strip():
-                        self.app.call_from_thread(self.append_log, f"Output: {line.strip()}")
-            if stderr_output:
-                for line in stderr_output.split('\n'):
-                    if line.strip():
-                        self.app.call_from_thread(self.append_log, f"Error: {line.strip()}")
-
-            self.app.call_from_thread(self.update_status, "Scheduled redemption completed")
-        except Exception as e:
-            # Make sure to restore logger handlers even if there's an error
-            logger = logging.getLogger("autoshift")
-            original_handlers = getattr(logging.getLogger("autoshift"), 'handlers', [])[:]
-            if original_handlers:
-                logger.handlers.clear()
-                logger.handlers.extend(original_handlers)
-            self.app.call_from_thread(self.update_status, f"Error in scheduled redemption: {str(e)}")
-            self.app.call_from_thread(self.append_log, f"Error: {str(e)}")
+        """Redeem keys every `settings.SCHEDULE` minutes until the job gets cancelled."""
+        from autoshift import jobs
+        from autoshift.auto import main
+
+        job = jobs.current()
+        while True:
+            resume_at = main()
+
+            delay = timedelta(minutes=settings.SCHEDULE or 120)
+            if resume_at:
+                # wait for the redemption quota to reset
+                delay = max(resume_at - datetime.now(UTC), timedelta(0))
+            next_run = datetime.now() + delay
+            if job:
+                job.description = f"Scheduled redemption (next run at {next_run:%H:%M})"
+                job.total = None
+            self.app.call_from_thread(self.append_log, f"Next run at {next_run:%H:%M}")
+            jobs.sleep(delay.total_seconds())
 
     def _run_query_codes(self) -> None:
-        """Run the code query process in a background thread."""
-        import io
-        import logging
-        from contextlib import redirect_stdout, redirect_stderr
-
-        try:
-            # Update status before starting
-            self.app.call_from_thread(self.update_status, "Querying for new codes...")
-            self.app.call_from_thread(self.append_log, "Starting code query process...")
-
-            # Get the autoshift logger and temporarily remove RichHandler during background execution
-            logger = logging.getLogger("autoshift")
-            original_handlers = logger.handlers[:]  # Make a copy of current handlers
-
-            # Clear all handlers temporarily
-            logger.handlers.clear()
-
-            # Create a custom handler to capture log messages
-            log_capture_string = io.StringIO()
-            string_handler = logging.StreamHandler(log_capture_string)
-            string_handler.setLevel(logging.INFO)  # Capture INFO and above
-            logger.addHandler(string_handler)
-
-            # Also capture stdout/stderr for any print statements
-            stdout_capture = io.StringIO()
-            stderr_capture = io.StringIO()
-
-            with redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
-                # Run code query
-                from autoshift.auto import query
-                query()
-
-            # Restore original handlers
-            logger.handlers.clear()
-            logger.handlers.extend(original_handlers)
-
-            # Close our temporary handler and get captured logs
-            string_handler.close()
-            log_output = log_capture_string.getvalue()
-
-            # Get captured stdout/stderr as well
-            stdout_output = stdout_capture.getvalue()
-            stderr_output = stderr_capture.getvalue()
-
-            # Send captured log output to the UI log
-            if log_output:
-                for line in log_output.split('\n'):
-                    if line.strip():
-                        self.app.call_from_thread(self.append_log, f"Log: {line.strip()}")
-
-            # Also send any stdout/stderr output
-            if stdout_output:
-                for line in stdout_output.split('\n'):
-                    if line.strip():
-                        self.app.call_from_thread(self.append_log, f"Output: {line.strip()}")
-            if stderr_output:
-                for line in stderr_output.split('\n'):
-                    if line.strip():
-                        self.app.call_from_thread(self.append_log, f"Error: {line.strip()}")
-
-            self.app.call_from_thread(self.update_status, "Code query completed")
-        except Exception as e:
-            # Make sure to restore logger handlers even if there's an error
-            logger = logging.getLogger("autoshift")
-            original_handlers = getattr(logging.getLogger("autoshift"), 'handlers', [])[:]
-            if original_handlers:
-                logger.handlers.clear()
-                logger.handlers.extend(original_handlers)
-            self.app.call_from_thread(self.update_status, f"Error in code query: {str(e)}")
-            self.app.call_from_thread(self.append_log, f"Error: {str(e)}")
-
-    def _run_manual_redemption(self) -> None:
-        """Run a single manual redemption in a background thread."""
-        import io
-        import logging
-        from contextlib import redirect_stdout, redirect_stderr
-
-        try:
-            # Update status before starting
-            self.app.call_from_thread(self.update_status, "Running manual redemption...")
-            self.app.call_from_thread(self.append_log, "Starting manual redemption process...")
-
-            # Get the autoshift logger and temporarily remove RichHandler during background execution
-            logger = logging.getLogger("autoshift")
-            original_handlers = logger.handlers[:]  # Make a copy of current handlers
-
-            # Clear all handlers temporarily
-            logger.handlers.clear()
-
-            # Create a custom handler to capture log messages
-            log_capture_string = io.StringIO()
-            string_handler = logging.StreamHandler(log_capture_string)
-            string_handler.setLevel(logging.INFO)  # Capture INFO and above
-            logger.addHandler(string_handler)
-
-            # Also capture stdout/stderr for any print statements
-            stdout_capture = io.StringIO()
-            stderr_capture = io.StringIO()
-
-            with redirect_stdout(stdout_capture), redirect_stderr(stderr_capture):
-                # Run the main redemption process
-                from autoshift.auto import main
-                main()
-
-            # Restore original handlers
-            logger.handlers.clear()
-            logger.handlers.extend(original_handlers)
-
-            # Close our temporary handler and get captured logs
-            string_handler.close()
-            log_output = log_capture_string.getvalue()
-
-            # Get captured stdout/stderr as well
-            stdout_output = stdout_capture.getvalue()
-            stderr_output = stderr_capture.getvalue()
-
-            # Send captured log output to the UI log
-            if log_output:
-                for line in log_output.split('\n'):
-                    if line.strip():
-                        self.app.call_from_thread(self.append_log, f"Log: {line.strip()}")
-
-            # Also send any stdout/stderr output
-            if stdout_output:
-                for line in stdout_output.split('\n'):
-                    if line.strip():
-                        self.app.call_from_thread(self.append_log, f"Output: {line.strip()}")
-            if stderr_output:
-                for line in stderr_output.split('\n'):
-                    if line.strip():
-                        self.app.call_from_thread(self.append_log, f"Error: {line.strip()}")
-
-            self.app.call_from_thread(self.update_status, "Manual redemption completed")
-        except Exception as e:
-            # Make sure to restore logger handlers even if there's an error
-            logger = logging.getLogger("autoshift")
-            original_handlers = getattr(logging.getLogger("autoshift"), 'handlers', [])[:]
-            if original_handlers:
-                logger.handlers.clear()
-                logger.handlers.extend(original_handlers)
-            self.app.call_from_thread(self.update_status, f"Error in manual redemption: {str(e)}")
-            self.app.call_from_thread(self.append_log, f"Error: {str(e)}")
+        """Run the code query process (as a job)."""
+        from autoshift.auto import query
+        query()
 
 
 def save_settings_to_file():
@@ -813,6 +626,23 @@ class AutoSHiFtTUI(App):
     SUB_TITLE = "Automatically redeem Gearbox SHiFT codes"
     CSS_PATH = None
 
+    def __init__(self) -> None:
+        super().__init__()
+        # background jobs started from the UI (redemptions, queries, schedule)
+        self.jobs = JobManager()
+
+    async def action_quit(self) -> None:
+        """Stop running jobs before exiting."""
+        if self.jobs.running():
+            self.notify("Stopping running jobs...")
+        # don't block the event loop: jobs may still update the UI while stopping
+        await asyncio.to_thread(self.jobs.shutdown)
+        self.exit()
+
+    def on_unmount(self) -> None:
+        """Make sure no job keeps running after the UI is gone."""
+        self.jobs.cancel()
+
     def on_mount(self) -> None:
         """Called when the app is mounted."""
         # Load saved settings on startup
@@ -0,0 +1,68 @@
+#############################################################################
+#
+# Copyright (C) 2018 Fabian Schweinfurth
+# Contact: autoshift <at> derfabbi.de
+#
+# This file is part of autoshift
+#
+# autoshift is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# autoshift is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with autoshift.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+"""Watch a local `SHIFT_SOURCE` for changes
+
+Polls the file's metadata, which works the same on every platform (and on
+network shares or bind mounts, where inotify events don't arrive)."""
+
+import asyncio
+import os
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+# seconds between two checks of the file
+POLL_INTERVAL = 0.5
+
+
+def signature(path: Path) -> tuple[int, int, int] | None:
+    """Cheap fingerprint of the file's current version"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # writers replacing the file atomically change the inode, not the mtime
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+async def watch_file(path: Path, debounce: float) -> AsyncIterator[Path]:
+    """Yield `path` every time it changed and then stayed unchanged for `debounce` seconds
+
+    Debouncing makes sure a file that is still being written isn't read half-way
+    and bursts of writes only yield once."""
+    last = signature(path)
+    while True:
+        await asyncio.sleep(POLL_INTERVAL)
+        current = await asyncio.to_thread(signature, path)
+        if current == last:
+            continue
+
+        # wait for the writer to finish
+        while True:
+            await asyncio.sleep(debounce)
+            settled = await asyncio.to_thread(signature, path)
+            if settled == current:
+                break
+            current = settled
+
+        last = current
+        if current is not None:
+            yield path
@@ -36,7 +36,11 @@ def main():
     print(f"Using data directory: {data_dir}")
     
     # Determine mode based on arguments
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 1 and sys.argv[1] == 'lite':
+        # Headless mode for low-memory devices
+        from autoshift.lite import main as run_lite
+        sys.exit(run_lite(sys.argv[2:]))
+    elif len(sys.argv) > 1:
         # CLI mode with arguments
         from autoshift.auto import run
         run()
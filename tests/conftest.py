@@ -0,0 +1,48 @@
+"""Shared fixtures
+
+The settings are read from the environment when they are first used, so the
+data directory of the test session is set up before that."""
+
+import os
+import tempfile
+
+import pytest
+
+os.environ["SHIFT_DATA_DIR"] = tempfile.mkdtemp(prefix="autoshift-tests-")
+os.environ.pop("SHIFT_DB_FILE", None)
+os.environ.pop("SHIFT_COOKIE_FILE", None)
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A fresh, migrated database in `tmp_path`"""
+    from autoshift.migrations import run_migrations
+    from autoshift.storage import database
+
+    database.init(str(tmp_path / "keys.db"), timeout=30)
+    database.connect()
+    run_migrations(database)
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def shift(monkeypatch):
+    """A logged-in session talking to the fake SHiFT website of `profiling`"""
+    import time
+
+    import httpx
+
+    from autoshift import auto
+    from autoshift.profiling import FakeShift
+    from autoshift.shift import ShiftClient
+
+    client = ShiftClient()
+    client.client = httpx.Client(
+        transport=httpx.MockTransport(FakeShift()), follow_redirects=True
+    )
+    client.logged_in = True
+    monkeypatch.setattr(auto, "client", client)
+    # status polls
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    return client
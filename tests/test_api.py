@@ -0,0 +1,35 @@
+"""Control API of the daemon"""
+
+import asyncio
+import json
+from http import HTTPStatus
+
+from autoshift.api import ControlAPI
+from autoshift.daemon import Daemon
+from autoshift.models import Key
+
+CODE = "AAAAA-BBBBB-CCCCC-DDDDD-EEEEE"
+
+
+async def request(api: ControlAPI, method: str, target: str, body: bytes = b""):
+    reader = asyncio.StreamReader()
+    reader.feed_data(
+        f"{method} {target} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    reader.feed_eof()
+    return await api.dispatch(reader)
+
+
+def test_codes_are_normalized(db):
+    async def run():
+        api = ControlAPI(Daemon())
+        for code in (CODE, f" {CODE.lower()}\n"):
+            body = json.dumps([{"code": code, "platform": "steam", "game": "bl4"}])
+            await request(api, "POST", "/codes", body.encode())
+        return await request(api, "GET", f"/keys/{CODE.lower()}")
+
+    status, keys = asyncio.run(run())
+    assert status == HTTPStatus.OK
+    assert [key["code"] for key in keys] == [CODE]
+    assert Key.select().count() == 1
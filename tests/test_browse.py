@@ -0,0 +1,17 @@
+"""Browsing the key catalog (see `KeyBrowserScreen`)"""
+
+from autoshift import storage
+from autoshift.common import Game, Platform
+from autoshift.models import Account, Key
+
+
+def test_browsing_doesnt_write(db):
+    key = Key.create(
+        code="AAAAA-BBBBB-CCCCC-DDDDD-EEEEE", game=Game.bl4, platform=Platform.steam
+    )
+    storage.set_redeemed(key, "main")
+
+    assert [k.status for k in storage.browse_keys("main")] == ["redeemed"]
+    assert [k.status for k in storage.browse_keys("new")] == ["pending"]
+    assert storage.count_keys("new") == [(Game.bl4, Platform.steam, "pending", 1)]
+    assert [account.name for account in Account.select()] == ["main"]
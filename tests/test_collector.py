@@ -0,0 +1,133 @@
+"""Collecting keys from saved wiki pages (see `autoshift.collector`)"""
+
+from pathlib import Path
+
+import httpx
+import pytest
+
+from autoshift import collector
+from autoshift.collector import Fingerprint, Fingerprints, collect, fetch
+from autoshift.common import Game, Platform
+
+IGN = collector.collectors[Game.bl4][0]
+PAGE = (Path(__file__).parent / "fixtures" / "ign_bl4.html").read_bytes()
+ETAG = '"v1"'
+LAST_MODIFIED = "Sun, 19 Oct 2025 08:00:00 GMT"
+
+
+class Site:
+    """Serves `page` with validators, answers matching ones with 304"""
+
+    def __init__(self, page: bytes = PAGE, etag: str = ETAG):
+        self.page, self.etag = page, etag
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.headers.get("If-None-Match") == self.etag:
+            return httpx.Response(304)
+        headers = {"ETag": self.etag, "Last-Modified": LAST_MODIFIED}
+        return httpx.Response(200, content=self.page, headers=headers)
+
+    def client(self) -> httpx.Client:
+        return httpx.Client(transport=httpx.MockTransport(self))
+
+
+def test_parses_the_saved_page():
+    keys, fingerprint = fetch(Site().client(), IGN, Fingerprint())
+
+    assert keys is not None
+    platforms = {(key["code"], key["platform"]) for key in keys}
+    assert platforms == {
+        *(("T9RBB-WSBKZ-W3RBJ-9JT3J-RWZFR", p) for p in Platform),
+        ("JSRBT-W3TKZ-WBJB3-3T33T-B6WBS", Platform.psn),
+        ("9XCBT-WBXFR-5TRWJ-JJJ3T-HS3J5", Platform.steam),
+    }
+    assert {key["reward"] for key in keys} == {
+        "3 Golden Keys",
+        "Cosmetic Pack",
+        "1 Golden Key",
+    }
+    assert {key["game"] for key in keys} == {Game.bl4}
+    assert fingerprint == Fingerprint(ETAG, LAST_MODIFIED, IGN.digest(PAGE))
+
+
+def test_not_modified_page_is_skipped():
+    site = Site()
+    known = Fingerprint(ETAG, LAST_MODIFIED, IGN.digest(PAGE))
+
+    assert fetch(site.client(), IGN, known) == (None, known)
+    assert site.requests[0].headers["If-None-Match"] == ETAG
+    assert site.requests[0].headers["If-Modified-Since"] == LAST_MODIFIED
+
+
+def test_changes_outside_the_codes_are_skipped(monkeypatch):
+    page = PAGE.replace(b"08:12:44Z", b"09:30:00Z")
+    parsed = []
+    monkeypatch.setattr(collector.HtmlCollector, "parse", parsed.append)
+
+    keys, fingerprint = fetch(
+        Site(page, '"v2"').client(), IGN, Fingerprint(ETAG, None, IGN.digest(PAGE))
+    )
+
+    assert keys is None
+    assert not parsed
+    assert fingerprint.etag == '"v2"'
+
+
+def test_changed_codes_are_parsed_again():
+    page = PAGE.replace(b"Cosmetic Pack", b"Weapon Skin")
+
+    keys, fingerprint = fetch(
+        Site(page, '"v2"').client(), IGN, Fingerprint(ETAG, None, IGN.digest(PAGE))
+    )
+
+    assert keys is not None
+    assert "Weapon Skin" in {key["reward"] for key in keys}
+    assert fingerprint.digest == IGN.digest(page)
+
+
+def test_failed_parse_keeps_the_old_fingerprint(tmp_path, monkeypatch):
+    def broken(self, html: bytes):
+        raise ValueError("layout changed")
+
+    monkeypatch.setattr(collector.HtmlCollector, "parse", broken)
+    fingerprints = Fingerprints(tmp_path / "collectors.json")
+    fingerprints.pages[IGN.url] = Fingerprint('"v0"', None, "old digest")
+
+    keys, fingerprints = collect([Game.bl4], Site().client(), fingerprints)
+    fingerprints.save()
+
+    assert keys == []
+    saved = Fingerprints(tmp_path / "collectors.json").pages[IGN.url]
+    assert saved == Fingerprint('"v0"', None, "old digest")
+
+
+def test_collected_page_is_not_parsed_twice(tmp_path):
+    site = Site()
+    fingerprints = Fingerprints(tmp_path / "collectors.json")
+
+    keys, fingerprints = collect([Game.bl4], site.client(), fingerprints)
+    fingerprints.save()
+    again, _ = collect(
+        [Game.bl4], site.client(), Fingerprints(tmp_path / "collectors.json")
+    )
+
+    assert len(keys) == 6
+    assert again == []
+    assert [r.headers.get("If-None-Match") for r in site.requests] == [None, ETAG]
+
+
+def test_callers_client_stays_open(tmp_path):
+    client = Site().client()
+    collect([Game.bl4], client, Fingerprints(tmp_path / "collectors.json"))
+
+    assert not client.is_closed
+    assert client.get(IGN.url).status_code == 200
+
+
+@pytest.mark.parametrize("content", [b"", b"{not json"])
+def test_unreadable_fingerprints_start_over(tmp_path, content):
+    path = tmp_path / "collectors.json"
+    path.write_bytes(content)
+    assert Fingerprints(path).pages == {}
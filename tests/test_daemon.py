@@ -0,0 +1,90 @@
+"""Redemption loop of the daemon"""
+
+import asyncio
+import socket
+import threading
+from datetime import timedelta
+
+import peewee
+
+from autoshift import daemon, storage
+from autoshift.common import Game, Platform
+from autoshift.quota import get_tracker, now
+from autoshift.shift import Status
+
+GAME_MAP = {Game.bl4: {Platform.steam}}
+
+
+def test_key_hitting_the_quota_is_retried_first(db, monkeypatch):
+    storage.insert_keys(
+        dict(
+            code=f"AAAAA-BBBBB-CCCCC-DDDDD-0000{i}",
+            game=Game.bl4,
+            platform=Platform.steam,
+        )
+        for i in range(3)
+    )
+    tracker = get_tracker()
+    monkeypatch.setattr(tracker, "reset_at", None)
+    redeemed: list[int] = []
+    done = threading.Event()
+
+    def redeem(key):
+        redeemed.append(key.id)
+        if len(redeemed) == 1:
+            tracker.reset_at = now() + timedelta(seconds=0.2)
+            return Status.TRYLATER
+        if len(redeemed) == 4:
+            done.set()
+        return Status.SUCCESS
+
+    monkeypatch.setattr(daemon, "redeem", redeem)
+
+    async def run() -> list[int]:
+        d = daemon.Daemon()
+        keys = storage.claim_keys(GAME_MAP, 3)
+        d.put(keys)
+        task = asyncio.create_task(d.redeem_loop())
+        assert await asyncio.to_thread(done.wait, 5)
+        # `redeem` returned, the loop releases the claim right after
+        await asyncio.sleep(0.1)
+        # claimed until redeemed
+        assert not d.queued
+        task.cancel()
+        return [key.id for key in keys]
+
+    key_ids = asyncio.run(asyncio.wait_for(run(), timeout=10))
+    assert redeemed == [key_ids[0], *key_ids]
+
+
+def test_failing_loop_stops_the_daemon(db, monkeypatch):
+    monkeypatch.setattr(daemon, "ingest_keys", lambda: 0)
+    monkeypatch.setattr(daemon.settings, "_GAMES_PLATFORM_MAP", GAME_MAP)
+    monkeypatch.setattr(daemon.settings, "MAINTENANCE", None)
+    monkeypatch.setattr(daemon.settings, "WATCH", None)
+    with socket.socket() as taken:
+        taken.bind(("127.0.0.1", 0))
+        taken.listen()
+        # the control API can't bind
+        monkeypatch.setattr(daemon.settings, "API_HOST", "127.0.0.1")
+        monkeypatch.setattr(daemon.settings, "API_PORT", taken.getsockname()[1])
+
+        d = daemon.Daemon()
+        asyncio.run(asyncio.wait_for(d.run(), timeout=10))
+
+    assert d.stopped.is_set()
+    assert [task.get_name() for task in d.tasks if task.cancelled()] == [
+        "ingest",
+        "redeem",
+        "heartbeat",
+    ]
+
+
+def test_claim_errors_dont_end_the_ingestion(db, monkeypatch):
+    def locked(*args, **kwargs):
+        raise peewee.OperationalError("database is locked")
+
+    monkeypatch.setattr(daemon, "ingest_keys", lambda: 0)
+    monkeypatch.setattr(storage, "claim_keys", locked)
+
+    assert asyncio.run(daemon.Daemon().ingest()) == 0
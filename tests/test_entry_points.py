@@ -0,0 +1,17 @@
+"""Console scripts declared in pyproject.toml"""
+
+import tomllib
+from importlib.metadata import EntryPoint
+from pathlib import Path
+
+import pytest
+
+SCRIPTS = tomllib.loads((Path(__file__).parent.parent / "pyproject.toml").read_text())[
+    "project"
+]["scripts"]
+
+
+@pytest.mark.parametrize("name", SCRIPTS)
+def test_entry_point_loads(name):
+    entry_point = EntryPoint(name, SCRIPTS[name], "console_scripts")
+    assert callable(entry_point.load())
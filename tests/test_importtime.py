@@ -0,0 +1,21 @@
+"""Startup time of the CLI (see `autoshift.importtime`)"""
+
+from autoshift.importtime import BUDGET, DEFERRED, measure
+
+MODULE = "autoshift.auto"
+
+
+def test_cli_imports_within_budget():
+    runs = [measure(MODULE) for _ in range(5)]
+    best = min(runs, key=lambda times: times[MODULE][1])
+    assert best[MODULE][1] <= BUDGET
+
+
+def test_heavy_dependencies_are_deferred():
+    times = measure(MODULE)
+    assert [name for name in DEFERRED if name in times] == []
+
+
+def test_settings_are_read_on_first_use():
+    times = measure("autoshift.common")
+    assert "autoshift.config" not in times
@@ -0,0 +1,55 @@
+"""Journaled submissions in a long-lived process (see `storage.set_submitted`)"""
+
+import pytest
+
+from autoshift import auto, storage
+from autoshift.common import Game, Platform, settings
+from autoshift.models import Key
+from autoshift.quota import get_tracker
+from autoshift.shift import ShiftClient
+
+# `FakeShift` takes the game from the code
+CODE = "bl4-00001-0123456789"
+GAME_MAP = {Game.bl4: {Platform.steam}}
+
+
+@pytest.fixture
+def key(db) -> Key:
+    return Key.create(code=CODE, game=Game.bl4, platform=Platform.steam)
+
+
+def test_crash_while_submitting_leaves_the_journal(key, shift, monkeypatch):
+    def lost(self, data):
+        raise ConnectionError("connection reset")
+
+    monkeypatch.setattr(ShiftClient, "_ShiftClient__redeem_form", lost)
+
+    with pytest.raises(ConnectionError):
+        shift.redeem(key)
+
+    assert storage.get_unresolved() == [key]
+
+
+def test_crash_with_a_known_outcome_resolves_the_journal(key, shift, monkeypatch):
+    def broken(self, key, status, account=None):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(ShiftClient, "_ShiftClient__store_status", broken)
+
+    with pytest.raises(KeyboardInterrupt):
+        shift.redeem(key)
+
+    assert storage.get_unresolved() == []
+
+
+def test_logged_in_session_verifies_unresolved_keys(key, shift, monkeypatch):
+    monkeypatch.setattr(settings, "_GAMES_PLATFORM_MAP", GAME_MAP)
+    monkeypatch.setattr(get_tracker(), "reset_at", None)
+    storage.set_submitted(key)
+    assert shift.logged_in
+
+    auto.redeem_all()
+
+    assert storage.get_unresolved() == []
+    # verified, claimed again and redeemed in the same cycle
+    assert storage.is_redeemed(key)
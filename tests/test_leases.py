@@ -0,0 +1,90 @@
+"""Workers sharing one database never claim the same key"""
+
+import multiprocessing
+
+from autoshift.common import Game, Platform, settings
+
+GAME_MAP = {Game.bl4: {Platform.steam, Platform.epic}}
+NUM_KEYS = 400
+NUM_WORKERS = 6
+
+
+def insert(num_keys: int) -> list[int]:
+    from autoshift.models import Key
+    from autoshift.storage import insert_keys
+
+    insert_keys(
+        dict(code=f"AAAAA-BBBBB-CCCCC-DDDDD-{i:05}", game=Game.bl4, platform=platform)
+        for i in range(num_keys // 2)
+        for platform in (Platform.steam, Platform.epic)
+    )
+    return [key.id for key in Key.select(Key.id)]
+
+
+def work(db_file: str, worker: str, start) -> list[int]:
+    """Claim and redeem keys until none are left. Returns the ids of all claimed keys"""
+    from autoshift import storage
+
+    storage.database.init(db_file, timeout=30)
+    storage.database.connect()
+    start.wait()
+    claimed = []
+    while batch := storage.claim_keys(GAME_MAP, 7, worker=worker):
+        claimed += [key.id for key in batch]
+        for key in batch:
+            storage.set_redeemed(key)
+        storage.release_claims(batch, worker=worker)
+    storage.database.close()
+    return claimed
+
+
+def test_concurrent_claims_are_disjoint(db, tmp_path):
+    key_ids = insert(NUM_KEYS)
+    db.close()
+
+    ctx = multiprocessing.get_context("spawn")
+    start = ctx.Manager().Event()
+    with ctx.Pool(NUM_WORKERS) as pool:
+        results = [
+            pool.apply_async(work, (str(tmp_path / "keys.db"), f"worker-{i}", start))
+            for i in range(NUM_WORKERS)
+        ]
+        start.set()
+        claims = [result.get(timeout=120) for result in results]
+
+    claimed = [key_id for worker in claims for key_id in worker]
+    assert len(claimed) == len(set(claimed)), "a key was claimed twice"
+    assert sorted(claimed) == sorted(key_ids)
+    # they actually competed for the keys
+    assert sum(map(bool, claims)) > 1
+
+
+def test_claims_block_other_workers_until_released(db):
+    from autoshift import storage
+
+    insert(10)
+    first = storage.claim_keys(GAME_MAP, 4, worker="a")
+    assert len(first) == 4
+    second = storage.claim_keys(GAME_MAP, 100, worker="b")
+    assert {key.id for key in first}.isdisjoint(key.id for key in second)
+    assert storage.claim_keys(GAME_MAP, 100, worker="c") == []
+
+    storage.release_claims(first[:2], worker="a")
+    assert [key.id for key in storage.claim_keys(GAME_MAP, 100, worker="c")] == [
+        key.id for key in first[:2]
+    ]
+
+
+def test_expired_leases_can_be_claimed(db, monkeypatch):
+    from autoshift import storage
+
+    first, second = insert(2)
+    # leases are stored with a resolution of one second
+    monkeypatch.setattr(settings, "LEASE", -5)
+    assert [key.id for key in storage.claim_keys(GAME_MAP, 1, worker="a")] == [first]
+    assert [key.id for key in storage.claim_keys(GAME_MAP, 1, worker="b")] == [first]
+
+    # the heartbeat keeps it
+    monkeypatch.setattr(settings, "LEASE", 600)
+    storage.renew_claims(worker="b")
+    assert [key.id for key in storage.claim_keys(GAME_MAP, 2, worker="c")] == [second]
@@ -0,0 +1,75 @@
+"""Resident memory of the low-memory runner (`autoshift.lite`)"""
+
+import os
+import signal
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from autoshift.lite import RSS_BUDGET, Runner
+
+pytestmark = pytest.mark.skipif(
+    not Path("/proc/self/status").exists(), reason="needs procfs"
+)
+
+
+def resident(pid: int) -> float:
+    """Current resident set size of process `pid` (MiB)"""
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) / 1024
+    raise AssertionError(f"no VmRSS for {pid}")
+
+
+def test_check_stays_within_budget():
+    proc = subprocess.run(
+        [sys.executable, "-m", "autoshift.lite", "--check"],
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode == 0, proc.stderr
+
+
+def test_runner_stays_within_budget_between_runs():
+    # the run fails right away on the unknown option, without talking to SHiFT
+    env = {**os.environ, "SHIFT_SCHEDULE": "60", "SHIFT_MAINTENANCE": "None"}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "autoshift.lite", "--no-such-option"],
+        env=env,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert proc.stderr
+        output = []
+        for line in proc.stderr:
+            output.append(line)
+            if "Next run in" in line:
+                break
+        else:
+            pytest.fail("".join(output))
+
+        # sleeping until the next run
+        assert "Run failed with exit code 2" in "".join(output)
+        assert resident(proc.pid) <= RSS_BUDGET
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(10)
+
+
+def test_maintenance_runs_after_a_failed_run(monkeypatch):
+    runner = Runner([], schedule=None, maintenance=24)
+    calls: list[tuple[str, ...]] = []
+
+    def run_cli(*args: str) -> int:
+        calls.append(args)
+        return 1
+
+    monkeypatch.setattr(runner, "run_cli", run_cli)
+    runner.run_once()
+    runner.run_once()
+
+    # once per `maintenance` hours
+    assert calls == [("schedule",), ("maintenance",), ("schedule",)]
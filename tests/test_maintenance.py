@@ -0,0 +1,32 @@
+"""Archiving cold keys (see `autoshift.maintenance`)"""
+
+from datetime import UTC, datetime, timedelta
+
+from autoshift import storage
+from autoshift.common import Game, Platform
+from autoshift.maintenance import archive_keys
+from autoshift.models import ArchivedKey, Key
+
+OLD = datetime.now(UTC) - timedelta(days=60)
+ROW = dict(code="AAAAA-BBBBB-CCCCC-DDDDD-EEEEE", game=Game.bl4, platform=Platform.steam)
+
+
+def test_only_expired_keys_are_archived(db):
+    redeemed = Key.create(**ROW, added=OLD)
+    storage.set_redeemed(redeemed, "first")
+    Key.create(**{**ROW, "platform": Platform.epic}, added=OLD, expired=True)
+    Key.create(**{**ROW, "platform": Platform.psn}, added=OLD, expires=OLD)
+
+    assert archive_keys(30) == 2
+    # an account added later still gets it
+    assert [key.id for key in Key.select()] == [redeemed.id]
+
+
+def test_valid_archived_keys_are_restored(db):
+    now = datetime.now(UTC)
+    ArchivedKey.create(**ROW, added=OLD, archived=now)
+    ArchivedKey.create(**{**ROW, "platform": Platform.epic}, expired=True, archived=now)
+
+    assert storage.insert_keys([ROW, {**ROW, "platform": Platform.epic}]) == 1
+    assert [key.platform for key in Key.select()] == [Platform.steam]
+    assert [key.platform for key in ArchivedKey.select()] == [Platform.epic]
@@ -0,0 +1,27 @@
+"""Redeeming a single code entered in the TUI"""
+
+from autoshift import storage
+from autoshift.common import Game, Platform
+from autoshift.manual_code_screen import redeem_single_code
+from autoshift.models import Key, Redemption
+
+# `FakeShift` takes the game from the code
+CODE = "bl4-00001-0123456789"
+
+
+def test_new_code_is_stored_and_redeemed(db, shift):
+    assert redeem_single_code(CODE, "steam") == "Redeemed {key.reward}"
+
+    key = Key.get(Key.code == CODE)
+    assert (key.game, key.platform) == (Game.UNKNOWN, Platform.steam)
+    assert storage.is_redeemed(key)
+    assert not storage.get_unresolved()
+    assert Redemption.select().count() == 1
+
+
+def test_known_code_is_not_redeemed_twice(db, shift):
+    storage.insert_keys([dict(code=CODE, game=Game.bl4, platform=Platform.epic)])
+    redeem_single_code(CODE, "epic")
+
+    assert redeem_single_code(CODE, "epic") == "You already redeemed that code."
+    assert Key.select().count() == 1
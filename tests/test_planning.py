@@ -0,0 +1,77 @@
+"""Predicted cycles of `autoshift plan` against the actual redemption loop"""
+
+from collections import Counter
+
+from autoshift import auto, storage
+from autoshift.common import Game, Platform, settings
+from autoshift.models import Key
+from autoshift.planning import plan_cycle
+from autoshift.quota import QuotaTracker, get_tracker
+from autoshift.shift import Status
+
+GAME_MAP = {Game.bl4: {Platform.steam}}
+LIMIT = 20
+
+
+def insert(num: int) -> list[Key]:
+    storage.insert_keys(
+        dict(
+            code=f"AAAAA-BBBBB-CCCCC-DDDDD-{i:05}", game=Game.bl4, platform=Platform.steam
+        )
+        for i in range(num)
+    )
+    return storage.get_keys(GAME_MAP)
+
+
+def test_plan_leaves_keys_over_the_limit_for_the_next_cycle(db, tmp_path):
+    keys = insert(LIMIT + 5)
+    plan = plan_cycle(keys, QuotaTracker(tmp_path / "quota.json"), LIMIT)
+
+    assert [key.id for key in plan.keys] == [key.id for key in keys[:LIMIT]]
+    assert len(plan.over_limit) == 5
+    assert plan.redeemed == LIMIT
+    # after every `BURST` keys
+    assert plan.pauses == 1
+
+
+def test_redeem_all_matches_the_plan(db, tmp_path, monkeypatch):
+    keys = insert(LIMIT + 5)
+    monkeypatch.setattr(settings, "LIMIT", LIMIT)
+    monkeypatch.setattr(settings, "_GAMES_PLATFORM_MAP", GAME_MAP)
+    monkeypatch.setattr(get_tracker(), "reset_at", None)
+    pauses: list[float] = []
+    monkeypatch.setattr(
+        auto.metrics, "sleep", lambda seconds, reason: pauses.append(seconds)
+    )
+    redeemed: list[int] = []
+
+    def redeem(key: Key) -> Status:
+        redeemed.append(key.id)
+        return Status.SUCCESS
+
+    monkeypatch.setattr(auto, "redeem", redeem)
+    plan = plan_cycle(keys, QuotaTracker(tmp_path / "quota.json"), LIMIT)
+    stats: Counter[str] = Counter()
+
+    assert auto.redeem_all(stats) is None
+    assert redeemed == [key.id for key in plan.keys]
+    assert stats == {"SUCCESS": LIMIT}
+    assert len(pauses) == plan.pauses
+    # nothing stays claimed for the next cycle
+    assert len(storage.claim_keys(GAME_MAP, LIMIT + 5)) == LIMIT + 5
+
+
+def test_given_keys_are_redeemed_whatever_the_limit(db, monkeypatch):
+    keys = insert(5)
+    monkeypatch.setattr(settings, "LIMIT", 2)
+    monkeypatch.setattr(get_tracker(), "reset_at", None)
+    redeemed: list[int] = []
+
+    def redeem(key: Key) -> Status:
+        redeemed.append(key.id)
+        return Status.SUCCESS
+
+    monkeypatch.setattr(auto, "redeem", redeem)
+    auto.redeem_all(keys=keys)
+
+    assert redeemed == [key.id for key in keys]
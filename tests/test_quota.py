@@ -0,0 +1,45 @@
+"""Persisted state of the quota tracker"""
+
+import json
+import threading
+from datetime import timedelta
+
+from autoshift.quota import WINDOW, QuotaTracker, now
+from autoshift.shift import Status
+
+
+def test_state_survives_a_reload(tmp_path):
+    tracker = QuotaTracker(tmp_path / "quota.json")
+    tracker.record(Status.SUCCESS)
+    tracker.record(Status.SUCCESS)
+    tracker.record(Status.TRYLATER)
+
+    reloaded = QuotaTracker(tmp_path / "quota.json")
+    assert reloaded.limit == 2
+    assert reloaded.redemptions == tracker.redemptions
+    blocked_until = reloaded.blocked_until()
+    assert blocked_until and blocked_until > now() + WINDOW - timedelta(minutes=1)
+
+
+def test_concurrent_writers_never_leave_a_partial_file(tmp_path):
+    path = tmp_path / "quota.json"
+    QuotaTracker(path).save()
+    stop = threading.Event()
+
+    def write():
+        tracker = QuotaTracker(path)
+        tracker.redemptions = [now()] * 500
+        while not stop.is_set():
+            tracker.save()
+
+    writers = [threading.Thread(target=write) for _ in range(4)]
+    for writer in writers:
+        writer.start()
+    try:
+        for _ in range(500):
+            json.loads(path.read_text())
+    finally:
+        stop.set()
+        for writer in writers:
+            writer.join()
+    assert [p.name for p in tmp_path.iterdir()] == ["quota.json"]
@@ -0,0 +1,56 @@
+"""Reading codes with `redeem --from`, e.g. the output of `extract`"""
+
+from typer.testing import CliRunner
+
+from autoshift import auto
+from autoshift.common import Game, Platform
+from autoshift.models import Key
+
+CHAT = """\
+[12:01] someone: no idea what this one is for 11111-22222-33333-44444-55555
+[12:02] someone: Borderlands 4 code for steam: aaaaa-bbbbb-ccccc-ddddd-eeeee
+[12:03] someone: bl3 universal CCCCC-DDDDD-EEEEE-FFFFF-GGGGG
+"""
+
+
+def extracted(tmp_path) -> list[str]:
+    path = tmp_path / "chat.txt"
+    path.write_text(CHAT)
+    result = CliRunner().invoke(auto.app, ["extract", str(path)])
+    assert result.exit_code == 0, result.output
+    return result.output.splitlines()
+
+
+def test_extract_output_keeps_game_and_platform(tmp_path):
+    codes, duplicates = auto.read_codes(extracted(tmp_path), Platform.epic)
+
+    assert duplicates == 0
+    assert codes == {
+        ("AAAAA-BBBBB-CCCCC-DDDDD-EEEEE", Platform.steam): Game.bl4,
+        **{("CCCCC-DDDDD-EEEEE-FFFFF-GGGGG", p): Game.bl3 for p in Platform},
+        ("11111-22222-33333-44444-55555", Platform.epic): None,
+    }
+
+
+def test_new_codes_are_stored_for_their_game(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(auto, "redeem_all", lambda stats, keys: None)
+    auto.redeem_codes(extracted(tmp_path), Platform.epic)
+
+    games = {(key.code, key.platform): key.game for key in Key.select()}
+    assert games[("AAAAA-BBBBB-CCCCC-DDDDD-EEEEE", Platform.steam)] == Game.bl4
+    assert games[("CCCCC-DDDDD-EEEEE-FFFFF-GGGGG", Platform.psn)] == Game.bl3
+    assert games[("11111-22222-33333-44444-55555", Platform.epic)] == Game.UNKNOWN
+
+
+def test_stored_key_of_the_same_game_is_preferred(db, monkeypatch):
+    code = "AAAAA-BBBBB-CCCCC-DDDDD-EEEEE"
+    for game in (Game.UNKNOWN, Game.bl3, Game.bl4):
+        Key.create(code=code, game=game, platform=Platform.steam)
+    redeemed: list[Key] = []
+    monkeypatch.setattr(auto, "redeem_all", lambda stats, keys: redeemed.extend(keys))
+
+    auto.redeem_codes([f"{code}\tbl3\tsteam"], None)
+    auto.redeem_codes([f"{code}\t\tsteam"], None)
+
+    assert [key.game for key in redeemed] == [Game.bl3, Game.bl4]
+    assert Key.select().count() == 3
@@ -0,0 +1,39 @@
+"""Account profiles of `autoshift supervise`"""
+
+import json
+
+import pytest
+from pydantic import ValidationError
+from typer.testing import CliRunner
+
+from autoshift import auto
+from autoshift.common import Game, Platform
+from autoshift.supervisor import load_profiles
+
+PROFILE = {"account": "main", "cookie_file": "data/.cookies.main.save"}
+
+
+def write(tmp_path, *profiles: dict):
+    path = tmp_path / "profiles.json"
+    path.write_text(json.dumps(profiles))
+    return path
+
+
+def test_profile_is_loaded(tmp_path):
+    path = write(tmp_path, {**PROFILE, "games": {"bl4": "steam,psn"}})
+    [profile] = load_profiles(path)
+    assert profile.games == {Game.bl4: [Platform.steam, Platform.psn]}
+
+
+@pytest.mark.parametrize("games", [None, {}, {"bl4": []}, {"bl4": ""}])
+def test_profile_without_games_is_rejected(tmp_path, games):
+    profile = PROFILE if games is None else {**PROFILE, "games": games}
+    with pytest.raises(ValidationError, match="games"):
+        load_profiles(write(tmp_path, profile))
+
+
+def test_cli_reports_invalid_profiles(tmp_path):
+    path = write(tmp_path, {**PROFILE, "games": {}})
+    result = CliRunner().invoke(auto.app, ["supervise", str(path)])
+    assert result.exit_code == 2
+    assert "games" in result.output
@@ -0,0 +1,35 @@
+"""Background jobs started from the TUI"""
+
+import asyncio
+import threading
+
+from autoshift.tui import REDEEM_JOB, AutoSHiFtTUI, MainScreen
+
+
+def test_redemptions_never_run_in_parallel(db, monkeypatch):
+    release = threading.Event()
+    started: list[str] = []
+
+    def redeem(self):
+        started.append("redeem")
+        release.wait(5)
+
+    monkeypatch.setattr(MainScreen, "_run_redemption_scheduled", redeem)
+    monkeypatch.setattr(MainScreen, "_run_redemption_once", redeem)
+
+    async def run():
+        app = AutoSHiFtTUI()
+        async with app.run_test() as pilot:
+            screen = app.screen
+            assert isinstance(screen, MainScreen)
+            screen.run_scheduled()
+            await pilot.pause()
+            screen.action_run()
+            screen.action_manual_run()
+            await pilot.pause()
+            running = [job.kind for job in app.jobs.running()]
+            release.set()
+            return running
+
+    assert asyncio.run(run()) == [REDEEM_JOB]
+    assert started == ["redeem"]